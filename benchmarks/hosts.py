@@ -0,0 +1,362 @@
+"""
+Multi-host benchmark for the Nyun CLI.
+
+Runs jobs across a pool of docker hosts without Docker: every host is a stand-in Docker daemon
+serving the part of the Docker API the CLI uses over its own Unix socket. The stand-ins keep
+volumes and container files in a temporary directory, and run each job by sleeping and writing
+a file under the script's OUTPUT_PATH. The same jobs are run on one host and on the whole pool;
+the benchmark reports the wall time of each, how the jobs were spread, and fails when the pool
+is not faster by the expected factor, or the outputs of the jobs did not come back.
+
+Usage:
+    python benchmarks/hosts.py                       # 4 hosts, 16 jobs of 0.25s
+    python benchmarks/hosts.py --hosts 2 --jobs 8
+"""
+
+import argparse
+import base64
+import io
+import json
+import os
+import shlex
+import socketserver
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(ROOT))
+
+# the pool must beat a single host by at least this fraction of its number of hosts; the hosts
+# of the pool are synced for the first time during its run, and the stand-ins share this process
+MIN_EFFICIENCY = 0.5
+
+
+class StandInContainer:
+    def __init__(self, config: dict, root: Path):
+        self.config = config
+        self.root = root / "rootfs"
+        self.root.mkdir(parents=True)
+        self.logs = b""
+        self.exit_code = None
+        self.done = threading.Event()
+
+
+class StandInDaemon:
+    # the state of a stand-in docker daemon: its images, volumes and containers
+
+    def __init__(self, root: Path, job_seconds: float):
+        self.root = root
+        self.job_seconds = job_seconds
+        self.images = set()
+        self.volumes = set()
+        self.containers = {}
+        self.jobs = 0
+        self.lock = threading.Lock()
+
+    def get_host_path(self, container: StandInContainer, path: str) -> Path:
+        # the file behind a path in a container: in a volume mounted over it, or in the container
+        path = os.path.normpath("/" + path.lstrip("/"))
+        mounts = container.config.get("HostConfig", {}).get("Mounts") or []
+        for mount in sorted(mounts, key=lambda mount: -len(mount["Target"])):
+            target = mount["Target"]
+            if path == target or path.startswith(target + "/"):
+                return self.root / "volumes" / mount["Source"] / path[len(target) :].lstrip("/")
+        return container.root / path.lstrip("/")
+
+    def run(self, container: StandInContainer):
+        entrypoint = container.config.get("Entrypoint") or []
+        command = container.config.get("Cmd") or []
+        if entrypoint == ["sh"]:
+            # the delete step of a volume sync
+            plan = self.get_host_path(container, "/plan/delete")
+            if plan.exists():
+                for path in filter(None, plan.read_bytes().split(b"\0")):
+                    self.get_host_path(container, "/dst/" + path.decode()).unlink(missing_ok=True)
+        elif "--yaml_path" in command:
+            import yaml
+
+            script = self.get_host_path(container, command[command.index("--yaml_path") + 1])
+            data = yaml.safe_load(script.read_text())
+            time.sleep(self.job_seconds)
+            output = self.get_host_path(container, data["OUTPUT_PATH"]) / "model.bin"
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_bytes(os.urandom(1024))
+            container.logs = f"trained {script.name}\n".encode()
+            with self.lock:
+                self.jobs += 1
+        container.exit_code = 0
+        container.done.set()
+
+
+class StandInServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def get_handler(daemon: StandInDaemon):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def address_string(self):
+            return "stand-in"
+
+        def read_body(self) -> bytes:
+            if self.headers.get("Transfer-Encoding") == "chunked":
+                body = b""
+                while True:
+                    size = int(self.rfile.readline().strip(), 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        return body
+                    body += self.rfile.read(size)
+                    self.rfile.readline()
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def respond(self, status: int, body=b"", headers=None, close=False):
+            if isinstance(body, (dict, list)):
+                body = json.dumps(body).encode()
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            if close:
+                self.send_header("Connection", "close")
+                self.close_connection = True
+            else:
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def handle_request(self, method: str):
+            url = urlparse(self.path)
+            path = "/" + url.path.split("/", 2)[-1] if url.path.startswith("/v1.") else url.path
+            query = parse_qs(url.query)
+            body = self.read_body()
+            parts = [unquote(part) for part in path.strip("/").split("/")]
+
+            if parts == ["_ping"]:
+                return self.respond(200, b"OK")
+            if parts == ["version"]:
+                return self.respond(200, {"ApiVersion": "1.41", "Version": "stand-in"})
+            if parts == ["auth"]:
+                return self.respond(200, {"Status": "Login Succeeded"})
+            if parts[0] == "images" and parts[-1] == "json" and len(parts) > 2:
+                name = "/".join(parts[1:-1])
+                if name in daemon.images:
+                    return self.respond(200, {"Id": f"sha256:{abs(hash(name)):064x}"[:71], "RepoTags": [name]})
+                return self.respond(404, {"message": f"No such image: {name}"})
+            if parts == ["images", "create"]:
+                daemon.images.add(f"{query['fromImage'][0]}:{query['tag'][0]}")
+                return self.respond(200, b'{"status": "Pull complete", "id": "stand-in"}\n')
+            if parts[0] == "volumes" and method == "GET" and len(parts) == 2:
+                if parts[1] in daemon.volumes:
+                    return self.respond(200, {"Name": parts[1]})
+                return self.respond(404, {"message": "no such volume"})
+            if parts == ["volumes", "create"]:
+                name = json.loads(body)["Name"]
+                daemon.volumes.add(name)
+                (daemon.root / "volumes" / name).mkdir(parents=True, exist_ok=True)
+                return self.respond(201, {"Name": name})
+            if parts == ["containers", "json"]:
+                return self.respond(200, [])
+            if parts == ["containers", "create"]:
+                container_id = uuid.uuid4().hex * 2
+                config = json.loads(body)
+                for mount in config.get("HostConfig", {}).get("Mounts") or []:
+                    if mount.get("Type") == "volume" and mount["Source"] not in daemon.volumes:
+                        daemon.volumes.add(mount["Source"])
+                        (daemon.root / "volumes" / mount["Source"]).mkdir(parents=True, exist_ok=True)
+                daemon.containers[container_id] = StandInContainer(
+                    config, daemon.root / "containers" / container_id
+                )
+                return self.respond(201, {"Id": container_id, "Warnings": []})
+
+            container = daemon.containers.get(parts[1]) if len(parts) > 1 else None
+            if parts[0] != "containers" or container is None:
+                return self.respond(404, {"message": f"not supported: {method} {path}"})
+            action = parts[2] if len(parts) > 2 else None
+            if action == "json":
+                running = not container.done.is_set()
+                return self.respond(
+                    200,
+                    {
+                        "Id": parts[1],
+                        "Name": f"/{parts[1][:12]}",
+                        "Config": container.config,
+                        "HostConfig": container.config.get("HostConfig", {}),
+                        "State": {"Status": "running" if running else "exited", "ExitCode": container.exit_code or 0},
+                    },
+                )
+            if action == "archive" and method == "PUT":
+                with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+                    for member in tar.getmembers():
+                        destination = daemon.get_host_path(
+                            container, f"{query['path'][0]}/{member.name}"
+                        )
+                        if member.isdir():
+                            destination.mkdir(parents=True, exist_ok=True)
+                        elif member.isfile():
+                            destination.parent.mkdir(parents=True, exist_ok=True)
+                            destination.write_bytes(tar.extractfile(member).read())
+                            os.utime(destination, (member.mtime, member.mtime))
+                return self.respond(200)
+            if action == "archive" and method == "GET":
+                source = daemon.get_host_path(container, query["path"][0])
+                if not source.exists():
+                    return self.respond(404, {"message": "no such file"})
+                buffer = io.BytesIO()
+                with tarfile.open(fileobj=buffer, mode="w") as tar:
+                    tar.add(source, arcname=source.name)
+                stat = {"name": source.name, "size": source.stat().st_size, "mode": 0, "mtime": "", "linkTarget": ""}
+                header = base64.b64encode(json.dumps(stat).encode()).decode()
+                return self.respond(
+                    200,
+                    buffer.getvalue(),
+                    headers={"X-Docker-Container-Path-Stat": header},
+                )
+            if action == "start":
+                threading.Thread(target=daemon.run, args=(container,), daemon=True).start()
+                return self.respond(204)
+            if action == "wait":
+                container.done.wait()
+                return self.respond(200, {"StatusCode": container.exit_code})
+            if action == "logs":
+                container.done.wait()
+                frame = b"\x01\x00\x00\x00" + len(container.logs).to_bytes(4, "big")
+                # logs are read from the raw socket until it is closed
+                return self.respond(200, frame + container.logs, close=True)
+            if method == "DELETE":
+                daemon.containers.pop(parts[1], None)
+                return self.respond(204)
+            return self.respond(404, {"message": f"not supported: {method} {path}"})
+
+        def do_GET(self):
+            self.handle_request("GET")
+
+        def do_POST(self):
+            self.handle_request("POST")
+
+        def do_PUT(self):
+            self.handle_request("PUT")
+
+        def do_DELETE(self):
+            self.handle_request("DELETE")
+
+    return Handler
+
+
+def start_daemon(root: Path, job_seconds: float) -> "tuple[StandInDaemon, str]":
+    # start a stand-in daemon, and return it with its docker host URL
+    root.mkdir(parents=True)
+    daemon = StandInDaemon(root, job_seconds)
+    socket_path = root / "docker.sock"
+    server = StandInServer(str(socket_path), get_handler(daemon))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return daemon, f"unix://{socket_path}"
+
+
+def run_jobs(pool: "HostPool", scripts, workspace, extension) -> "tuple[float, Counter]":
+    # run the scripts on the pool, as many at once as it has job slots
+    placements = Counter()
+
+    def job(script: Path) -> int:
+        with pool.acquire() as host:
+            placements[host.name] += 1
+            return host.execute(script, workspace, extension.resolve(script))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(pool.get_slots()) as executor:
+        exit_codes = list(executor.map(job, scripts))
+    if any(exit_codes):
+        raise RuntimeError(f"Jobs failed with exit codes {exit_codes}")
+    return time.perf_counter() - start, placements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--hosts", type=int, default=4, help="Number of stand-in hosts.")
+    parser.add_argument("--jobs", type=int, default=16, help="Number of jobs.")
+    parser.add_argument(
+        "--job-seconds", type=float, default=0.25, help="Duration of each job."
+    )
+    options = parser.parse_args()
+
+    from zero.core.constants import WorkspaceExtension
+    from zero.core.hosts import DockerHost, HostPool
+    from zero.core.workspace import Workspace, get_extension
+
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="nyun-hosts-") as temp_dir:
+        temp_dir = Path(temp_dir)
+        workspace_dir = temp_dir / "workspace"
+        custom_data = workspace_dir / "custom_data"
+        custom_data.mkdir(parents=True)
+        (custom_data / "train.csv").write_bytes(os.urandom(64 * 1024))
+        workspace = Workspace(workspace_dir, custom_data, WorkspaceExtension.ALL)
+        extension = get_extension(dict(workspace.workspace_spec.extensions))
+        meta = next(iter(extension.registry))
+
+        scripts = []
+        for number in range(options.jobs):
+            script = workspace_dir / f"job-{number:03d}.yaml"
+            script.write_text(
+                f"ALGORITHM: {meta.algorithm}\nPLATFORM: {meta.platforms[0]}\n"
+                f"OUTPUT_PATH: /user_data/outputs/job-{number:03d}\n"
+            )
+            scripts.append(script)
+
+        daemons = [
+            start_daemon(temp_dir / f"host-{number}", options.job_seconds)
+            for number in range(options.hosts)
+        ]
+
+        def get_pool(count: int) -> HostPool:
+            pool = HostPool(
+                [DockerHost(f"host-{number}", daemons[number][1]) for number in range(count)]
+            )
+            errors = pool.check()
+            if errors:
+                raise RuntimeError(f"Stand-in hosts are not reachable: {errors}")
+            return pool
+
+        single, _ = run_jobs(get_pool(1), scripts, workspace, extension)
+        pooled, placements = run_jobs(get_pool(options.hosts), scripts, workspace, extension)
+
+        speedup = single / pooled
+        print(f"{'hosts':<10}{'wall time (s)':>16}")
+        print(f"{1:<10}{single:>16.3f}")
+        print(f"{options.hosts:<10}{pooled:>16.3f}")
+        print(f"speedup {speedup:.2f}x, jobs per host: {dict(sorted(placements.items()))}")
+
+        if speedup < MIN_EFFICIENCY * options.hosts:
+            failures.append(
+                f"{options.hosts} hosts were {speedup:.2f}x faster than one, expected at least {MIN_EFFICIENCY * options.hosts:.2f}x"
+            )
+        missing = [
+            script.name
+            for script in scripts
+            if not (workspace_dir / "outputs" / script.stem / "model.bin").exists()
+        ]
+        if missing:
+            failures.append(f"The outputs of {len(missing)} job(s) did not come back: {missing[:3]}")
+        if sum(daemon.jobs for daemon, _ in daemons) != 2 * options.jobs:
+            failures.append("The stand-in hosts did not run every job twice.")
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
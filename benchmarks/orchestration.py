@@ -0,0 +1,260 @@
+"""
+Orchestration benchmark for the Nyun CLI.
+
+Measures the CLI's own overhead around Docker, without a Docker daemon or GPU: a fake Docker
+client is swapped in for `get_docker_client` (and the asyncio engine is disabled), and image
+manifests come from a fake registry. Each benchmark reports the median time per operation,
+and fails when it is slower than its stored baseline by more than the tolerance. Baselines are
+stored in orchestration_baselines.json next to this file.
+
+Usage:
+    python benchmarks/orchestration.py            # check against the baselines
+    python benchmarks/orchestration.py --update   # re-measure and rewrite the baselines
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINES = Path(__file__).resolve().parent / "orchestration_baselines.json"
+
+sys.path.insert(0, str(ROOT))
+
+# a benchmark fails when its median exceeds the baseline by this factor
+TOLERANCE = 1.5
+
+# images pulled by the pull orchestration benchmark
+PULL_IMAGES = 8
+
+
+class FakeImage:
+    def __init__(self, reference: str):
+        self.tags = [reference]
+        self.id = f"sha256:{abs(hash(reference)):064x}"[:71]
+        self.attrs = {"RepoDigests": [f"{reference.split(':')[0]}@{self.id}"]}
+
+
+class FakeImages:
+    def __init__(self):
+        self.present = set()
+
+    def list(self, *args, **kwargs):
+        return [FakeImage(reference) for reference in self.present]
+
+    def get(self, reference: str):
+        return FakeImage(reference)
+
+
+class FakeContainer:
+    ids = itertools.count()
+
+    def __init__(self):
+        self.id = f"{next(self.ids):064x}"
+        self.short_id = self.id[:12]
+
+    def logs(self, stream: bool = False, follow: bool = False, **kwargs):
+        return iter([b"done\n"]) if stream else b"done\n"
+
+    def wait(self, **kwargs):
+        return {"StatusCode": 0}
+
+    def remove(self, **kwargs):
+        pass
+
+
+class FakeContainers:
+    def run(self, **kwargs):
+        return FakeContainer()
+
+
+class FakeAPI:
+    def __init__(self, images: FakeImages):
+        self.images = images
+
+    def pull(self, repository: str, tag: str = None, **kwargs):
+        # the progress messages of a pull of two layers
+        self.images.present.add(f"{repository}:{tag}")
+        yield {"status": f"Pulling from {repository}", "id": tag}
+        for layer in ("base", tag):
+            yield {"status": "Pulling fs layer", "id": layer}
+        for current in range(0, 1001, 100):
+            for layer in ("base", tag):
+                yield {
+                    "status": "Downloading",
+                    "id": layer,
+                    "progressDetail": {"current": current, "total": 1000},
+                }
+        for layer in ("base", tag):
+            yield {"status": "Download complete", "id": layer}
+            yield {"status": "Pull complete", "id": layer}
+
+
+class FakeClient:
+    def __init__(self):
+        self.images = FakeImages()
+        self.containers = FakeContainers()
+        self.api = FakeAPI(self.images)
+
+    def events(self, **kwargs):
+        return iter([])
+
+    def login(self, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+def get_fake_layers(repository: str, tag: str) -> List[Tuple[str, int]]:
+    # every image shares a base layer, and has one layer of its own
+    return [("sha256:base", 2_000_000_000), (f"sha256:{repository}:{tag}", 100_000_000)]
+
+
+def install_fakes() -> FakeClient:
+    from zero.core import utils
+    from zero.core.registry import RegistryClient
+
+    client = FakeClient()
+    utils._docker_client = client
+    utils._docker_login_expires_at = float("inf")
+    utils._docker_engine = None
+    utils._docker_engine_checked = True
+    RegistryClient.get_layers = lambda self, repository, tag: get_fake_layers(
+        repository, tag
+    )
+    return client
+
+
+def get_benchmarks(workspace_dir: Path, client: FakeClient) -> Dict[str, Tuple[Callable, int]]:
+    """
+    Set up the benchmarks in a temporary workspace.
+
+    Returns:
+        Dict[str, Tuple[Callable, int]]: The operation of each benchmark, and how many times it is run per repeat.
+    """
+    from zero.core import workspace as workspace_module
+    from zero.core.constants import WorkspaceExtension
+    from zero.core.images import ImageIndex
+    from zero.core.models import NyunDocker
+    from zero.core.utils import pull_docker_image, run_docker_container
+    from zero.core.workspace import Workspace, get_extension
+
+    custom_data = workspace_dir / "custom_data"
+    custom_data.mkdir()
+    workspace = Workspace(workspace_dir, custom_data, WorkspaceExtension.ALL)
+    extension = get_extension(dict(workspace.workspace_spec.extensions))
+    lookups = [(meta.algorithm, platform) for meta in extension.registry for platform in meta.platforms]
+
+    script = workspace_dir / "script.yaml"
+    algorithm, platform = lookups[0]
+    script.write_text(f"ALGORITHM: {algorithm}\nPLATFORM: {platform}\n")
+    metadata = extension.resolve(script)
+    images = [NyunDocker("nyunadmin/benchmark", f"v{number}") for number in range(PULL_IMAGES)]
+
+    def filter_registry():
+        for algorithm, platform in lookups:
+            extension.filter_registry(algorithm=algorithm, platform=platform)
+
+    def spec_create():
+        Workspace.create_workspace_spec(
+            workspace_dir, custom_data, WorkspaceExtension.get_extensions_dict(WorkspaceExtension.ALL)
+        )
+
+    def spec_load_cold():
+        workspace_module._workspace_specs.clear()
+        Workspace.load_workspace_spec(workspace_dir)
+
+    def spec_load_cached():
+        Workspace.load_workspace_spec(workspace_dir)
+
+    def extension_run():
+        # parse and resolve the script, then dispatch its container
+        with contextlib.redirect_stdout(io.StringIO()):
+            extension.run(script, workspace)
+
+    def pull_images():
+        client.images.present.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            pull_docker_image(*images, index=ImageIndex())
+
+    def dispatch():
+        run_docker_container(script, workspace, metadata, metadata.docker_image)
+
+    return {
+        "filter_registry": (filter_registry, 100),
+        "spec.create": (spec_create, 50),
+        "spec.load.cold": (spec_load_cold, 200),
+        "spec.load.cached": (spec_load_cached, 1000),
+        "extension.run": (extension_run, 50),
+        f"pull_docker_image[{PULL_IMAGES}]": (pull_images, 3),
+        "run_docker_container": (dispatch, 100),
+    }
+
+
+def measure(operation: Callable, number: int, repeats: int) -> float:
+    # the median time of one operation in milliseconds
+    operation()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        timings.append((time.perf_counter() - start) / number * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeats", type=int, default=5, help="Repeats per benchmark.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="Allowed slowdown factor over the baselines.",
+    )
+    parser.add_argument(
+        "--update", action="store_true", help="Rewrite the baselines from this run."
+    )
+    options = parser.parse_args()
+
+    baselines = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    failures = []
+    client = install_fakes()
+    with tempfile.TemporaryDirectory(prefix="nyun-benchmark-") as workspace_dir:
+        benchmarks = get_benchmarks(Path(workspace_dir), client)
+        print(f"{'benchmark':<28}{'median (ms)':>14}{'baseline (ms)':>16}{'ratio':>8}")
+        for name, (operation, number) in benchmarks.items():
+            median = measure(operation, number, options.repeats)
+            baseline = baselines.get(name, {}).get("baseline_ms")
+            if options.update or baseline is None:
+                print(f"{name:<28}{median:>14.3f}{'-':>16}{'-':>8}")
+                baselines[name] = {"baseline_ms": round(median, 4)}
+                continue
+            ratio = median / baseline
+            print(f"{name:<28}{median:>14.3f}{baseline:>16.3f}{ratio:>8.2f}")
+            if ratio > options.tolerance:
+                failures.append(
+                    f"{name} took {median:.3f}ms, {ratio:.2f}x its baseline of {baseline}ms"
+                )
+
+    if options.update:
+        BASELINES.write_text(json.dumps(baselines, indent=4) + "\n")
+        print(f"Baselines written to {BASELINES}")
+        return
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Startup benchmark for the Nyun CLI.
+
+Runs each CLI command in a cold interpreter with `python -X importtime`, and fails when the
+median import time of a command exceeds its budget, or when a command imports a module it
+is not allowed to import (e.g. docker for `nyun version`). Budgets are stored in
+startup_budgets.json next to this file.
+
+Usage:
+    python benchmarks/startup.py            # check against the budgets
+    python benchmarks/startup.py --update   # re-measure and rewrite the budgets
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+BUDGETS = Path(__file__).resolve().parent / "startup_budgets.json"
+
+# headroom applied to the measured time when the budgets are updated
+BUDGET_HEADROOM = 2.0
+
+RUN_CLI = "import sys; from zero.cli import app; sys.argv = ['nyun', *sys.argv[1:]]; app()"
+
+
+def measure(args: List[str]) -> Tuple[float, Dict[str, int]]:
+    """
+    Run the CLI with `args` in a fresh interpreter.
+
+    Returns:
+        Tuple[float, Dict[str, int]]: The total import time in milliseconds, and the
+        cumulative import time in microseconds of every imported module.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", RUN_CLI, *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    modules = {}
+    total_us = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = [
+            part for part in line.replace("import time:", "|").split("|")
+        ]
+        modules[name.strip()] = int(cumulative_us)
+        # top-level imports are not indented
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative_us)
+    return total_us / 1000, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command.")
+    parser.add_argument(
+        "--update", action="store_true", help="Rewrite the budgets from this run."
+    )
+    options = parser.parse_args()
+
+    budgets = json.loads(BUDGETS.read_text())
+    failures = []
+    print(f"{'command':<20}{'median (ms)':>14}{'budget (ms)':>14}")
+    for command, budget in budgets.items():
+        args = command.split()
+        timings, modules = [], {}
+        for _ in range(options.runs):
+            elapsed, modules = measure(args)
+            timings.append(elapsed)
+        median = statistics.median(timings)
+        print(f"{command:<20}{median:>14.1f}{budget['budget_ms']:>14.1f}")
+
+        if options.update:
+            budget["budget_ms"] = round(median * BUDGET_HEADROOM, 1)
+            continue
+        if median > budget["budget_ms"]:
+            failures.append(
+                f"`nyun {command}` took {median:.1f}ms, budget is {budget['budget_ms']}ms"
+            )
+        for module in budget.get("forbidden", []):
+            if module in modules:
+                failures.append(f"`nyun {command}` imports {module}")
+
+    if options.update:
+        BUDGETS.write_text(json.dumps(budgets, indent=4) + "\n")
+        print(f"Budgets written to {BUDGETS}")
+        return
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,65 @@ import typer
 from pathlib import Path
 from zero.version import __version__
 from zero.docs import NYUN_TRADEMARK
-from zero.core.workspace import (
-    Workspace,
+from zero.core.constants import (
+    DataStaging,
+    JobStatus,
     WorkspaceExtension,
-    get_workspace_and_custom_data_paths,
+    WorkspaceSpec,
+    BUNDLE_LOAD_JOBS,
 )
+from typing import Callable, Dict, List, Optional
 
-from docker.models.containers import Container
-from docker.errors import ContainerError
-from rich.progress import Progress, SpinnerColumn, TextColumn
-from typing import List
+# NOTE: heavy modules (docker, rich, dotenv and the extension table under zero.core.workspace)
+# are imported inside the commands that need them, so that short commands like `nyun version`
+# and `--help` start fast. benchmarks/startup.py checks the import time budget of each command.
 
 SUPPORTED_SUFFIX = {".yaml", ".yml", ".json"}
 
 app = typer.Typer()
 
 
+def load_workspace() -> "Workspace":
+    # load the workspace initialized in the current working directory
+    from zero.core.workspace import Workspace, get_workspace_and_custom_data_paths
+
+    workspace_path, custom_data_path, extensions = get_workspace_and_custom_data_paths(
+        None, None
+    )
+    try:
+        return Workspace(
+            workspace_path=workspace_path,
+            custom_data_path=custom_data_path,
+            overwrite=False,
+            extensions=extensions[0],
+        )
+    except:
+        typer.echo("Workspace not initialized. Use `nyun init`.")
+        raise typer.Abort()
+
+
+def get_timings_table(timings: "Timings") -> "Table":
+    # the time spent in each phase; phases of concurrent jobs overlap, so totals can exceed the wall time
+    from rich.table import Table
+
+    elapsed = timings.get_elapsed()
+    table = Table(title=f"(Nyun) Timings (wall time {elapsed:.2f}s)")
+    table.add_column("Phase")
+    table.add_column("Count", justify="right")
+    table.add_column("Total", justify="right")
+    table.add_column("Max", justify="right")
+    table.add_column("% of wall", justify="right")
+    for name, count, total, longest in timings.get_breakdown():
+        table.add_row(
+            name,
+            str(count),
+            f"{total:.3f}s",
+            f"{longest:.3f}s",
+            f"{100 * total / elapsed:.0f}%" if elapsed else "-",
+        )
+    return table
+
+
 @app.command()
 def init(
     workspace: Path = typer.Argument(
@@ -49,6 +92,8 @@ def init(
     If not provided, default paths will be used.
     Additionally, you can specify whether to overwrite the existing workspace spec and which extensions to install.
     """
+    from zero.core.workspace import Workspace, get_workspace_and_custom_data_paths
+
     workspace_path, custom_data_path, _ = get_workspace_and_custom_data_paths(
         workspace, custom_data
     )
@@ -79,11 +124,613 @@ def init(
         raise typer.Abort()
 
 
+def run_scripts(
+    file_paths: List[Path],
+    jobs: Optional[int] = None,
+    warm: bool = False,
+    force: bool = False,
+    dry_run: bool = False,
+    cpus: Optional[float] = None,
+    memory: Optional[str] = None,
+    gpus: Optional[float] = None,
+    gpu_ids: Optional[str] = None,
+    stage_data: DataStaging = DataStaging.BIND,
+    resume: bool = False,
+    show_timings: bool = False,
+    stop_on_failure: Optional[bool] = None,
+    pipeline: Optional["Pipeline"] = None,
+    local: bool = False,
+    command: str = "run",
+) -> Optional[List["JobResult"]]:
+    # validate, schedule and run scripts in the workspace of the current directory (see `nyun run`)
+    # returns the result of every script, or None for a dry run
+    # by default, the remaining scripts are skipped once one fails only when running one at a time
+    # the scripts of a pipeline run after the stages they depend on, unless they are unchanged
+    # scripts are sent to the docker hosts of the workspace spec, if it has any and not `local`
+    from contextlib import ExitStack, nullcontext
+    from rich.console import Console
+    from rich.progress import Progress, SpinnerColumn, TextColumn
+    from rich.table import Table
+    from zero.core.hosts import HostPool
+    from zero.core.scheduler import JobScheduler, JobResult
+    from zero.core.resources import PlacementEngine, ResourceRequest, parse_memory
+    from zero.core.results import ResultCache
+    from zero.core.runs import RunDirectory
+    from zero.core.scripts import ScriptCache, load_script
+    from zero.core.staging import DataStager
+    from zero.core.timings import span, start_timings
+    from zero.core.utils import get_docker_engine, kill_docker_containers
+    from zero.core.warmpool import WarmPool
+
+    timings = start_timings()
+    with span("workspace.load"):
+        workspace = load_workspace()
+    with span("extension.init"):
+        ext_obj = workspace.init_extension(install=False)
+
+    try:
+        host_pool = (
+            None if local else HostPool.from_spec(workspace.workspace_spec.hosts)
+        )
+    except ValueError as e:
+        typer.echo(err=True, message=f"Invalid hosts: {e}")
+        raise typer.Abort()
+    if host_pool is not None and not dry_run:
+        with span("hosts.check"):
+            for name, error in host_pool.check().items():
+                typer.echo(err=True, message=f"(Nyun) Skipping host {name}: {error}")
+        if not host_pool.hosts:
+            typer.echo(err=True, message="None of the workspace hosts is reachable.")
+            raise typer.Abort()
+    if jobs is None:
+        jobs = host_pool.get_slots() if host_pool is not None else 1
+
+    # Parse and resolve every script before running anything, and pull only the images they need
+    with span("scripts.resolve", scripts=len(file_paths)):
+        script_cache = ScriptCache.for_workspace(workspace.workspace_path)
+        metadata, errors = ext_obj.resolve_all(file_paths, cache=script_cache)
+    if errors:
+        for file_path, error in errors.items():
+            typer.echo(err=True, message=f"Invalid script {file_path}: {error}")
+        raise typer.Abort()
+
+    # Resources requested on the command line override the ones requested in the scripts
+    try:
+        cli_request = ResourceRequest(
+            cpus=cpus,
+            memory=parse_memory(memory),
+            gpus=gpus,
+            gpu_ids=gpu_ids.split(",") if gpu_ids else None,
+        )
+        requests = {
+            file_path: ResourceRequest.from_script(
+                load_script(file_path, cache=script_cache)
+            ).merge(cli_request)
+            for file_path in file_paths
+        }
+        engine = None
+        if not all(request.is_empty() for request in requests.values()):
+            engine = PlacementEngine()
+            for request in requests.values():
+                engine.validate(request)
+    except ValueError as e:
+        typer.echo(err=True, message=f"Invalid resources: {e}")
+        raise typer.Abort()
+
+    if dry_run and pipeline is not None:
+        # whether each stage would run, once its script is validated
+        plan = Table(title="(Nyun) Pipeline plan")
+        plan.add_column("Stage")
+        plan.add_column("Script")
+        plan.add_column("Image")
+        plan.add_column("Depends on")
+        plan.add_column("Status")
+        for name, status in pipeline.get_plan().items():
+            stage = pipeline.stages[name]
+            plan.add_row(
+                name,
+                str(stage.script),
+                str(metadata[stage.script].docker_image),
+                ", ".join(pipeline.dependencies[name]) or "-",
+                status,
+            )
+        Console().print(plan)
+        return None
+
+    if dry_run:
+        plan = Table(title="(Nyun) Run plan")
+        plan.add_column("Script")
+        plan.add_column("Algorithm")
+        plan.add_column("Platforms")
+        plan.add_column("Image")
+        plan.add_column("Resources")
+        for file_path, meta in metadata.items():
+            request = requests[file_path]
+            plan.add_row(
+                str(file_path),
+                meta.algorithm,
+                ", ".join(meta.platforms),
+                str(meta.docker_image),
+                "-" if request.is_empty() else str(request),
+            )
+        Console().print(plan)
+        return None
+
+    # other hosts pull the images they are missing when a script is sent to them
+    if host_pool is None or any(host.is_local for host in host_pool.hosts):
+        with span("images.ensure"):
+            ext_obj.ensure_images(*metadata.values(), index=workspace.image_index)
+
+    # Stage the custom data once for all scripts; a volume is synced on the first script's image
+    if stage_data != DataStaging.BIND:
+        stager = DataStager(workspace.workspace_path, workspace.custom_data_path, stage_data)
+        typer.echo(f"(Nyun) Staging custom data into {stager}...")
+        with span("data.stage", mode=stage_data):
+            workspace.staged_data = stager.stage(
+                image=next(iter(metadata.values())).docker_image
+            )
+
+    # Initialize progress bar
+    progress = Progress(
+        SpinnerColumn(spinner_name="dots8", speed=2),
+        TextColumn("[progress.description]{task.description}"),
+        transient=False,
+    )
+    # container output is streamed to a per-run log file, and to the terminal when running one job at a time
+    log_file_paths = {
+        file_path: WorkspaceSpec.get_run_log_path(workspace.workspace_path, file_path)
+        for file_path in file_paths
+    }
+    scheduler = JobScheduler(
+        max_jobs=jobs,
+        stop_on_failure=jobs == 1 if stop_on_failure is None else stop_on_failure,
+    )
+    pool = WarmPool() if warm else None
+    result_cache = ResultCache.for_workspace(workspace.workspace_path)
+    cached, unchanged = set(), set()
+    hosts = {}
+
+    # every script has a stable run directory, where its job writes checkpoints to resume from
+    runs = {
+        file_path: RunDirectory(workspace.workspace_path, file_path)
+        for file_path in file_paths
+    }
+    if resume:
+        for file_path, run in runs.items():
+            checkpoint = run.get_last_checkpoint()
+            if checkpoint is None:
+                typer.echo(f"(Nyun) No checkpoint of {file_path}, running it from scratch.")
+            else:
+                typer.echo(f"(Nyun) Resuming {file_path} from {checkpoint.name}.")
+
+    def execute(file_path: Path) -> int:
+        # wait for a free host and the script's resources, and run it on them
+        # resources are placed on this machine only; other hosts run their jobs with all their GPUs
+        with ExitStack() as stack:
+            host = None
+            if host_pool is not None:
+                with span("host.wait"):
+                    host = stack.enter_context(host_pool.acquire())
+                hosts[file_path] = host
+            if engine is None or (host is not None and not host.is_local):
+                placement_context = nullcontext()
+            else:
+                placement_context = engine.allocate(requests[file_path])
+            with span("placement.wait"):
+                placement = stack.enter_context(placement_context)
+            if scheduler.is_interrupted():
+                return -1
+            run = runs[file_path]
+            run.prepare(
+                resume=resume, client=host.get_client() if host is not None else None
+            )
+            run.start(
+                metadata[file_path],
+                log_file_path=log_file_paths[file_path],
+                host=host.name if host is not None and not host.is_local else None,
+            )
+            try:
+                if host is not None and not host.is_local:
+                    exit_code = host.execute(
+                        file_path=file_path,
+                        workspace=workspace,
+                        metadata=metadata[file_path],
+                        log_file_path=log_file_paths[file_path],
+                        echo=jobs == 1,
+                        run=run,
+                    )
+                else:
+                    exit_code = ext_obj.execute(
+                        file_path=file_path,
+                        workspace=workspace,
+                        metadata=metadata[file_path],
+                        log_file_path=log_file_paths[file_path],
+                        echo=jobs == 1,
+                        pool=pool,
+                        placement=placement,
+                        run=run,
+                    )
+            except BaseException as e:
+                # an interrupted job's containers were stopped before its run is finished
+                run.finish(
+                    JobStatus.FAILED
+                    if isinstance(e, Exception) and not scheduler.is_interrupted()
+                    else JobStatus.INTERRUPTED
+                )
+                raise
+            if scheduler.is_interrupted():
+                run.finish(JobStatus.INTERRUPTED, exit_code)
+            else:
+                run.finish(
+                    JobStatus.SUCCEEDED if exit_code == 0 else JobStatus.FAILED,
+                    exit_code,
+                )
+            return exit_code
+
+    def job(file_path: Path) -> int:
+        # restore the outputs of an identical earlier run, or run the script and store its outputs
+        with span("job", script=file_path):
+            if pipeline is not None and pipeline.is_up_to_date(file_path):
+                unchanged.add(file_path)
+                return 0
+            exit_code, from_cache = result_cache.run(
+                file_path=file_path,
+                workspace=workspace,
+                metadata=metadata[file_path],
+                data=load_script(file_path, cache=script_cache),
+                job=lambda: execute(file_path),
+                force=force,
+                inputs=(
+                    pipeline.get_inputs_digest(file_path)
+                    if pipeline is not None
+                    else None
+                ),
+            )
+        if from_cache:
+            cached.add(file_path)
+        if exit_code == 0 and pipeline is not None:
+            pipeline.record(file_path)
+        return exit_code
+
+    with progress:
+        tasks = {
+            file_path: progress.add_task(
+                f"[white](Nyun) Queued script {file_path}.",
+                total=1,
+                start=False,
+            )
+            for file_path in file_paths
+        }
+
+        def on_start(file_path: Path):
+            progress.start_task(tasks[file_path])
+            progress.update(
+                tasks[file_path],
+                description=f"[white](Nyun) Running script {file_path}...",
+                refresh=True,
+            )
+
+        def on_finish(result: JobResult):
+            color = "blue" if result.succeeded else "red"
+            progress.update(
+                tasks[result.script],
+                advance=1,
+                description=f"[{color}](Nyun) {result.status.capitalize()} script {result.script}.",
+                completed=True,
+                refresh=True,
+            )
+
+        def on_interrupt(running: List[Path]):
+            # cancel the containers run on the Docker engine, which removes them, and kill the
+            # other containers of the running scripts, on the host each of them runs on
+            # (the warm workers running scripts are stopped when the pool shuts down)
+            typer.echo(err=True, message="(Nyun) Interrupted, stopping the running scripts...")
+            docker_engine = get_docker_engine()
+            if docker_engine is not None:
+                docker_engine.cancel()
+            for file_path in running:
+                host = hosts.get(file_path)
+                try:
+                    kill_docker_containers(
+                        runs[file_path].get_labels(),
+                        client=host.get_client() if host is not None else None,
+                    )
+                except Exception as e:
+                    typer.echo(err=True, message=f"(Nyun) Failed to stop {file_path}: {e}")
+
+        try:
+            results = scheduler.run(
+                file_paths,
+                job=job,
+                on_start=on_start,
+                on_finish=on_finish,
+                dependencies=(
+                    pipeline.get_script_dependencies() if pipeline is not None else None
+                ),
+                on_interrupt=on_interrupt,
+            )
+        finally:
+            if pool is not None:
+                with span("pool.shutdown"):
+                    pool.shutdown()
+
+    timings.write(
+        WorkspaceSpec.get_timings_path(workspace.workspace_path), command=command
+    )
+
+    summary = Table(title="(Nyun) Run summary")
+    summary.add_column("Script")
+    summary.add_column("Status")
+    summary.add_column("Exit code", justify="right")
+    summary.add_column("Duration", justify="right")
+    if host_pool is not None:
+        summary.add_column("Host")
+    summary.add_column("Log")
+    for result in results:
+        status = result.status
+        if result.script in cached:
+            status = f"{result.status} (cached)"
+        elif result.script in unchanged:
+            status = f"{result.status} (unchanged)"
+        summary.add_row(
+            str(result.script),
+            status,
+            "-" if result.exit_code is None else str(result.exit_code),
+            f"{result.duration:.1f}s",
+            *(
+                [hosts[result.script].name if result.script in hosts else "-"]
+                if host_pool is not None
+                else []
+            ),
+            (
+                str(log_file_paths[result.script])
+                if log_file_paths[result.script].exists()
+                else "-"
+            ),
+        )
+    progress.console.print(summary)
+    if show_timings:
+        progress.console.print(get_timings_table(timings))
+    for result in results:
+        if result.error:
+            typer.echo(err=True, message=f"{result.script}: {result.error}")
+
+    return results
+
+
+def watch_scripts(
+    file_paths: List[Path],
+    warm: bool = False,
+    force: bool = False,
+    cpus: Optional[float] = None,
+    memory: Optional[str] = None,
+    gpus: Optional[float] = None,
+    gpu_ids: Optional[str] = None,
+):
+    # run scripts in the workspace of the current directory on this machine, and run each again
+    # whenever it changes, until interrupted (see `nyun run --watch`)
+    # the workspace, extension registry, docker client and warm workers stay loaded between runs
+    import threading
+    import time
+    from contextlib import nullcontext
+    from zero.core.resources import PlacementEngine, ResourceRequest, parse_memory
+    from zero.core.results import ResultCache
+    from zero.core.runs import RunDirectory
+    from zero.core.scripts import ScriptCache, load_script
+    from zero.core.utils import kill_docker_containers
+    from zero.core.warmpool import WarmPool
+    from zero.core.watch import ScriptWatch
+
+    workspace = load_workspace()
+    ext_obj = workspace.init_extension(install=False)
+    script_cache = ScriptCache.for_workspace(workspace.workspace_path)
+    result_cache = ResultCache.for_workspace(workspace.workspace_path)
+    try:
+        cli_request = ResourceRequest(
+            cpus=cpus,
+            memory=parse_memory(memory),
+            gpus=gpus,
+            gpu_ids=gpu_ids.split(",") if gpu_ids else None,
+        )
+    except ValueError as e:
+        typer.echo(err=True, message=f"Invalid resources: {e}")
+        raise typer.Abort()
+    engines = []
+    engine_lock = threading.Lock()
+    pool = WarmPool() if warm else None
+    runs = {
+        file_path: RunDirectory(workspace.workspace_path, file_path)
+        for file_path in file_paths
+    }
+    echo = len(file_paths) == 1
+    # images are checked once, not on every run
+    ensured_images = set()
+
+    def get_engine() -> PlacementEngine:
+        # the engine is only created once a script requests resources
+        with engine_lock:
+            if not engines:
+                engines.append(PlacementEngine())
+            return engines[0]
+
+    def job(file_path: Path, cancelled: threading.Event) -> int:
+        # the script is parsed and resolved again on every run, as it changed
+        data = load_script(file_path, cache=script_cache)
+        script_cache.save()
+        metadata = ext_obj.resolve(file_path, data=data)
+        if metadata.docker_image not in ensured_images:
+            ext_obj.ensure_images(metadata, index=workspace.image_index)
+            ensured_images.add(metadata.docker_image)
+        request = ResourceRequest.from_script(data).merge(cli_request)
+        if not request.is_empty():
+            get_engine().validate(request)
+        log_file_path = WorkspaceSpec.get_run_log_path(workspace.workspace_path, file_path)
+        typer.echo(f"(Nyun) Running script {file_path}, logging to {log_file_path}.")
+
+        def execute() -> int:
+            placement_context = (
+                nullcontext() if request.is_empty() else get_engine().allocate(request)
+            )
+            with placement_context as placement:
+                if cancelled.is_set():
+                    return -1
+                run = runs[file_path]
+                run.prepare(resume=False)
+                run.start(metadata, log_file_path=log_file_path)
+                try:
+                    exit_code = ext_obj.execute(
+                        file_path=file_path,
+                        workspace=workspace,
+                        metadata=metadata,
+                        log_file_path=log_file_path,
+                        echo=echo,
+                        pool=pool,
+                        placement=placement,
+                        run=run,
+                    )
+                except BaseException as e:
+                    run.finish(
+                        JobStatus.FAILED
+                        if isinstance(e, Exception)
+                        else JobStatus.INTERRUPTED
+                    )
+                    raise
+                if cancelled.is_set():
+                    run.finish(JobStatus.CANCELLED, exit_code)
+                else:
+                    run.finish(
+                        JobStatus.SUCCEEDED if exit_code == 0 else JobStatus.FAILED,
+                        exit_code,
+                    )
+                return exit_code
+
+        exit_code, from_cache = result_cache.run(
+            file_path=file_path,
+            workspace=workspace,
+            metadata=metadata,
+            data=data,
+            job=execute,
+            force=force,
+        )
+        if from_cache:
+            typer.echo(f"(Nyun) Restored the cached results of {file_path}.")
+        return exit_code
+
+    def cancel(file_path: Path):
+        kill_docker_containers(runs[file_path].get_labels())
+        if pool is not None:
+            pool.cancel(file_path)
+
+    def on_finish(run: "WatchedRun", exit_code: Optional[int], error: Optional[Exception]):
+        duration = time.monotonic() - run.started_at
+        if run.cancelled.is_set():
+            typer.echo(f"(Nyun) Cancelled script {run.script} after {duration:.1f}s.")
+            return
+        if error is not None:
+            # resolving a script raises its parse error as the cause
+            typer.echo(
+                err=True,
+                message=f"(Nyun) Failed script {run.script}: {error.__cause__ or error}",
+            )
+        elif exit_code == 0:
+            typer.echo(f"(Nyun) Succeeded script {run.script} in {duration:.1f}s.")
+        else:
+            typer.echo(
+                err=True,
+                message=f"(Nyun) Failed script {run.script} with exit code {exit_code} in {duration:.1f}s.",
+            )
+        typer.echo("(Nyun) Watching for changes. Press Ctrl+C to stop.")
+
+    def on_change(changed):
+        for file_path in file_paths:
+            if file_path in changed:
+                typer.echo(f"(Nyun) {file_path} changed, running it again.")
+
+    stop = threading.Event()
+    watch = ScriptWatch(file_paths, job=job, cancel=cancel, on_finish=on_finish)
+    try:
+        watch.run(stop, on_change=on_change)
+    except KeyboardInterrupt:
+        typer.echo("(Nyun) Stopped watching.")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
 @app.command(help="Run scripts within the initialized Nyun workspace.")
 def run(
     file_paths: List[Path] = typer.Argument(
         None, help="Path(s) to the YAML or JSON script file you want to run."
-    )
+    ),
+    jobs: int = typer.Option(
+        None,
+        "--jobs",
+        "-j",
+        min=1,
+        help="Number of scripts to run concurrently. Defaults to 1, or to the job slots of the workspace hosts. With 1, scripts run in the given order and the remaining scripts are skipped once one fails.",
+    ),
+    warm: bool = typer.Option(
+        False,
+        "--warm",
+        help="Run scripts on warm worker containers, reusing one container per docker image across scripts instead of starting a new container for each.",
+    ),
+    force: bool = typer.Option(
+        False,
+        "--force",
+        "-f",
+        help="Run the scripts even if the results of an identical run are cached.",
+    ),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Validate and resolve the scripts, and show the docker image each would run on, without running them.",
+    ),
+    cpus: float = typer.Option(
+        None,
+        "--cpus",
+        help="CPU cores per script. Overrides the script's RESOURCES. Scripts are pinned to dedicated cores.",
+    ),
+    memory: str = typer.Option(
+        None,
+        "--memory",
+        help='Memory limit per script, e.g. "16g". Overrides the script\'s RESOURCES.',
+    ),
+    gpus: float = typer.Option(
+        None,
+        "--gpus",
+        help="GPUs per script: a whole number, or a fraction (e.g. 0.5) to share a GPU between scripts. Overrides the script's RESOURCES.",
+    ),
+    gpu_ids: str = typer.Option(
+        None,
+        "--gpu-ids",
+        help='Comma separated GPU device ids per script, e.g. "0,1". Overrides the script\'s RESOURCES.',
+    ),
+    stage_data: DataStaging = typer.Option(
+        DataStaging.BIND,
+        "--stage-data",
+        help="How the custom data directory reaches the containers: bind mounted in place, or staged into a local cache directory or a docker volume, which are synced incrementally before the scripts run.",
+    ),
+    resume: bool = typer.Option(
+        False,
+        "--resume",
+        help="Continue each script from the last checkpoint it wrote in its run directory (.nyunservices/runs/), instead of from scratch.",
+    ),
+    show_timings: bool = typer.Option(
+        False,
+        "--timings",
+        help="Print a breakdown of the time spent in each phase of the run (workspace load, image checks, container create, run and teardown). The timings of every run are also appended to .nyunservices/timings.jsonl.",
+    ),
+    local: bool = typer.Option(
+        False,
+        "--local",
+        help="Run every script on this machine, even if the workspace has docker hosts.",
+    ),
+    watch: bool = typer.Option(
+        False,
+        "--watch",
+        "-w",
+        help="Keep running: run each script again whenever it changes, cancelling its run in flight. All scripts run at once, on this machine.",
+    ),
 ):
     """
     Run scripts within the initialized Nyun workspace.
@@ -91,6 +738,11 @@ def run(
     This command allows you to run scripts within the initialized Nyun workspace.
     You need to provide the path to the YAML or JSON script file you want to run.
     The script will be executed within the initialized workspace.
+    Every script is validated before any of them runs.
+    With --jobs N, up to N scripts are run at once and a per-script summary is shown at the end.
+    Scripts that request CPUs, memory or GPUs wait until those resources are free.
+    If the workspace has docker hosts (see `nyun hosts`), each script is sent to the least loaded one.
+    With --watch, each script is run again whenever it changes.
     """
     if not file_paths:
         typer.echo("Please provide the path(s) to the script file.")
@@ -100,55 +752,648 @@ def run(
         typer.echo("All configs must be a .yaml or .json files")
         raise typer.Abort()
 
-    # Get workspace paths and extensions
-    workspace_path, custom_data_path, extensions = get_workspace_and_custom_data_paths(
-        None, None
+    if watch:
+        if jobs is not None or dry_run or resume or show_timings or (
+            stage_data != DataStaging.BIND
+        ):
+            typer.echo(
+                "--watch cannot be combined with --jobs, --dry-run, --resume, --timings or --stage-data."
+            )
+            raise typer.Abort()
+        watch_scripts(
+            file_paths,
+            warm=warm,
+            force=force,
+            cpus=cpus,
+            memory=memory,
+            gpus=gpus,
+            gpu_ids=gpu_ids,
+        )
+        return
+
+    results = run_scripts(
+        file_paths,
+        jobs=jobs,
+        warm=warm,
+        force=force,
+        dry_run=dry_run,
+        cpus=cpus,
+        memory=memory,
+        gpus=gpus,
+        gpu_ids=gpu_ids,
+        stage_data=stage_data,
+        resume=resume,
+        show_timings=show_timings,
+        local=local,
     )
+    if results is not None and not all(result.succeeded for result in results):
+        raise typer.Exit(code=1)
+
+
+@app.command(
+    help="Run variants of a script over a grid or random search of its parameters."
+)
+def sweep(
+    base: Path = typer.Argument(..., help="The base YAML or JSON script."),
+    spec: Path = typer.Argument(
+        ...,
+        help="The sweep spec (YAML or JSON): MODE (grid or random), PARAMETERS, and optionally SAMPLES, SEED and METRICS.",
+    ),
+    jobs: int = typer.Option(
+        None,
+        "--jobs",
+        "-j",
+        min=1,
+        help="Number of variants to run concurrently. Defaults to 1, or to the job slots of the workspace hosts.",
+    ),
+    warm: bool = typer.Option(
+        False,
+        "--warm",
+        help="Run the variants on warm worker containers, reusing one container per docker image.",
+    ),
+    force: bool = typer.Option(
+        False,
+        "--force",
+        "-f",
+        help="Run the variants even if the results of an identical run are cached.",
+    ),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Generate and validate the variants without running them.",
+    ),
+    gpus: float = typer.Option(
+        None,
+        "--gpus",
+        help="GPUs per variant: a whole number, or a fraction (e.g. 0.5) to share a GPU between variants.",
+    ),
+    output: Path = typer.Option(
+        None,
+        "--output",
+        "-o",
+        help="Also write the results table to this .csv or .json file.",
+    ),
+):
+    """
+    Run variants of a script over a grid or random search of its parameters.
+
+    The variants are generated from the base script and the sweep spec, and written under
+    .nyunservices/sweeps/ in the workspace. They are all validated before any of them runs,
+    and run with up to --jobs at once; a failed variant does not stop the others. The status,
+    parameters and metrics of every variant are written to results.csv and results.json in
+    the sweep directory, and shown in a table.
+    """
+    from rich.console import Console
+    from rich.table import Table
+    from zero.core.results import get_output_path_on_host
+    from zero.core.scripts import load_script
+    from zero.core.sweeps import Sweep, write_report
+
+    if base.suffix not in SUPPORTED_SUFFIX or spec.suffix not in SUPPORTED_SUFFIX:
+        typer.echo("The base script and the sweep spec must be .yaml or .json files")
+        raise typer.Abort()
+
+    workspace_path = Path.cwd()
+    if not WorkspaceSpec.get_workspace_spec_path(workspace_path).exists():
+        typer.echo("Workspace not initialized. Use `nyun init`.")
+        raise typer.Abort()
+
     try:
-        workspace = Workspace(
-            workspace_path=workspace_path,
-            custom_data_path=custom_data_path,
-            overwrite=False,
-            extensions=extensions[0],
+        sweep = Sweep.from_files(base, spec)
+        variants = dict(sweep.write_variants(workspace_path))
+    except (OSError, ValueError) as e:
+        typer.echo(err=True, message=f"Invalid sweep: {e}")
+        raise typer.Abort()
+    sweep_dir = sweep.get_dir(workspace_path)
+    typer.echo(f"(Nyun) {len(variants)} variant(s) of {base} in {sweep_dir}.")
+
+    results = run_scripts(
+        list(variants),
+        jobs=jobs,
+        warm=warm,
+        force=force,
+        dry_run=dry_run,
+        gpus=gpus,
+        stop_on_failure=False,
+        command="sweep",
+    )
+    if results is None:
+        return
+
+    rows = []
+    for result in results:
+        output_path = get_output_path_on_host(workspace_path, load_script(result.script))
+        rows.append(
+            {
+                "variant": result.script.stem,
+                "status": result.status,
+                "exit_code": result.exit_code,
+                "duration": round(result.duration, 1),
+                **variants[result.script],
+                **sweep.collect_metrics(output_path),
+            }
         )
-    except:
+    write_report(rows, sweep_dir / "results.csv")
+    write_report(rows, sweep_dir / "results.json")
+    if output is not None:
+        write_report(rows, output)
+
+    table = Table(title="(Nyun) Sweep results")
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    for column in columns:
+        table.add_column(column)
+    for row in rows:
+        table.add_row(*["" if row.get(column) is None else str(row[column]) for column in columns])
+    Console().print(table)
+    typer.echo(f"Results written to {sweep_dir / 'results.csv'}")
+
+    if not all(result.succeeded for result in results):
+        raise typer.Exit(code=1)
+
+
+@app.command(help="Run the stages of a pipeline in dependency order.")
+def pipeline(
+    spec: Path = typer.Argument(
+        ...,
+        help="The pipeline spec (YAML or JSON): STAGES with their SCRIPT, INPUTS, OUTPUTS and DEPENDS_ON.",
+    ),
+    jobs: int = typer.Option(
+        None,
+        "--jobs",
+        "-j",
+        min=1,
+        help="Number of stages to run concurrently. Defaults to the number of stages.",
+    ),
+    warm: bool = typer.Option(
+        False,
+        "--warm",
+        help="Run the stages on warm worker containers, reusing one container per docker image.",
+    ),
+    force: bool = typer.Option(
+        False,
+        "--force",
+        "-f",
+        help="Run every stage, even if it is unchanged or its results are cached.",
+    ),
+    dry_run: bool = typer.Option(
+        False,
+        "--dry-run",
+        help="Validate the stages and show which would run, without running them.",
+    ),
+    gpus: float = typer.Option(
+        None,
+        "--gpus",
+        help="GPUs per stage: a whole number, or a fraction (e.g. 0.5) to share a GPU between stages.",
+    ),
+    stage_data: DataStaging = typer.Option(
+        DataStaging.BIND,
+        "--stage-data",
+        help="How to provide the custom data to containers: bind mount it, or stage it into a local cache directory or a docker volume.",
+    ),
+    show_timings: bool = typer.Option(
+        False,
+        "--timings",
+        help="Print the time spent in each phase of the pipeline.",
+    ),
+):
+    """
+    Run the stages of a pipeline in dependency order.
+
+    A stage runs once the stages it depends on succeeded: the ones in its DEPENDS_ON, and the
+    ones writing its INPUTS. Independent stages run concurrently, and the dependents of a failed
+    stage are skipped. A stage is skipped when its script and the contents of its inputs are
+    unchanged since its last successful run, and its outputs exist.
+    """
+    from zero.core.pipelines import Pipeline
+
+    if spec.suffix not in SUPPORTED_SUFFIX:
+        typer.echo("The pipeline spec must be a .yaml or .json file")
+        raise typer.Abort()
+
+    workspace_path = Path.cwd()
+    if not WorkspaceSpec.get_workspace_spec_path(workspace_path).exists():
         typer.echo("Workspace not initialized. Use `nyun init`.")
         raise typer.Abort()
-    ext_obj = workspace.init_extension()
+
     try:
-        # Initialize progress bar
-        progress = Progress(
-            SpinnerColumn(spinner_name="dots8", speed=2),
-            TextColumn("[progress.description]{task.description}"),
-            transient=False,
-        )
-        with progress:
-            for file_path in file_paths:
-                task = progress.add_task(
-                    f"[white](Nyun) Running script {file_path}...",
-                    total=1,
-                    start=False,
-                )
-                running_container: Container = ext_obj.run(
-                    file_path=file_path, workspace=workspace
-                )
-                running_container.wait()
-                # TODO: add checks on container if success or failed. use container.exec_run if needed
-                progress.update(
-                    task,
-                    advance=1,
-                    description=f"[blue]Done.",
-                    completed=True,
-                    refresh=True,
-                )
-    except ContainerError as e:
-        typer.echo(err=True, message=e.stderr)
+        pipeline = Pipeline.from_file(spec, workspace_path, force=force)
+    except (OSError, ValueError) as e:
+        typer.echo(err=True, message=f"Invalid pipeline: {e}")
         raise typer.Abort()
+    for stage in pipeline.stages.values():
+        if not stage.script.exists():
+            typer.echo(f"Script of stage '{stage.name}' not found: {stage.script}")
+            raise typer.Abort()
+        if stage.script.suffix not in SUPPORTED_SUFFIX:
+            typer.echo(f"Script of stage '{stage.name}' must be a .yaml or .json file")
+            raise typer.Abort()
+
+    results = run_scripts(
+        pipeline.get_scripts(),
+        jobs=jobs or len(pipeline.stages),
+        warm=warm,
+        force=force,
+        dry_run=dry_run,
+        gpus=gpus,
+        stage_data=stage_data,
+        show_timings=show_timings,
+        stop_on_failure=False,
+        pipeline=pipeline,
+        command="pipeline",
+    )
+    if results is not None and not all(result.succeeded for result in results):
+        raise typer.Exit(code=1)
+
+
+@app.command(help="Start the Nyun job daemon for the initialized Nyun workspace.")
+def serve(
+    jobs: int = typer.Option(
+        1, "--jobs", "-j", min=1, help="Number of jobs the daemon runs concurrently."
+    ),
+):
+    """
+    Start the Nyun job daemon for the initialized Nyun workspace.
+
+    The daemon keeps the workspace, extensions and Docker client loaded and runs the jobs
+    submitted with `nyun submit`. Its queue is persisted in the workspace, so queued jobs
+    survive restarts. Press Ctrl+C once to stop after the running jobs finish, twice to stop now.
+    """
+    from zero.core.daemon import NyunDaemon
+
+    workspace = load_workspace()
+    try:
+        daemon = NyunDaemon(workspace, max_jobs=jobs)
     except Exception as e:
+        typer.echo(f"Failed to start the daemon: {e}")
+        raise typer.Abort()
+
+    typer.echo(f"Nyun daemon listening on {daemon.socket_path} ({jobs} job(s) at once).")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        typer.echo("Stopping. Waiting for the running jobs to finish (Ctrl+C to stop now)...")
+        try:
+            daemon.shutdown(wait=True)
+        except KeyboardInterrupt:
+            typer.echo("Stopping now. The running jobs are killed and run again on the next start.")
+            daemon.kill()
+    except RuntimeError as e:
         typer.echo(e)
         raise typer.Abort()
 
 
+@app.command(help="Submit scripts to the Nyun job daemon.")
+def submit(
+    file_paths: List[Path] = typer.Argument(
+        None, help="Path(s) to the YAML or JSON script file you want to run."
+    ),
+):
+    """
+    Submit scripts to the Nyun job daemon started with `nyun serve` in the workspace.
+    """
+    from zero.core.daemon import send_request
+
+    if not file_paths:
+        typer.echo("Please provide the path(s) to the script file.")
+        raise typer.Abort()
+
+    if any(file_path.suffix not in SUPPORTED_SUFFIX for file_path in file_paths):
+        typer.echo("All configs must be a .yaml or .json files")
+        raise typer.Abort()
+
+    try:
+        response = send_request(
+            WorkspaceSpec.get_daemon_socket_path(Path.cwd()),
+            {
+                "op": "submit",
+                "scripts": [str(path.absolute().resolve()) for path in file_paths],
+            },
+        )
+    except ConnectionError as e:
+        typer.echo(e)
+        raise typer.Abort()
+
+    if not response["ok"]:
+        for file_path, error in response.get("errors", {}).items():
+            typer.echo(err=True, message=f"Invalid script {file_path}: {error}")
+        if "error" in response:
+            typer.echo(err=True, message=response["error"])
+        raise typer.Abort()
+    for file_path, job_id in zip(file_paths, response["ids"]):
+        typer.echo(f"Submitted {file_path} as job {job_id}.")
+
+
+@app.command(help="List the jobs of the Nyun job daemon.")
+def jobs(
+    limit: int = typer.Option(
+        50, "--limit", "-n", min=1, help="Number of most recent jobs to show."
+    ),
+):
+    """
+    List the most recent jobs of the Nyun job daemon with their status.
+    """
+    from datetime import datetime
+    from rich.console import Console
+    from rich.table import Table
+    from zero.core.daemon import send_request
+
+    try:
+        response = send_request(
+            WorkspaceSpec.get_daemon_socket_path(Path.cwd()),
+            {"op": "list", "limit": limit},
+        )
+    except ConnectionError as e:
+        typer.echo(e)
+        raise typer.Abort()
+
+    table = Table(title="(Nyun) Jobs")
+    table.add_column("Id", justify="right")
+    table.add_column("Script")
+    table.add_column("Status")
+    table.add_column("Exit code", justify="right")
+    table.add_column("Submitted")
+    table.add_column("Log")
+    for job in response["jobs"]:
+        table.add_row(
+            str(job["id"]),
+            job["script"],
+            job["status"] + (f" ({job['error']})" if job["error"] else ""),
+            "-" if job["exit_code"] is None else str(job["exit_code"]),
+            datetime.fromtimestamp(job["submitted_at"]).strftime("%Y-%m-%d %H:%M:%S"),
+            job["log_path"] or "-",
+        )
+    Console().print(table)
+
+
+@app.command(help="Install all the extensions of the initialized Nyun workspace.")
+def install():
+    """
+    Install all the extensions of the initialized Nyun workspace.
+
+    This command pulls the docker images of every extension enabled in the workspace.
+    `nyun run` only pulls the images required by the scripts being run.
+    """
+    workspace = load_workspace()
+    try:
+        workspace.init_extension(install=True)
+        typer.echo("Installed workspace extensions.")
+    except ValueError as e:
+        typer.echo(e)
+        raise typer.Abort()
+
+
+images_app = typer.Typer(help="Export and import the docker images of Nyun extensions.")
+app.add_typer(images_app, name="images")
+
+
+@images_app.command("export", help="Export the docker images of Nyun extensions into a bundle file.")
+def images_export(
+    bundle: Path = typer.Argument(..., help="Path of the bundle file to write."),
+    extensions: WorkspaceExtension = typer.Option(
+        None,
+        "--extensions",
+        "-e",
+        help="The extensions whose docker images to export. Defaults to the extensions of the initialized workspace. Available extensions are: kompress-vision, kompress-text-generation, adapt, all.",
+    ),
+):
+    """
+    Export the docker images of Nyun extensions into a single bundle file.
+
+    The images are pulled first if needed. Files shared between the images (e.g. common base
+    layers) are stored once, and the bundle is compressed on all CPUs. Copy the bundle to a node
+    without registry access and run `nyun images import` there.
+    """
+    from rich import filesize
+    from rich.progress import BarColumn, DownloadColumn, Progress, TextColumn
+    from zero.core.bundle import export_bundle
+    from zero.core.utils import get_docker_client, pull_docker_image
+    from zero.core.workspace import get_extension
+
+    if extensions is None:
+        workspace = load_workspace()
+        ext_obj = workspace.init_extension(install=False)
+        index = workspace.image_index
+    else:
+        ext_obj = get_extension(WorkspaceExtension.get_extensions_dict(extensions))
+        index = None
+    images = ext_obj.get_docker_images()
+    if not images:
+        typer.echo("No docker images to export.")
+        raise typer.Abort()
+
+    pull_docker_image(*images, index=index)
+    client = get_docker_client()
+    references = [str(image) for image in images]
+    try:
+        sizes = {
+            reference: client.images.get(reference).attrs.get("Size")
+            for reference in references
+        }
+    except Exception as e:
+        typer.echo(f"Docker image not available for export: {e}")
+        raise typer.Abort()
+
+    progress = Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        DownloadColumn(),
+    )
+    with progress:
+        tasks = {
+            reference: progress.add_task(
+                f"[white](Nyun) Exporting {reference}", total=sizes[reference]
+            )
+            for reference in references
+        }
+        report = export_bundle(
+            client,
+            references,
+            bundle,
+            on_progress=lambda reference, processed: progress.update(
+                tasks[reference], completed=processed
+            ),
+        )
+    typer.echo(
+        f"Exported {len(references)} image(s) to {bundle}: "
+        f"{filesize.decimal(report['size'])} of image archives stored in {filesize.decimal(report['stored'])}."
+    )
+
+
+@images_app.command("import", help="Import the docker images of a bundle file.")
+def images_import(
+    bundle: Path = typer.Argument(
+        ..., exists=True, dir_okay=False, help="Path of the bundle file to import."
+    ),
+    jobs: int = typer.Option(
+        BUNDLE_LOAD_JOBS,
+        "--jobs",
+        "-j",
+        min=1,
+        help="Number of images to load concurrently.",
+    ),
+):
+    """
+    Import the docker images of a bundle written by `nyun images export`.
+
+    The bundle is verified before any image is loaded. An interrupted import resumes where it
+    stopped when run again, and images already present are skipped.
+    """
+    from docker.errors import APIError
+    from rich.progress import BarColumn, DownloadColumn, Progress, TextColumn
+    from zero.core.bundle import BundleError, import_bundle, read_bundle
+    from zero.core.images import ImageIndex
+    from zero.core.models import NyunDocker
+    from zero.core.utils import get_docker_client
+
+    client = get_docker_client()
+    try:
+        manifest, _ = read_bundle(bundle)
+    except Exception as e:
+        typer.echo(f"Invalid bundle {bundle}: {e}")
+        raise typer.Abort()
+
+    progress = Progress(
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        DownloadColumn(),
+    )
+    sizes = {
+        image["reference"]: sum(member.get("size", 0) for member in image["members"])
+        for image in manifest["images"]
+    }
+    with progress:
+        tasks = {
+            reference: progress.add_task(
+                f"[white](Nyun) Importing {reference}", total=size
+            )
+            for reference, size in sizes.items()
+        }
+        try:
+            report = import_bundle(
+                client,
+                bundle,
+                on_progress=lambda reference, processed: progress.update(
+                    tasks[reference], completed=processed
+                ),
+                jobs=jobs,
+            )
+        except BundleError as e:
+            typer.echo(err=True, message=str(e))
+            raise typer.Exit(code=1)
+        except APIError as e:
+            typer.echo(err=True, message=f"Docker failed to load the images: {e}")
+            raise typer.Exit(code=1)
+        for reference in report["skipped"]:
+            progress.update(
+                tasks[reference],
+                completed=sizes[reference],
+                description=f"[green](Nyun) Already present {reference}",
+            )
+
+    # record the images in the image index of the workspace, if the current directory is one
+    if WorkspaceSpec.get_workspace_spec_path(Path.cwd()).exists():
+        index = ImageIndex.for_workspace(Path.cwd())
+        for reference in report["loaded"] + report["skipped"]:
+            index.add(NyunDocker(*reference.rsplit(":", 1)), client)
+        index.save()
+    typer.echo(
+        f"Imported {len(report['loaded'])} image(s), {len(report['skipped'])} already present."
+    )
+
+
+hosts_app = typer.Typer(help="Manage the docker hosts that scripts are distributed across.")
+app.add_typer(hosts_app, name="hosts")
+
+
+def update_hosts(update: Callable[[Dict[str, str]], None]):
+    # apply an update to the hosts of the workspace spec in the current directory
+    from zero.core.workspace import Workspace
+
+    workspace_path = Path.cwd()
+    if not WorkspaceSpec.get_workspace_spec_path(workspace_path).exists():
+        typer.echo("Workspace not initialized. Use `nyun init`.")
+        raise typer.Abort()
+    spec = Workspace.load_workspace_spec(workspace_path)
+    hosts = dict(spec.hosts)
+    update(hosts)
+    Workspace.create_workspace_spec(
+        workspace_path, spec.custom_data_path, dict(spec.extensions), hosts=hosts
+    )
+
+
+@hosts_app.command("add", help="Add a docker host to the workspace, or update it.")
+def hosts_add(
+    name: str = typer.Argument(..., help="The name of the host."),
+    address: str = typer.Argument(
+        ...,
+        help='A docker host URL (unix://, tcp:// or ssh://), a docker context name, or "local" for this machine.',
+    ),
+    jobs: int = typer.Option(
+        1, "--jobs", "-j", min=1, help="Number of scripts the host runs at once."
+    ),
+    shared: bool = typer.Option(
+        False,
+        "--shared",
+        help="The workspace and custom data are at the same paths on the host (e.g. on NFS), so they are not synced to it.",
+    ),
+):
+    from zero.core.hosts import DockerHost
+
+    host = DockerHost(name, address, max_jobs=jobs, shared=shared)
+    update_hosts(lambda hosts: hosts.update({name: host.to_spec()}))
+    typer.echo(f"Added host {name} ({host.to_spec()}).")
+
+
+@hosts_app.command("remove", help="Remove a docker host from the workspace.")
+def hosts_remove(name: str = typer.Argument(..., help="The name of the host.")):
+    def remove(hosts: Dict[str, str]):
+        if hosts.pop(name, None) is None:
+            typer.echo(f"No host named {name}.")
+            raise typer.Exit(code=1)
+
+    update_hosts(remove)
+    typer.echo(f"Removed host {name}.")
+
+
+@hosts_app.command("list", help="List the docker hosts of the workspace and check they are reachable.")
+def hosts_list():
+    from rich.console import Console
+    from rich.table import Table
+    from zero.core.hosts import HostPool
+
+    workspace = load_workspace()
+    try:
+        pool = HostPool.from_spec(workspace.workspace_spec.hosts)
+    except ValueError as e:
+        typer.echo(err=True, message=f"Invalid hosts: {e}")
+        raise typer.Abort()
+    if pool is None:
+        typer.echo("No hosts; scripts run on this machine. Use `nyun hosts add`.")
+        return
+
+    table = Table(title="(Nyun) Hosts")
+    table.add_column("Host")
+    table.add_column("Address")
+    table.add_column("Jobs", justify="right")
+    table.add_column("Workspace")
+    table.add_column("Status")
+    hosts = list(pool.hosts)
+    errors = pool.check()
+    for host in hosts:
+        table.add_row(
+            host.name,
+            host.address,
+            str(host.max_jobs),
+            "synced" if host.is_remote else "shared",
+            (
+                f"[red]unreachable: {errors[host.name]}"
+                if host.name in errors
+                else f"[green]{pool.get_containers(host)} container(s) running"
+            ),
+        )
+    Console().print(table)
+
+
 @app.command(help="Show the version of the Nyun CLI.")
 def version():
     """
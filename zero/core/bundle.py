@@ -0,0 +1,448 @@
+"""
+This module provides image bundles, to provision nodes without registry access.
+A bundle is a single tar file holding the `docker save` archives of a set of images. Every file
+of the archives is stored once, as a blob named by the sha256 of its content, so layers shared
+between images are deduplicated. Blobs are gzip compressed in independent chunks on a thread
+pool while the archives stream out of the Docker daemon. Importing verifies the blob checksums,
+loads the images in parallel, and records its progress so an interrupted import resumes.
+
+Bundle layout:
+    blobs/<sha256>.gz   the compressed files of the image archives
+    manifest.json       the images, the members of their archives, and the blob checksums
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import tarfile
+import threading
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional
+
+from zero.core.constants import (
+    BUNDLE_CHUNK_SIZE,
+    BUNDLE_COMPRESSION_LEVEL,
+    BUNDLE_LOAD_JOBS,
+)
+
+logger = getLogger(__name__)
+
+BUNDLE_VERSION = 1
+BUNDLE_MANIFEST = "manifest.json"
+
+
+class BundleError(Exception):
+    pass
+
+
+class ChunkReader(io.RawIOBase):
+    # a read-only file object over an iterator of byte chunks, for streaming tar reads
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def iter_chunks(file: BinaryIO, size: Optional[int] = None) -> Iterator[bytes]:
+    # read a file, or the next `size` bytes of it, in chunks
+    while size is None or size > 0:
+        chunk = file.read(
+            BUNDLE_CHUNK_SIZE if size is None else min(size, BUNDLE_CHUNK_SIZE)
+        )
+        if not chunk:
+            return
+        if size is not None:
+            size -= len(chunk)
+        yield chunk
+
+
+def compress_stream(
+    chunks: Iterable[bytes],
+    output: BinaryIO,
+    executor: ThreadPoolExecutor,
+    window: int,
+) -> Dict[str, Any]:
+    """
+    Gzip compress a stream into a file, compressing up to `window` chunks at once.
+
+    Each chunk is compressed into its own gzip member; concatenated members form a valid gzip
+    stream. zlib releases the GIL, so the chunks are compressed in parallel.
+
+    Returns:
+        Dict[str, Any]: The sha256 and size of the uncompressed and of the compressed stream.
+    """
+    digest, compressed_digest = hashlib.sha256(), hashlib.sha256()
+    size = compressed_size = 0
+    in_flight = deque()
+
+    def write(future):
+        nonlocal compressed_size
+        data = future.result()
+        output.write(data)
+        compressed_digest.update(data)
+        compressed_size += len(data)
+
+    for chunk in chunks:
+        digest.update(chunk)
+        size += len(chunk)
+        in_flight.append(
+            executor.submit(
+                gzip.compress, chunk, compresslevel=BUNDLE_COMPRESSION_LEVEL, mtime=0
+            )
+        )
+        while len(in_flight) > window:
+            write(in_flight.popleft())
+    while in_flight:
+        write(in_flight.popleft())
+    return {
+        "digest": f"sha256:{digest.hexdigest()}",
+        "size": size,
+        "compressed_digest": f"sha256:{compressed_digest.hexdigest()}",
+        "compressed_size": compressed_size,
+    }
+
+
+def iter_decompressed(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    # decompress a stream of concatenated gzip members
+    decompressor = zlib.decompressobj(wbits=31)
+    for chunk in chunks:
+        while chunk:
+            yield decompressor.decompress(chunk)
+            if not decompressor.eof:
+                break
+            chunk = decompressor.unused_data
+            decompressor = zlib.decompressobj(wbits=31)
+
+
+def get_blob_name(digest: str) -> str:
+    return f"blobs/{digest.split(':')[-1]}.gz"
+
+
+def export_bundle(
+    client: "docker.DockerClient",
+    references: List[str],
+    bundle_path: Path,
+    on_progress: Optional[Callable[[str, int], None]] = None,
+    jobs: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Export local images into a bundle.
+
+    Args:
+        client (docker.DockerClient): The Docker client.
+        references (List[str]): The images to export.
+        bundle_path (Path): The bundle file to write.
+        on_progress (Callable[[str, int], None], optional): Called with an image and the number of its archive bytes processed.
+        jobs (int, optional): The number of compression threads. Defaults to the number of CPUs.
+
+    Returns:
+        Dict[str, int]: The archive bytes of the images, and the bytes stored in the bundle.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    bundle_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = bundle_path.with_name(f".{bundle_path.name}.tmp")
+    blobs: Dict[str, Dict[str, Any]] = {}
+    claimed = set()
+    lock = threading.Lock()
+    images = []
+
+    with tarfile.open(tmp_path, "w") as bundle, ThreadPoolExecutor(
+        jobs
+    ) as compressor:
+
+        def add_blob(part_path: Path, record: Dict[str, Any]):
+            # append a compressed blob to the bundle, unless an identical one is already in it
+            with lock:
+                if record["digest"] not in blobs:
+                    blobs[record["digest"]] = record
+                    info = tarfile.TarInfo(get_blob_name(record["digest"]))
+                    info.size = record["compressed_size"]
+                    with open(part_path, "rb") as part:
+                        bundle.addfile(info, part)
+            part_path.unlink()
+
+        def export_image(reference: str) -> Dict[str, Any]:
+            image_id = client.images.get(reference).id
+            members = []
+            processed = 0
+            archive = ChunkReader(client.api.get_image(reference, chunk_size=None))
+            with tarfile.open(fileobj=archive, mode="r|") as save:
+                for member in save:
+                    entry = {"name": member.name, "mode": member.mode, "mtime": member.mtime}
+                    if member.isdir():
+                        entry["type"] = "dir"
+                    elif member.issym() or member.islnk():
+                        entry["type"] = "symlink" if member.issym() else "link"
+                        entry["linkname"] = member.linkname
+                    elif member.isfile():
+                        entry.update(type="file", size=member.size)
+                        # in OCI layout archives, blobs are named by their digest and can be skipped unread
+                        known = (
+                            f"sha256:{member.name.rsplit('/', 1)[-1]}"
+                            if member.name.startswith("blobs/sha256/")
+                            else None
+                        )
+                        with lock:
+                            skip = known is not None and known in claimed
+                            if known is not None:
+                                claimed.add(known)
+                        if skip:
+                            entry["digest"] = known
+                        else:
+                            part_path = bundle_path.with_name(
+                                f".{bundle_path.name}.{uuid.uuid4().hex}.part"
+                            )
+                            with open(part_path, "wb") as part:
+                                record = compress_stream(
+                                    iter_chunks(save.extractfile(member)),
+                                    part,
+                                    compressor,
+                                    window=jobs * 2,
+                                )
+                            entry["digest"] = record["digest"]
+                            add_blob(part_path, record)
+                        processed += member.size
+                        if on_progress is not None:
+                            on_progress(reference, processed)
+                    else:
+                        continue
+                    members.append(entry)
+            return {"reference": reference, "id": image_id, "members": members}
+
+        # images are read from the daemon in parallel; their chunks share the compressor threads
+        with ThreadPoolExecutor(min(len(references), BUNDLE_LOAD_JOBS) or 1) as readers:
+            images = list(readers.map(export_image, references))
+
+        manifest = json.dumps(
+            {"version": BUNDLE_VERSION, "images": images, "blobs": blobs}, indent=2
+        ).encode()
+        info = tarfile.TarInfo(BUNDLE_MANIFEST)
+        info.size = len(manifest)
+        bundle.addfile(info, io.BytesIO(manifest))
+
+    os.replace(tmp_path, bundle_path)
+    return {
+        "size": sum(
+            member.get("size", 0) for image in images for member in image["members"]
+        ),
+        "stored": sum(blob["compressed_size"] for blob in blobs.values()),
+    }
+
+
+class BundleImportState:
+    # the blobs verified and the images loaded by an import, so an interrupted import resumes
+
+    def __init__(self, state_path: Path):
+        self.state_path = state_path
+        self.verified = set()
+        self.loaded = set()
+        self._lock = threading.Lock()
+        if state_path.exists():
+            try:
+                with open(state_path, "r") as file:
+                    state = json.load(file)
+                self.verified = set(state.get("verified", []))
+                self.loaded = set(state.get("loaded", []))
+            except Exception as e:
+                logger.error(f"Failed to read bundle import state {state_path}: {e}")
+
+    def save(self):
+        with self._lock:
+            tmp_path = self.state_path.with_suffix(".tmp")
+            with open(tmp_path, "w") as file:
+                json.dump(
+                    {"verified": sorted(self.verified), "loaded": sorted(self.loaded)},
+                    file,
+                )
+            os.replace(tmp_path, self.state_path)
+
+
+def iter_image_archive(
+    bundle_path: Path,
+    image: Dict[str, Any],
+    offsets: Dict[str, int],
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> Iterator[bytes]:
+    """
+    Rebuild the `docker save` archive of an image from a bundle, as a stream.
+    Each file is checked against its digest as it is decompressed.
+    """
+    processed = 0
+    with open(bundle_path, "rb") as bundle:
+        for entry in image["members"]:
+            info = tarfile.TarInfo(entry["name"])
+            info.mode = entry["mode"]
+            info.mtime = entry["mtime"]
+            if entry["type"] != "file":
+                info.type = {
+                    "dir": tarfile.DIRTYPE,
+                    "symlink": tarfile.SYMTYPE,
+                    "link": tarfile.LNKTYPE,
+                }[entry["type"]]
+                info.linkname = entry.get("linkname", "")
+                yield info.tobuf()
+                continue
+
+            info.size = entry["size"]
+            yield info.tobuf()
+            offset, size = offsets[get_blob_name(entry["digest"])]
+            bundle.seek(offset)
+            digest = hashlib.sha256()
+            for chunk in iter_decompressed(iter_chunks(bundle, size)):
+                digest.update(chunk)
+                processed += len(chunk)
+                yield chunk
+            if f"sha256:{digest.hexdigest()}" != entry["digest"]:
+                raise BundleError(f"{entry['name']} of {image['reference']} is corrupt.")
+            if info.size % tarfile.BLOCKSIZE:
+                yield tarfile.NUL * (tarfile.BLOCKSIZE - info.size % tarfile.BLOCKSIZE)
+            if on_progress is not None:
+                on_progress(processed)
+    yield tarfile.NUL * (tarfile.BLOCKSIZE * 2)
+
+
+def read_bundle(bundle_path: Path):
+    """
+    Read the manifest of a bundle and the offset and size of each of its members.
+    """
+    with tarfile.open(bundle_path, "r:") as bundle:
+        offsets = {
+            member.name: (member.offset_data, member.size)
+            for member in bundle.getmembers()
+        }
+        if BUNDLE_MANIFEST not in offsets:
+            raise BundleError(f"{bundle_path} is not a Nyun image bundle.")
+        manifest = json.load(bundle.extractfile(BUNDLE_MANIFEST))
+    if manifest.get("version") != BUNDLE_VERSION:
+        raise BundleError(f"Unsupported bundle version {manifest.get('version')}.")
+    return manifest, offsets
+
+
+def import_bundle(
+    client: "docker.DockerClient",
+    bundle_path: Path,
+    state_path: Optional[Path] = None,
+    on_progress: Optional[Callable[[str, int], None]] = None,
+    on_loaded: Optional[Callable[[str], None]] = None,
+    jobs: int = BUNDLE_LOAD_JOBS,
+) -> Dict[str, List[str]]:
+    """
+    Import the images of a bundle into the Docker daemon.
+
+    The checksums of the compressed blobs are verified first, in parallel, so a truncated or
+    corrupt bundle is reported before anything is loaded. The images are then loaded in
+    parallel. Verified blobs and loaded images are recorded in the state file, so running the
+    import again resumes where it stopped.
+
+    Args:
+        client (docker.DockerClient): The Docker client.
+        bundle_path (Path): The bundle file.
+        state_path (Path, optional): The import state file. Defaults to "<bundle>.state.json" next to the bundle.
+        on_progress (Callable[[str, int], None], optional): Called with an image and the number of its archive bytes loaded.
+        on_loaded (Callable[[str], None], optional): Called with each image once it is loaded.
+        jobs (int): The number of images to load at once.
+
+    Returns:
+        Dict[str, List[str]]: The images loaded and the images skipped as already present.
+
+    Raises:
+        BundleError: If the bundle is corrupt or an image fails to load.
+    """
+    manifest, offsets = read_bundle(bundle_path)
+    state = BundleImportState(
+        state_path or bundle_path.with_name(f"{bundle_path.name}.state.json")
+    )
+
+    def verify(item) -> Optional[str]:
+        digest, blob = item
+        offset, size = offsets.get(get_blob_name(digest), (None, None))
+        if offset is None or size != blob["compressed_size"]:
+            return digest
+        checksum = hashlib.sha256()
+        with open(bundle_path, "rb") as bundle:
+            bundle.seek(offset)
+            for chunk in iter_chunks(bundle, size):
+                checksum.update(chunk)
+        if f"sha256:{checksum.hexdigest()}" != blob["compressed_digest"]:
+            return digest
+        with state._lock:
+            state.verified.add(digest)
+        return None
+
+    pending = [
+        item for item in manifest["blobs"].items() if item[0] not in state.verified
+    ]
+    with ThreadPoolExecutor(os.cpu_count()) as executor:
+        corrupt = [digest for digest in executor.map(verify, pending) if digest]
+    state.save()
+    if corrupt:
+        raise BundleError(
+            f"{len(corrupt)} blob(s) of {bundle_path} are missing or corrupt: {', '.join(corrupt[:3])}"
+        )
+
+    def is_present(image: Dict[str, Any]) -> bool:
+        try:
+            return client.images.get(image["reference"]).id == image["id"]
+        except Exception:
+            return False
+
+    def load(image: Dict[str, Any]) -> bool:
+        reference = image["reference"]
+        if reference in state.loaded and is_present(image):
+            return False
+        if is_present(image):
+            state.loaded.add(reference)
+            state.save()
+            return False
+        archive = iter_image_archive(
+            bundle_path,
+            image,
+            offsets,
+            on_progress=(lambda processed: on_progress(reference, processed))
+            if on_progress is not None
+            else None,
+        )
+        for message in client.api.load_image(archive):
+            if "error" in message:
+                raise BundleError(f"Failed to load {reference}: {message['error']}")
+        state.loaded.add(reference)
+        state.save()
+        if on_loaded is not None:
+            on_loaded(reference)
+        return True
+
+    with ThreadPoolExecutor(jobs) as executor:
+        results = list(executor.map(load, manifest["images"]))
+    return {
+        "loaded": [
+            image["reference"]
+            for image, loaded in zip(manifest["images"], results)
+            if loaded
+        ],
+        "skipped": [
+            image["reference"]
+            for image, loaded in zip(manifest["images"], results)
+            if not loaded
+        ],
+    }
@@ -5,6 +5,10 @@ try:
 except ImportError:
     from strenum import StrEnum
 
+import hashlib
+import os
+import tempfile
+from datetime import datetime
 from pathlib import Path
 from typing import Union, Dict, Optional
 
@@ -115,6 +119,7 @@ class WorkspaceSpec(StrEnum):
     CUSTOM_DATA = "CustomData"
     LOGS = "Logs"
     EXTENSIONS = "Extensions"
+    HOSTS = "Hosts"
 
     PATH = "path"
 
@@ -123,6 +128,17 @@ class WorkspaceSpec(StrEnum):
     WORKSPACE_SPEC = "workspace.spec"
     LOG_FILE = "zero.log"
     ENV = ".env"
+    IMAGE_INDEX = "images.json"
+    RUN_LOGS = "logs"
+    SCRIPT_CACHE = "scripts.json"
+    RESULTS = "results"
+    JOB_QUEUE = "queue.db"
+    DAEMON_SOCKET = "nyun.sock"
+    STAGING = "staging"
+    TIMINGS = "timings.jsonl"
+    RUNS = "runs"
+    SWEEPS = "sweeps"
+    PIPELINES = "pipelines"
 
     @staticmethod
     def get_workspace_spec_path(workspace_path: Path):
@@ -136,6 +152,62 @@ class WorkspaceSpec(StrEnum):
     def get_log_file_path(workspace_path: Path):
         return workspace_path / WorkspaceSpec.NYUN / WorkspaceSpec.LOG_FILE
 
+    @staticmethod
+    def get_image_index_path(workspace_path: Path):
+        return workspace_path / WorkspaceSpec.NYUN / WorkspaceSpec.IMAGE_INDEX
+
+    @staticmethod
+    def get_script_cache_path(workspace_path: Path):
+        return workspace_path / WorkspaceSpec.NYUN / WorkspaceSpec.SCRIPT_CACHE
+
+    @staticmethod
+    def get_results_dir(workspace_path: Path):
+        return workspace_path / WorkspaceSpec.NYUN / WorkspaceSpec.RESULTS
+
+    @staticmethod
+    def get_staging_dir(workspace_path: Path):
+        return workspace_path / WorkspaceSpec.NYUN / WorkspaceSpec.STAGING
+
+    @staticmethod
+    def get_timings_path(workspace_path: Path):
+        return workspace_path / WorkspaceSpec.NYUN / WorkspaceSpec.TIMINGS
+
+    @staticmethod
+    def get_runs_dir(workspace_path: Path):
+        return workspace_path / WorkspaceSpec.NYUN / WorkspaceSpec.RUNS
+
+    @staticmethod
+    def get_sweeps_dir(workspace_path: Path):
+        return workspace_path / WorkspaceSpec.NYUN / WorkspaceSpec.SWEEPS
+
+    @staticmethod
+    def get_pipelines_dir(workspace_path: Path):
+        return workspace_path / WorkspaceSpec.NYUN / WorkspaceSpec.PIPELINES
+
+    @staticmethod
+    def get_job_queue_path(workspace_path: Path):
+        return workspace_path / WorkspaceSpec.NYUN / WorkspaceSpec.JOB_QUEUE
+
+    @staticmethod
+    def get_daemon_socket_path(workspace_path: Path):
+        socket_path = workspace_path / WorkspaceSpec.NYUN / WorkspaceSpec.DAEMON_SOCKET
+        if len(str(socket_path)) < UNIX_SOCKET_PATH_MAX:
+            return socket_path
+        # unix socket paths are length limited; fall back to a per-workspace path in the temp dir
+        digest = hashlib.sha256(str(workspace_path).encode()).hexdigest()[:16]
+        return Path(tempfile.gettempdir()) / f"nyun-{digest}.sock"
+
+    @staticmethod
+    def get_run_log_path(workspace_path: Path, script_path: Path):
+        # a new log file per run: .nyunservices/logs/<script>-<timestamp>.log
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        return (
+            workspace_path
+            / WorkspaceSpec.NYUN
+            / WorkspaceSpec.RUN_LOGS
+            / f"{script_path.stem}-{timestamp}.log"
+        )
+
     @staticmethod
     def get_env_file_path(workspace_path: Optional[Path]):
         env_path = workspace_path / WorkspaceSpec.ENV
@@ -236,6 +308,79 @@ class YamlKeys(StrEnum):
     # adapt
     TASK = "TASK"
 
+    # outputs (a path under the workspace mount, DockerPath.USER_DATA)
+    OUTPUT_PATH = "OUTPUT_PATH"
+
+    # resources requested by the job (see ResourceKeys)
+    RESOURCES = "RESOURCES"
+
+
+class ResourceKeys(StrEnum):
+    CPUS = "cpus"
+    MEMORY = "memory"
+    GPUS = "gpus"
+    GPU_IDS = "gpu_ids"
+
+
+# docker client
+DOCKER_LOGIN_TTL_SECONDS = 30 * 60
+DOCKER_MAX_POOL_SIZE = 32
+DOCKER_API_VERSION = "v1.41"
+DOCKER_DEFAULT_SOCKET = "/var/run/docker.sock"
+DOCKER_REGISTRY = "https://index.docker.io/v1/"
+
+# image pulls
+PULL_STALL_SECONDS = 120  # abort and retry a pull whose layers made no progress for this long
+PULL_MAX_RETRIES = 3
+DOCKER_HUB_REGISTRY = "https://registry-1.docker.io"
+REGISTRY_TIMEOUT_SECONDS = 15
+
+# custom data staging
+DATA_CACHE_DIR = (
+    Path(os.getenv("XDG_CACHE_HOME", Path.home() / ".cache")) / "nyun" / "data"
+)
+DATA_VOLUME_PREFIX = "nyun-data-"
+DATA_STAGING_JOBS = 8
+DATA_ARCHIVE_SPOOL_BYTES = 64 * 1024 * 1024  # archives sent to other docker hosts spill to disk beyond this
+
+# docker hosts
+LOCAL_HOST = "local"  # the address of the docker daemon of this machine
+HOST_SHARED = "shared"  # the workspace is at the same path on the host (e.g. on NFS)
+HOST_JOBS = "jobs="  # the number of jobs the host runs at once
+
+# image bundles
+BUNDLE_CHUNK_SIZE = 8 * 1024 * 1024  # compressed independently, in parallel
+BUNDLE_COMPRESSION_LEVEL = 6
+BUNDLE_LOAD_JOBS = 4
+
+# image index
+IMAGE_INDEX_FRESH_SECONDS = 5 * 60  # trust the index without asking the daemon
+IMAGE_INDEX_TTL_SECONDS = 24 * 60 * 60  # rebuild the index from a bulk listing
+IMAGE_INDEX_INVALIDATING_EVENTS = {"pull", "load", "import", "tag", "untag", "delete"}
+
+# script cache
+SCRIPT_CACHE_MAX_ENTRIES = 1024
+
+# result cache
+RESULT_CACHE_MAX_BYTES = 100 * 1024**3
+
+# daemon
+DAEMON_POLL_SECONDS = 5
+UNIX_SOCKET_PATH_MAX = 104
+
+# warm pool
+WARM_POOL_IDLE_TIMEOUT_SECONDS = 10 * 60
+WARM_POOL_MAX_JOBS_PER_WORKER = 20
+WARM_POOL_LABEL = "ai.nyun.warm-worker"
+
+# containers of a script are labelled with its run directory, so they can be found and stopped
+RUN_LABEL = "ai.nyun.run"
+
+# watch mode
+WATCH_POLL_SECONDS = 0.2
+WATCH_DEBOUNCE_SECONDS = 0.3  # a change is acted on once the file was not written for this long
+WATCH_CANCEL_POLL_SECONDS = 0.5
+
 
 class DockerPath(Enum):
 
@@ -272,11 +417,75 @@ class DockerPath(Enum):
 class DockerCommand(StrEnum):
 
     RUN = "python run_dist.py --yaml_path {script_path}"
+    # keeps a warm worker container alive until it is stopped
+    IDLE = "sh -c 'mkdir -p {scripts_path} && exec tail -f /dev/null'"
 
     @staticmethod
     def get_run_command(script_path: Union[Path, str]):
         return DockerCommand.RUN.format(script_path=script_path)
 
+    @staticmethod
+    def get_idle_command(scripts_path: Union[Path, str]):
+        return DockerCommand.IDLE.format(scripts_path=scripts_path)
+
+
+# ==============================================================
+#                       Job Constants
+# ==============================================================
+
+
+class DataStaging(StrEnum):
+    # how the custom data directory is made available to containers
+    BIND = "bind"  # bind mount the directory itself
+    CACHE = "cache"  # sync it into a local cache directory and bind mount that
+    VOLUME = "volume"  # sync it into a named docker volume and mount that
+
+
+class JobStatus(StrEnum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+    INTERRUPTED = "interrupted"
+    CANCELLED = "cancelled"
+
+
+class SweepMode(StrEnum):
+    GRID = "grid"  # every combination of the parameter values
+    RANDOM = "random"  # SAMPLES random draws of the parameter values
+
+
+class SweepKeys(StrEnum):
+    MODE = "MODE"
+    SAMPLES = "SAMPLES"
+    SEED = "SEED"
+    # a mapping of (dotted) script keys to a list of values, or to a {min, max, log} range
+    PARAMETERS = "PARAMETERS"
+    # the metrics to collect from the JSON files under each variant's OUTPUT_PATH; all if not set
+    METRICS = "METRICS"
+
+
+SWEEP_METRICS_MAX_BYTES = 10 * 1024**2
+
+
+class PipelineKeys(StrEnum):
+    # a mapping of stage names to stages
+    STAGES = "STAGES"
+    # the script a stage runs
+    SCRIPT = "SCRIPT"
+    # the files and directories a stage reads and writes, relative to the workspace
+    INPUTS = "INPUTS"
+    OUTPUTS = "OUTPUTS"
+    # the stages a stage runs after, besides the ones writing its inputs
+    DEPENDS_ON = "DEPENDS_ON"
+
+
+class RunEnv(StrEnum):
+    # tell run_dist.py where to write the checkpoints of a run, and which one to resume from
+    CHECKPOINT_DIR = "NYUN_CHECKPOINT_DIR"
+    RESUME_FROM = "NYUN_RESUME_FROM"
+
 
 NYUN_ENV_KEY_PREFIX = "NYUN_"
 EMPTY_STRING = ""
@@ -0,0 +1,406 @@
+"""
+This module provides a local job daemon for a Nyun workspace.
+The daemon keeps the workspace, extension registry and Docker client loaded, accepts job
+submissions over a Unix socket, persists its queue in SQLite (".nyunservices/queue.db") and
+dispatches the queued jobs with a bounded concurrency. Queued jobs survive restarts.
+"""
+
+import fcntl
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+from contextlib import nullcontext
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from zero.core.constants import JobStatus, WorkspaceSpec, DAEMON_POLL_SECONDS
+
+logger = getLogger(__name__)
+
+
+class JobQueue:
+    """
+    A persistent queue of jobs stored in SQLite.
+
+    Args:
+        db_path (Path): The SQLite database file.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    script TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    exit_code INTEGER,
+                    error TEXT,
+                    log_path TEXT,
+                    submitted_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def submit(self, scripts: List[str]) -> List[int]:
+        with self._lock, self._connect() as connection:
+            return [
+                connection.execute(
+                    "INSERT INTO jobs (script, status, submitted_at) VALUES (?, ?, ?)",
+                    (script, JobStatus.QUEUED, time.time()),
+                ).lastrowid
+                for script in scripts
+            ]
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        # atomically take the oldest queued job
+        with self._lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1",
+                (JobStatus.QUEUED,),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                (JobStatus.RUNNING, time.time(), row["id"]),
+            )
+            return dict(row)
+
+    def update(self, job_id: int, **fields):
+        columns = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock, self._connect() as connection:
+            connection.execute(
+                f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id)
+            )
+
+    def requeue_running(self) -> int:
+        # jobs left running by a previous daemon did not finish; run them again
+        with self._lock, self._connect() as connection:
+            return connection.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+                (JobStatus.QUEUED, JobStatus.RUNNING),
+            ).rowcount
+
+    def list(
+        self, limit: int = 50, ids: Optional[List[int]] = None
+    ) -> List[Dict[str, Any]]:
+        with self._connect() as connection:
+            if ids:
+                rows = connection.execute(
+                    f"SELECT * FROM jobs WHERE id IN ({', '.join('?' * len(ids))}) ORDER BY id",
+                    ids,
+                )
+            else:
+                rows = connection.execute(
+                    "SELECT * FROM (SELECT * FROM jobs ORDER BY id DESC LIMIT ?) ORDER BY id",
+                    (limit,),
+                )
+            return [dict(row) for row in rows]
+
+
+class NyunDaemon:
+    """
+    A long-running job daemon for a workspace.
+
+    Args:
+        workspace (Workspace): The workspace object.
+        max_jobs (int): The maximum number of jobs to run at once.
+    """
+
+    def __init__(self, workspace: "Workspace", max_jobs: int = 1):
+        from zero.core.results import ResultCache
+        from zero.core.scripts import ScriptCache
+        from zero.core.utils import get_docker_client
+
+        self.workspace = workspace
+        self.max_jobs = max_jobs
+        self.socket_path = WorkspaceSpec.get_daemon_socket_path(
+            workspace.workspace_path
+        )
+        self.queue = JobQueue(WorkspaceSpec.get_job_queue_path(workspace.workspace_path))
+        self.ext_obj = workspace.init_extension(install=False)
+        self.script_cache = ScriptCache.for_workspace(workspace.workspace_path)
+        self.result_cache = ResultCache.for_workspace(workspace.workspace_path)
+        # created once a job requests resources, see `get_placement_engine`
+        self._placement_engine: Optional["PlacementEngine"] = None
+        self._placement_lock = threading.Lock()
+        # warm up the shared Docker client (and its login) once
+        get_docker_client()
+
+        self._wakeup = threading.Condition()
+        self._stopped = threading.Event()
+        # set when stopping now: running jobs are killed and queued again
+        self._killed = threading.Event()
+        self._workers: List[threading.Thread] = []
+        self._server: Optional[socketserver.ThreadingUnixStreamServer] = None
+        # the run directories of the running jobs, by job id
+        self._running: Dict[int, "RunDirectory"] = {}
+        self._running_lock = threading.Lock()
+        self._lock_file = None
+
+    def get_placement_engine(self) -> "PlacementEngine":
+        # the engine reads the CPUs and GPUs of this machine, which only jobs requesting
+        # resources need
+        from zero.core.resources import PlacementEngine
+
+        with self._placement_lock:
+            if self._placement_engine is None:
+                self._placement_engine = PlacementEngine()
+            return self._placement_engine
+
+    def submit(self, scripts: List[str]) -> Dict[str, Any]:
+        from zero.core.resources import ResourceRequest
+        from zero.core.scripts import load_script
+
+        # validate and resolve the scripts, and their resource requests, before queueing them
+        file_paths = [Path(script) for script in scripts]
+        _, errors = self.ext_obj.resolve_all(file_paths, cache=self.script_cache)
+        for file_path in file_paths:
+            if file_path in errors:
+                continue
+            try:
+                request = ResourceRequest.from_script(
+                    load_script(file_path, cache=self.script_cache)
+                )
+                if not request.is_empty():
+                    self.get_placement_engine().validate(request)
+            except ValueError as e:
+                errors[file_path] = e
+        self.script_cache.save()
+        if errors:
+            return {
+                "ok": False,
+                "errors": {str(path): str(error) for path, error in errors.items()},
+            }
+        ids = self.queue.submit([str(path) for path in file_paths])
+        with self._wakeup:
+            self._wakeup.notify_all()
+        return {"ok": True, "ids": ids}
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid(), "max_jobs": self.max_jobs}
+        if op == "submit":
+            return self.submit(request.get("scripts", []))
+        if op == "list":
+            return {
+                "ok": True,
+                "jobs": self.queue.list(
+                    limit=request.get("limit", 50), ids=request.get("ids")
+                ),
+            }
+        return {"ok": False, "error": f"Unknown operation: {op}"}
+
+    def serve_forever(self):
+        # own the queue before touching it: the jobs another daemon runs are not left over
+        self._acquire_lock()
+        self._prepare_socket()
+        requeued = self.queue.requeue_running()
+        if requeued:
+            logger.info(f"Re-queued {requeued} job(s) left running by a previous daemon.")
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    request = json.loads(self.rfile.readline())
+                    response = daemon.handle(request)
+                except Exception as e:
+                    logger.exception(f"Failed to handle request: {e}")
+                    response = {"ok": False, "error": str(e)}
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+
+        self._server = socketserver.ThreadingUnixStreamServer(
+            str(self.socket_path), Handler
+        )
+        self._server.daemon_threads = True
+        for index in range(self.max_jobs):
+            worker = threading.Thread(
+                target=self._dispatch, name=f"nyun-worker-{index}"
+            )
+            worker.start()
+            self._workers.append(worker)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self.socket_path.unlink(missing_ok=True)
+
+    def shutdown(self, wait: bool = True):
+        # stop accepting jobs; running jobs finish unless the process is interrupted again
+        self._stopped.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        if self._server is not None:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def kill(self):
+        # stop now: kill the containers of the running jobs, which are queued again
+        from zero.core.utils import kill_docker_containers
+
+        self._killed.set()
+        self.shutdown(wait=False)
+        with self._running_lock:
+            runs = list(self._running.values())
+        for run in runs:
+            try:
+                kill_docker_containers(run.get_labels())
+            except Exception as e:
+                logger.error(f"Failed to kill the containers of {run.script}: {e}")
+        for worker in self._workers:
+            worker.join()
+
+    def _acquire_lock(self):
+        # one daemon per workspace queue; the lock is held until the process exits
+        lock_path = self.queue.db_path.with_suffix(".lock")
+        lock_file = open(lock_path, "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise RuntimeError(
+                f"A Nyun daemon is already running for {self.workspace.workspace_path}."
+            )
+        self._lock_file = lock_file
+
+    def _prepare_socket(self):
+        if self.socket_path.exists():
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(str(self.socket_path))
+                raise RuntimeError(
+                    f"A Nyun daemon is already running on {self.socket_path}."
+                )
+            except (ConnectionRefusedError, FileNotFoundError):
+                self.socket_path.unlink(missing_ok=True)
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _dispatch(self):
+        while not self._stopped.is_set():
+            job = self.queue.claim()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(DAEMON_POLL_SECONDS)
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]):
+        from zero.core.resources import ResourceRequest
+        from zero.core.runs import RunDirectory
+        from zero.core.scripts import load_script
+
+        file_path = Path(job["script"])
+        log_file_path = WorkspaceSpec.get_run_log_path(
+            self.workspace.workspace_path, file_path
+        )
+        self.queue.update(job["id"], log_path=str(log_file_path))
+        try:
+            metadata = self.ext_obj.resolve(file_path, cache=self.script_cache)
+            self.ext_obj.ensure_images(metadata, index=self.workspace.image_index)
+            data = load_script(file_path, cache=self.script_cache)
+            request = ResourceRequest.from_script(data)
+
+            def execute() -> int:
+                # wait until the job's resources are free, and run it on them
+                placement_context = (
+                    nullcontext()
+                    if request.is_empty()
+                    else self.get_placement_engine().allocate(request)
+                )
+                with placement_context as placement:
+                    if self._killed.is_set():
+                        return -1
+                    run = RunDirectory(self.workspace.workspace_path, file_path)
+                    run.prepare(resume=False)
+                    run.start(metadata, log_file_path=log_file_path)
+                    with self._running_lock:
+                        self._running[job["id"]] = run
+                    try:
+                        exit_code = self.ext_obj.execute(
+                            file_path=file_path,
+                            workspace=self.workspace,
+                            metadata=metadata,
+                            log_file_path=log_file_path,
+                            placement=placement,
+                            run=run,
+                        )
+                    except BaseException:
+                        run.finish(JobStatus.FAILED)
+                        raise
+                    finally:
+                        with self._running_lock:
+                            self._running.pop(job["id"], None)
+                    if self._killed.is_set():
+                        run.finish(JobStatus.INTERRUPTED, exit_code)
+                    else:
+                        run.finish(
+                            JobStatus.SUCCEEDED if exit_code == 0 else JobStatus.FAILED,
+                            exit_code,
+                        )
+                    return exit_code
+
+            exit_code, _ = self.result_cache.run(
+                file_path=file_path,
+                workspace=self.workspace,
+                metadata=metadata,
+                data=data,
+                job=execute,
+            )
+            if self._killed.is_set():
+                self.queue.update(job["id"], status=JobStatus.QUEUED, started_at=None)
+                return
+            status = JobStatus.SUCCEEDED if exit_code == 0 else JobStatus.FAILED
+            self.queue.update(
+                job["id"], status=status, exit_code=exit_code, finished_at=time.time()
+            )
+        except Exception as e:
+            if self._killed.is_set():
+                self.queue.update(job["id"], status=JobStatus.QUEUED, started_at=None)
+                return
+            logger.exception(f"Job {job['id']} ({file_path}) failed: {e}")
+            self.queue.update(
+                job["id"],
+                status=JobStatus.FAILED,
+                error=str(e.__cause__ or e),
+                finished_at=time.time(),
+            )
+
+
+def send_request(socket_path: Path, request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Send a request to the Nyun daemon and return its response.
+
+    Raises:
+        ConnectionError: If the daemon is not running.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(socket_path))
+            client.sendall(json.dumps(request).encode() + b"\n")
+            response = client.makefile("rb").readline()
+    except (ConnectionRefusedError, FileNotFoundError) as e:
+        raise ConnectionError(
+            "Nyun daemon is not running. Start it with `nyun serve`."
+        ) from e
+    return json.loads(response)
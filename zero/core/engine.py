@@ -0,0 +1,434 @@
+"""
+This module provides an asyncio Docker engine.
+It talks to the Docker Engine API over the daemon's Unix socket, so image pulls, container
+lifecycle calls, log streams and waits of many jobs are multiplexed on one event loop instead
+of each holding an OS thread blocked on a socket. `DockerEngine` runs the engine on a
+background event loop for the synchronous CLI code.
+"""
+
+import asyncio
+import base64
+import json
+import os
+import shlex
+import struct
+import threading
+from concurrent.futures import Future
+from logging import getLogger
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+from zero.core.timings import span
+from zero.core.constants import (
+    DOCKER_API_VERSION,
+    DOCKER_DEFAULT_SOCKET,
+    DOCKER_REGISTRY,
+)
+
+logger = getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class DockerEngineError(Exception):
+    # an error response of the Docker Engine API
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{message} (HTTP {status})")
+        self.status = status
+        self.message = message
+
+
+def get_docker_socket_path() -> Optional[Path]:
+    """
+    Get the Unix socket of the Docker daemon, from DOCKER_HOST or the default location.
+
+    Returns:
+        Optional[Path]: The socket path, or None if the daemon is not reachable over a local Unix socket.
+    """
+    host = os.getenv("DOCKER_HOST")
+    if host and not host.startswith("unix://"):
+        return None
+    socket_path = Path(host[len("unix://") :] if host else DOCKER_DEFAULT_SOCKET)
+    return socket_path if socket_path.exists() else None
+
+
+def get_registry_auth() -> Optional[str]:
+    # the X-Registry-Auth header for the credentials `get_docker_client` logs in with
+    username = os.getenv("DOCKER_USERNAME")
+    if not username:
+        return None
+    auth = {
+        "username": username,
+        "password": os.getenv("DOCKER_ACCESS_TOKEN"),
+        "serveraddress": DOCKER_REGISTRY,
+    }
+    return base64.urlsafe_b64encode(json.dumps(auth).encode()).decode()
+
+
+def get_container_body(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Translate the `client.containers.run` keyword arguments of `get_container_config` into a
+    Docker Engine API container create body.
+    """
+    command = config["command"]
+    host_config = {
+        "Mounts": list(config.get("mounts") or []),
+        "DeviceRequests": list(config.get("device_requests") or []),
+    }
+    if config.get("nano_cpus") is not None:
+        host_config["NanoCpus"] = config["nano_cpus"]
+    if config.get("cpuset_cpus") is not None:
+        host_config["CpusetCpus"] = config["cpuset_cpus"]
+    if config.get("mem_limit") is not None:
+        host_config["Memory"] = config["mem_limit"]
+    return {
+        "Image": config["image"],
+        "Cmd": shlex.split(command) if isinstance(command, str) else command,
+        "WorkingDir": config.get("working_dir"),
+        "Env": [
+            f"{key}={value}" for key, value in (config.get("environment") or {}).items()
+        ],
+        "Labels": config.get("labels") or {},
+        "HostConfig": host_config,
+    }
+
+
+class AsyncDockerEngine:
+    """
+    A minimal asyncio client of the Docker Engine API over a Unix socket.
+
+    Each call opens its own connection to the socket, so any number of calls and streams can
+    be in flight at once.
+
+    Args:
+        socket_path (Path): The Unix socket of the Docker daemon.
+        api_version (str): The Docker Engine API version to use.
+    """
+
+    def __init__(self, socket_path: Path, api_version: str = DOCKER_API_VERSION):
+        self.socket_path = socket_path
+        self.api_version = api_version
+
+    async def _open(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        body: Optional[Any] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, int, Dict[str, str]]:
+        reader, writer = await asyncio.open_unix_connection(str(self.socket_path))
+        target = f"/{self.api_version}{path}"
+        if params:
+            target += "?" + urlencode(params)
+        data = json.dumps(body).encode() if body is not None else b""
+        lines = [
+            f"{method} {target} HTTP/1.1",
+            "Host: docker",
+            "Connection: close",
+            "Content-Type: application/json",
+            f"Content-Length: {len(data)}",
+        ]
+        lines.extend(f"{key}: {value}" for key, value in (headers or {}).items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + data)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            writer.close()
+            raise DockerEngineError(0, f"Malformed response: {status_line!r}")
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            response_headers[key.strip().lower()] = value.strip()
+        return reader, writer, status, response_headers
+
+    @staticmethod
+    async def _read_body(
+        reader: asyncio.StreamReader, headers: Dict[str, str]
+    ) -> AsyncIterator[bytes]:
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    await reader.readline()
+                    return
+                yield await reader.readexactly(size)
+                await reader.readline()
+        elif "content-length" in headers:
+            remaining = int(headers["content-length"])
+            while remaining > 0:
+                chunk = await reader.read(min(remaining, STREAM_CHUNK_SIZE))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            while True:
+                chunk = await reader.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    async def stream(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        body: Optional[Any] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        Make a request and yield the response body as it arrives.
+
+        Raises:
+            DockerEngineError: If the daemon responds with an error.
+        """
+        reader, writer, status, response_headers = await self._open(
+            method, path, params, body, headers
+        )
+        try:
+            if status >= 400:
+                content = b"".join(
+                    [chunk async for chunk in self._read_body(reader, response_headers)]
+                )
+                try:
+                    message = json.loads(content)["message"]
+                except Exception:
+                    message = content.decode(errors="replace").strip()
+                raise DockerEngineError(status, message)
+            async for chunk in self._read_body(reader, response_headers):
+                yield chunk
+        finally:
+            writer.close()
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        body: Optional[Any] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Any:
+        """
+        Make a request and return its decoded JSON response, if any.
+
+        Raises:
+            DockerEngineError: If the daemon responds with an error.
+        """
+        content = b"".join(
+            [
+                chunk
+                async for chunk in self.stream(method, path, params, body, headers)
+            ]
+        )
+        return json.loads(content) if content.strip() else None
+
+    async def ping(self) -> bool:
+        try:
+            async for _ in self.stream("GET", "/_ping"):
+                pass
+            return True
+        except (OSError, DockerEngineError):
+            return False
+
+    async def pull(
+        self,
+        repository: str,
+        tag: str,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        """
+        Pull an image, passing each progress message of the daemon to `on_progress`.
+
+        Raises:
+            DockerEngineError: If the pull fails.
+        """
+        auth = get_registry_auth()
+        buffer = b""
+        async for chunk in self.stream(
+            "POST",
+            "/images/create",
+            params={"fromImage": repository, "tag": tag},
+            headers={"X-Registry-Auth": auth} if auth else None,
+        ):
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if not line.strip():
+                    continue
+                message = json.loads(line)
+                if "error" in message:
+                    raise DockerEngineError(500, message["error"])
+                if on_progress is not None:
+                    on_progress(message)
+
+    async def inspect_image(self, reference: str) -> Dict[str, Any]:
+        return await self.request("GET", f"/images/{quote(reference, safe='')}/json")
+
+    async def create_container(self, config: Dict[str, Any]) -> str:
+        response = await self.request(
+            "POST", "/containers/create", body=get_container_body(config)
+        )
+        return response["Id"]
+
+    async def start_container(self, container_id: str):
+        await self.request("POST", f"/containers/{container_id}/start")
+
+    async def wait_container(self, container_id: str) -> int:
+        response = await self.request("POST", f"/containers/{container_id}/wait")
+        return response.get("StatusCode", -1)
+
+    async def remove_container(self, container_id: str, force: bool = True):
+        try:
+            await self.request(
+                "DELETE", f"/containers/{container_id}", params={"force": int(force)}
+            )
+        except DockerEngineError as e:
+            if e.status != 404:
+                raise
+
+    async def logs(self, container_id: str, follow: bool = True) -> AsyncIterator[bytes]:
+        """
+        Yield the output of a container (created without a TTY), demultiplexing stdout and stderr.
+        """
+        buffer = b""
+        async for chunk in self.stream(
+            "GET",
+            f"/containers/{container_id}/logs",
+            params={"follow": int(follow), "stdout": 1, "stderr": 1},
+        ):
+            buffer += chunk
+            while len(buffer) >= 8:
+                _, size = struct.unpack(">BxxxL", buffer[:8])
+                if len(buffer) < 8 + size:
+                    break
+                yield buffer[8 : 8 + size]
+                buffer = buffer[8 + size :]
+
+    async def run_container(
+        self,
+        config: Dict[str, Any],
+        log_file_path: Optional[Path] = None,
+        echo: bool = False,
+    ) -> int:
+        """
+        Run a container to completion, streaming its output, and remove it.
+
+        Args:
+            config (Dict[str, Any]): The container config from `get_container_config`.
+            log_file_path (Path, optional): The file to append the container output to.
+            echo (bool): Whether to also write the container output to the terminal.
+
+        Returns:
+            int: The exit code of the container.
+        """
+        from zero.core.utils import OutputWriter
+
+        with span("container.create", image=config["image"]):
+            container_id = await self.create_container(config)
+        try:
+            # the devices (GPUs) of the container are attached when it starts
+            with span("container.start"):
+                await self.start_container(container_id)
+
+            async def write_logs():
+                with OutputWriter(log_file_path=log_file_path, echo=echo) as writer:
+                    async for chunk in self.logs(container_id):
+                        writer.write(chunk)
+
+            with span("container.run"):
+                _, exit_code = await asyncio.gather(
+                    write_logs(), self.wait_container(container_id)
+                )
+            if exit_code != 0:
+                logger.error(
+                    f"Container {container_id[:12]} exited with code {exit_code}."
+                    + (f" Logs: {log_file_path}" if log_file_path else "")
+                )
+            return exit_code
+        finally:
+            try:
+                with span("container.remove"):
+                    await self.remove_container(container_id)
+            except Exception as e:
+                logger.error(f"Container {container_id[:12]} failed to remove: {e}")
+
+
+class DockerEngine:
+    """
+    Run an `AsyncDockerEngine` on a background event loop, for synchronous callers.
+
+    Calls from any number of threads are multiplexed on the one event loop; the calling
+    thread only waits on a future.
+
+    Args:
+        engine (AsyncDockerEngine): The engine to run.
+    """
+
+    def __init__(self, engine: AsyncDockerEngine):
+        self.engine = engine
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="nyun-docker-engine", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, coroutine: Coroutine) -> Future:
+        # schedule a coroutine on the engine's event loop
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def call(self, coroutine: Coroutine) -> Any:
+        # run a coroutine on the engine's event loop and wait for its result
+        future = self.submit(coroutine)
+        try:
+            return future.result()
+        except KeyboardInterrupt:
+            # only reached in the main thread; cancelling runs the coroutine's cleanup, e.g.
+            # removing its container (see `cancel` for the calls of other threads)
+            future.cancel()
+            raise
+
+    def cancel(self):
+        """
+        Cancel every call in flight on the engine's event loop, and wait until their cleanup ran,
+        e.g. their containers were removed.
+
+        The threads waiting for the calls are not interrupted by Ctrl+C, only the main thread is,
+        so it cancels the calls through the event loop; the waiting threads then see them cancelled.
+        """
+
+        async def cancel_tasks():
+            tasks = [
+                task for task in asyncio.all_tasks() if task is not asyncio.current_task()
+            ]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.call(cancel_tasks())
+
+    def pull(self, repository: str, tag: str) -> Future:
+        return self.submit(self.engine.pull(repository, tag))
+
+    def run_container(
+        self,
+        config: Dict[str, Any],
+        log_file_path: Optional[Path] = None,
+        echo: bool = False,
+    ) -> int:
+        return self.call(
+            self.engine.run_container(config, log_file_path=log_file_path, echo=echo)
+        )
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -4,11 +4,12 @@ from zero.core.constants import (
     DockerTag,
     Algorithm,
     Platform,
-    YamlKeys,
 )
 from zero.core.utils import pull_docker_image
 from zero.core.models import NyunDocker
-from typing import Any, Set, List, Dict, Union, Tuple
+from zero.core.scripts import load_script, load_scripts, get_algorithm_and_platform
+from zero.core.timings import span
+from typing import Any, Set, List, Dict, Union, Tuple, Optional
 from pathlib import Path
 import logging
 from docker.models.containers import ExecResult, Container
@@ -25,60 +26,121 @@ class DockerMetadata:
         algorithm: Algorithm,
         docker_image: NyunDocker,
         extension: WorkspaceExtension,
+        priority: int = 0,
     ):
         self.platforms = platforms
         self.algorithm = algorithm
         self.docker_image = docker_image
         self.extension_type = extension
+        # higher priority wins when several entries match; ties go to the first registered
+        self.priority = priority
 
+    def __str__(self):
+        return f"{self.algorithm} ({', '.join(self.platforms)}) -> {self.docker_image}"
 
-class BaseExtension:
+    def __repr__(self):
+        return self.__str__()
 
-    extension_type: Union[WorkspaceExtension, None] = None
-    docker_images: Set[NyunDocker] = set()
-    extension_metadata: Set[DockerMetadata] = set()
 
-    _all_docker_images: Set[NyunDocker] = set()
-    _registry: Set[DockerMetadata] = set()
+class ExtensionRegistry:
+    # an index of DockerMetadata by (algorithm, platform), built once at registration
 
     def __init__(self):
+        self._entries: List[DockerMetadata] = []
+        self._order: Dict[DockerMetadata, int] = {}
+        self._index: Dict[
+            Tuple[Optional[Algorithm], Optional[Platform]], List[DockerMetadata]
+        ] = {}
+        self._algorithms: Dict[Platform, Set[Algorithm]] = {}
+
+    def register(self, metadata: DockerMetadata):
+        if metadata in self._order:
+            return
+        self._order[metadata] = len(self._entries)
+        self._entries.append(metadata)
+        keys = [(metadata.algorithm, None)]
+        for platform in metadata.platforms:
+            keys.extend([(metadata.algorithm, platform), (None, platform)])
+            self._algorithms.setdefault(platform, set()).add(metadata.algorithm)
+
+        for key in keys:
+            candidates = self._index.setdefault(key, [])
+            if metadata not in candidates:
+                candidates.append(metadata)
+                candidates.sort(key=lambda meta: (-meta.priority, self._order[meta]))
+
+    def lookup(
+        self,
+        algorithm: Optional[Algorithm] = None,
+        platform: Optional[Platform] = None,
+    ) -> List[DockerMetadata]:
+        # candidates in priority order
+        if not algorithm and not platform:
+            return list(self._entries)
+        return list(self._index.get((algorithm or None, platform or None), ()))
+
+    def resolve(
+        self, algorithm: Algorithm, platform: Optional[Platform] = None
+    ) -> Optional[DockerMetadata]:
+        candidates = self._index.get((algorithm, platform or None))
+        return candidates[0] if candidates else None
+
+    def algorithms_for_platform(self, platform: Platform) -> Set[Algorithm]:
+        return set(self._algorithms.get(platform, ()))
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class BaseExtension:
+
+    extension_type: Union[WorkspaceExtension, None] = None
+    docker_images: List[NyunDocker] = []
+    extension_metadata: List[DockerMetadata] = []
+
+    def __init__(self, *extensions: "BaseExtension"):
+        # each instance owns its registry; the extensions passed are merged into it
         self.installed = False
-        for image in self.docker_images:
-            self._all_docker_images.add(image)
+        self.registry = ExtensionRegistry()
+        self._all_docker_images: List[NyunDocker] = []
+
+        for extension in (self, *extensions):
+            self.include(extension)
 
-        for meta in self.extension_metadata:
+    def include(self, extension: "BaseExtension"):
+        for image in extension.docker_images:
+            if image not in self._all_docker_images:
+                self._all_docker_images.append(image)
+
+        for meta in extension.extension_metadata:
             self.register(meta)
 
     def register(self, metadata: DockerMetadata):
-        self._registry.add(metadata)
+        self.registry.register(metadata)
+
+    def get_docker_images(self) -> List[NyunDocker]:
+        # the docker images of the included extensions, without duplicates
+        return list(self._all_docker_images)
 
     def filter_registry(
         self,
         algorithm: Union[None, Algorithm] = None,
         platform: Union[None, Platform] = None,
     ) -> List[DockerMetadata]:
+        return self.registry.lookup(algorithm=algorithm, platform=platform)
 
-        if not algorithm and not platform:
-            return self._registry
-        if not algorithm:
-            return list(filter(lambda meta: platform in meta.platforms, self._registry))
-        if not platform:
-            return list(
-                filter(lambda meta: algorithm == meta.algorithm, self._registry)
-            )
-        return list(
-            filter(
-                lambda meta: algorithm == meta.algorithm and platform in meta.platforms,
-                self._registry,
-            )
-        )
+    def algorithms_for_platform(self, platform: Platform) -> Set[Algorithm]:
+        return self.registry.algorithms_for_platform(platform)
 
-    def install(self):
+    def install(self, index: Optional["ImageIndex"] = None):
         if len(self._all_docker_images) == 0:
             raise ValueError(f"No docker images found for {self.extension_type}")
 
         # parallel pull
-        pull_docker_image(*self._all_docker_images)
+        pull_docker_image(*self._all_docker_images, index=index)
 
         # or sequencially do img.install() for each image in self._all_docker_images
 
@@ -88,39 +150,115 @@ class BaseExtension:
         # call utils.uninstall
         self.installed = False
 
-    def run(self, file_path: Path, workspace: "Workspace") -> Container:
-        # find from registry the metadata that has algorithm and then find the corresponding NyunDocker; then for the NyunDocker trigger the .run()
-        import yaml
-
-        with open(file_path, "r") as file:
-            data = yaml.safe_load(file)
-
+    def resolve(
+        self,
+        file_path: Path,
+        data: Optional[Dict[str, Any]] = None,
+        cache: Optional["ScriptCache"] = None,
+    ) -> DockerMetadata:
+        # find from registry the metadata that has the script's algorithm (and platform)
         try:
-            if not data.get(YamlKeys.ALGORITHM, data.get(YamlKeys.TASK, False)):
-                raise KeyError("Atleast one of 'ALGORITHM' or 'TASK' key is required.")
-
-            algorithm = Algorithm(
-                data.get(YamlKeys.ALGORITHM) or data.get(YamlKeys.TASK)
-            )
-            platform = (
-                Platform(data.get(YamlKeys.PLATFORM))
-                if data.get(YamlKeys.PLATFORM)
-                else None
-            )
+            data = data if data is not None else load_script(file_path, cache=cache)
+            algorithm, platform = get_algorithm_and_platform(data)
         except Exception as e:
             logger.error(e)
             raise Exception from e
 
-        metadata = self.filter_registry(algorithm=algorithm, platform=platform)
-        metadata = metadata[0] if len(metadata) else None
+        metadata = self.registry.resolve(algorithm=algorithm, platform=platform)
+
+        if metadata is None:
+            raise ValueError(f"No docker image found for algorithm: {algorithm}")
+        return metadata
+
+    def resolve_all(
+        self, file_paths: List[Path], cache: Optional["ScriptCache"] = None
+    ) -> Tuple[Dict[Path, DockerMetadata], Dict[Path, Exception]]:
+        # parse (in parallel) and resolve every script upfront, collecting all the errors
+        scripts, errors = load_scripts(file_paths, cache=cache)
+        metadata = {}
+        for file_path in file_paths:
+            if file_path in errors:
+                continue
+            try:
+                metadata[file_path] = self.resolve(file_path, data=scripts[file_path])
+            except Exception as e:
+                errors[file_path] = e.__cause__ or e
+        errors = {path: errors[path] for path in file_paths if path in errors}
+        return metadata, errors
+
+    def ensure_images(
+        self, *metadata: DockerMetadata, index: Optional["ImageIndex"] = None
+    ):
+        # pull only the docker images required by the given metadata
+        images = list(dict.fromkeys(meta.docker_image for meta in metadata))
+        if images:
+            pull_docker_image(*images, index=index)
+
+    def run(
+        self,
+        file_path: Path,
+        workspace: "Workspace",
+        metadata: Optional[DockerMetadata] = None,
+        placement: Optional["Placement"] = None,
+        run: Optional["RunDirectory"] = None,
+    ) -> Container:
+        # for the NyunDocker of the script's metadata trigger the .run()
+        if metadata is None:
+            with span("script.resolve", script=file_path):
+                metadata = self.resolve(file_path)
 
         print("Extension type:", metadata.extension_type)
         print("Algorithm:", metadata.algorithm)
         print("Platforms:", [str(platform) for platform in metadata.platforms])
 
+        return metadata.docker_image.run(
+            file_path, workspace, metadata, placement=placement, run=run
+        )
+
+    def execute(
+        self,
+        file_path: Path,
+        workspace: "Workspace",
+        metadata: Optional[DockerMetadata] = None,
+        log_file_path: Optional[Path] = None,
+        echo: bool = False,
+        pool: Optional["WarmPool"] = None,
+        placement: Optional["Placement"] = None,
+        run: Optional["RunDirectory"] = None,
+    ) -> int:
+        # run the script to completion, streaming its output, and return the exit code of its container
+        # with a warm pool, the script is run on a warm worker of its image instead of a new container
         if metadata is None:
-            raise ValueError(f"No docker image found for algorithm: {algorithm}")
-        return metadata.docker_image.run(file_path, workspace, metadata)
+            with span("script.resolve", script=file_path):
+                metadata = self.resolve(file_path)
+
+        if pool is not None:
+            return pool.execute(
+                file_path=file_path,
+                workspace=workspace,
+                metadata=metadata,
+                log_file_path=log_file_path,
+                echo=echo,
+                placement=placement,
+                run=run,
+            )
+
+        # jobs run in parallel next to the progress display, so this goes to the log only
+        logger.info(
+            f"Running {file_path}: extension type {metadata.extension_type}, "
+            f"algorithm {metadata.algorithm}, "
+            f"platforms {[str(platform) for platform in metadata.platforms]}"
+        )
+
+        return metadata.docker_image.execute(
+            file_path,
+            workspace,
+            metadata,
+            log_file_path=log_file_path,
+            echo=echo,
+            placement=placement,
+            run=run,
+        )
 
 
 class KompressVisionExtension(BaseExtension):
@@ -128,11 +266,11 @@ class KompressVisionExtension(BaseExtension):
     # => kompress-vision
 
     extension_type = WorkspaceExtension.VISION
-    docker_images = {
+    docker_images = [
         NyunDocker(DockerRepository.NYUN_KOMPRESS, DockerTag.KOMPRESS_MMRAZOR),
         NyunDocker(DockerRepository.NYUN_ZERO_VISION, DockerTag.PUBLIC_LATEST),
-    }
-    extension_metadata = {
+    ]
+    extension_metadata = [
         DockerMetadata(
             algorithm=Algorithm.FXQUANT,
             docker_image=NyunDocker(
@@ -236,12 +374,12 @@ class KompressVisionExtension(BaseExtension):
             platforms=[Platform.TIMM, Platform.TORCHVISION],
             extension=WorkspaceExtension.VISION,
         ),
-    }
+    ]
 
 
 class KompressTextGenerationExtension(BaseExtension):
     extension_type = WorkspaceExtension.TEXT_GENERATION
-    docker_images = {
+    docker_images = [
         NyunDocker(DockerRepository.NYUN_KOMPRESS, DockerTag.MLCLLM),
         NyunDocker(DockerRepository.NYUN_KOMPRESS, DockerTag.EXLLAMA),
         # public
@@ -250,9 +388,9 @@ class KompressTextGenerationExtension(BaseExtension):
             DockerRepository.NYUN_ZERO_TEXT_GENERATION_TENSORRT_LLM,
             DockerTag.PUBLIC_LATEST,
         ),
-    }
+    ]
 
-    extension_metadata = {
+    extension_metadata = [
         DockerMetadata(
             algorithm=Algorithm.EXLLAMA,
             docker_image=NyunDocker(DockerRepository.NYUN_KOMPRESS, DockerTag.EXLLAMA),
@@ -291,17 +429,17 @@ class KompressTextGenerationExtension(BaseExtension):
             platforms=[Platform.HUGGINGFACE],
             extension=WorkspaceExtension.TEXT_GENERATION,
         ),
-    }
+    ]
 
 
 class AdaptExtension(BaseExtension):
     extension_type = WorkspaceExtension.ADAPT
-    docker_images = {
+    docker_images = [
         # public
         NyunDocker(DockerRepository.NYUN_ZERO_ADAPT, DockerTag.PUBLIC_LATEST),
         NyunDocker(DockerRepository.NYUN_ADAPT, DockerTag.ADAPT),
-    }
-    extension_metadata = {
+    ]
+    extension_metadata = [
         # huggingface - 'text_classification'
         DockerMetadata(
             algorithm=Algorithm.TEXT_CLASSIFICATION,
@@ -367,4 +505,4 @@ class AdaptExtension(BaseExtension):
             platforms=[Platform.HUGGINGFACE, Platform.TIMM],
             extension=WorkspaceExtension.ADAPT,
         ),
-    }
+    ]
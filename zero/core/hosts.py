@@ -0,0 +1,401 @@
+"""
+This module provides a pool of docker hosts that jobs are distributed across.
+The hosts are listed in the "Hosts" section of the workspace spec, each as a docker host URL
+(unix://, tcp:// or ssh://), a docker context name, or "local" for the daemon of this machine,
+optionally followed by "jobs=<n>", the number of jobs the host runs at once, and "shared" when
+the workspace is at the same path on the host (e.g. on NFS). Each job is sent to the least
+loaded host. Before a job is launched on a host, its image is pulled there if it is missing.
+Unless the workspace is shared, the workspace, the custom data and the Nyun services are synced
+into volumes on the host (see zero.core.staging), the script is copied into the job's container,
+and the job's outputs and checkpoints are copied back into the workspace when it finishes.
+"""
+
+import io
+import os
+import tarfile
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from logging import getLogger
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, Optional
+
+from zero import SERVICES as NyunServices
+from zero.core.constants import (
+    DataStaging,
+    DockerPath,
+    WorkspaceSpec,
+    DOCKER_MAX_POOL_SIZE,
+    HOST_JOBS,
+    HOST_SHARED,
+    LOCAL_HOST,
+)
+from zero.core.timings import span
+
+logger = getLogger(__name__)
+
+
+def get_script_archive(script: Path) -> bytes:
+    # a tar archive of the script at its path in the container, to extract into "/"
+    data = script.read_bytes()
+    info = tarfile.TarInfo(
+        str(DockerPath.get_script_path_in_docker(script_path=script)).lstrip("/")
+    )
+    info.size = len(data)
+    info.mode = 0o444
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def get_workspace_exclude(workspace: "Workspace") -> List[str]:
+    # the workspace files that are not synced to other hosts: the workspace's own state, except
+    # the run directories with the checkpoints, and the custom data, which is synced on its own
+    workspace_path = workspace.workspace_path.absolute().resolve()
+    nyun_dir = WorkspaceSpec.get_workspace_spec_dir(workspace_path)
+    # the staging state is written while the workspace is synced, so it may not exist yet
+    exclude = [str(WorkspaceSpec.get_staging_dir(workspace_path).relative_to(workspace_path))]
+    if nyun_dir.exists():
+        exclude.extend(
+            str(path.relative_to(workspace_path))
+            for path in nyun_dir.iterdir()
+            if path.name not in (WorkspaceSpec.RUNS, WorkspaceSpec.STAGING)
+        )
+    try:
+        exclude.append(
+            str(
+                workspace.custom_data_path.absolute()
+                .resolve()
+                .relative_to(workspace_path)
+            )
+        )
+    except ValueError:
+        pass
+    return exclude
+
+
+class DockerHost:
+    """
+    A docker daemon that jobs can be sent to.
+
+    Args:
+        name (str): The name of the host in the workspace spec.
+        address (str): A docker host URL, a docker context name, or "local".
+        max_jobs (int): The number of jobs the host runs at once.
+        shared (bool): Whether the workspace is at the same path on the host.
+    """
+
+    def __init__(self, name: str, address: str, max_jobs: int = 1, shared: bool = False):
+        if max_jobs < 1:
+            raise ValueError(f"Host '{name}' must run at least 1 job, got {max_jobs}.")
+        self.name = name
+        self.address = address
+        self.max_jobs = max_jobs
+        self.shared = shared
+        self._client = None
+        self._lock = threading.Lock()
+        # images known to be on the host, and a lock per image so it is pulled once
+        self._images = set()
+        self._image_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        # the staged copies of the workspace directories on the host, by mount target
+        self._stagers: Dict[str, "DataStager"] = {}
+
+    @staticmethod
+    def from_spec(name: str, value: str) -> "DockerHost":
+        # parse "<address> [jobs=<n>] [shared]"
+        address, *options = value.split()
+        max_jobs, shared = 1, False
+        for option in options:
+            if option == HOST_SHARED:
+                shared = True
+            elif option.startswith(HOST_JOBS):
+                try:
+                    max_jobs = int(option[len(HOST_JOBS) :])
+                except ValueError:
+                    raise ValueError(f"Invalid '{option}' of host '{name}'.")
+            else:
+                raise ValueError(f"Unknown option '{option}' of host '{name}'.")
+        return DockerHost(name, address, max_jobs=max_jobs, shared=shared)
+
+    def to_spec(self) -> str:
+        value = f"{self.address} {HOST_JOBS}{self.max_jobs}"
+        return f"{value} {HOST_SHARED}" if self.shared else value
+
+    @property
+    def is_local(self) -> bool:
+        return self.address == LOCAL_HOST
+
+    @property
+    def is_remote(self) -> bool:
+        # whether the workspace has to be synced to the host
+        return not self.is_local and not self.shared
+
+    def get_base_url(self) -> str:
+        if "://" in self.address:
+            return self.address
+        from docker.context import ContextAPI
+
+        context = ContextAPI.get_context(self.address)
+        if context is None:
+            raise ValueError(
+                f"Docker context '{self.address}' of host '{self.name}' not found."
+            )
+        return context.Host
+
+    def get_client(self) -> "docker.DockerClient":
+        """
+        Get the Docker client of the host, created once and authenticated with the credentials
+        of the process-wide client.
+        """
+        from zero.core.utils import get_docker_client
+
+        if self.is_local:
+            return get_docker_client()
+        with self._lock:
+            if self._client is None:
+                import docker
+                from dotenv import load_dotenv
+
+                load_dotenv()
+                client = docker.DockerClient(
+                    base_url=self.get_base_url(), max_pool_size=DOCKER_MAX_POOL_SIZE
+                )
+                try:
+                    client.login(
+                        username=os.getenv("DOCKER_USERNAME"),
+                        password=os.getenv("DOCKER_ACCESS_TOKEN"),
+                    )
+                except Exception as e:
+                    logger.error(
+                        f"Failed to authenticate host {self.name} with Docker credentials. Only public images can be pulled."
+                    )
+                self._client = client
+            return self._client
+
+    def ensure_image(self, image: "NyunDocker"):
+        # pull the image on the host if it is not there yet
+        from docker.errors import ImageNotFound
+        from zero.core.pulls import pull_image
+
+        with self._lock:
+            image_lock = self._image_locks[str(image)]
+        with image_lock:
+            if str(image) in self._images:
+                return
+            client = self.get_client()
+            try:
+                client.images.get(str(image))
+            except ImageNotFound:
+                logger.info(f"Pulling {image} on host {self.name}.")
+                with span("image.pull", image=image, host=self.name):
+                    pull_image(client, image.repository, image.tag)
+            self._images.add(str(image))
+
+    def _get_stager(
+        self, target: str, workspace: "Workspace", source: Path
+    ) -> "DataStager":
+        from zero.core.staging import DataStager
+
+        with self._lock:
+            if target not in self._stagers:
+                self._stagers[target] = DataStager(
+                    workspace.workspace_path,
+                    source,
+                    DataStaging.VOLUME,
+                    host=self,
+                    exclude=(
+                        get_workspace_exclude(workspace)
+                        if target == str(DockerPath.USER_DATA.value)
+                        else ()
+                    ),
+                )
+            return self._stagers[target]
+
+    def stage(self, workspace: "Workspace", image: "NyunDocker") -> Dict[str, "Mount"]:
+        """
+        Sync the workspace, the custom data and the Nyun services into volumes on the host.
+
+        Returns:
+            Dict[str, Mount]: The volume mounts that replace the bind mounts of a job, by target.
+        """
+        sources = {
+            str(DockerPath.USER_DATA.value): workspace.workspace_path,
+            str(DockerPath.CUSTOM_DATA.value): workspace.custom_data_path,
+            str(DockerPath.NYUN_SERVICES.value): NyunServices,
+        }
+        mounts = {}
+        for target, source in sources.items():
+            stager = self._get_stager(target, workspace, source)
+            with span("host.sync", host=self.name, source=source):
+                staged = stager.stage(image=image)
+            mounts[target] = staged.get_mount(
+                target, read_only=target != str(DockerPath.USER_DATA.value)
+            )
+        return mounts
+
+    def execute(
+        self,
+        file_path: Path,
+        workspace: "Workspace",
+        metadata: "DockerMetadata",
+        log_file_path: Optional[Path] = None,
+        echo: bool = False,
+        run: Optional["RunDirectory"] = None,
+    ) -> int:
+        """
+        Run a script to completion in a container on the host, streaming its output.
+
+        Args:
+            file_path (Path): The script path.
+            workspace (Workspace): The workspace object.
+            metadata (DockerMetadata): The resolved docker metadata of the script.
+            log_file_path (Path, optional): The file to append the container output to.
+            echo (bool): Whether to also write the container output to the terminal.
+            run (RunDirectory, optional): The run directory of the script.
+
+        Returns:
+            int: The exit code of the container.
+        """
+        from zero.core.results import get_output_path_on_host
+        from zero.core.scripts import load_script
+        from zero.core.utils import get_container_config, wait_docker_container
+
+        image = metadata.docker_image
+        with span("image.ensure", image=image, host=self.name):
+            self.ensure_image(image)
+        client = self.get_client()
+
+        config = get_container_config(
+            file_path, workspace, metadata, image, mount_script=not self.is_remote, run=run
+        )
+        if self.is_remote:
+            mounts = self.stage(workspace, image)
+            config["mounts"] = [
+                mounts.get(mount["Target"], mount) for mount in config["mounts"]
+            ]
+        logger.info(
+            f"Running {image} on host {self.name} with command: {config['command']}\nMounts: {config['mounts']}\nEnvironment: {config['environment']}"
+        )
+        with span("container.create", image=image, host=self.name):
+            container = client.containers.create(**config)
+            try:
+                if self.is_remote:
+                    container.put_archive("/", get_script_archive(file_path))
+                container.start()
+            except BaseException:
+                container.remove(force=True)
+                raise
+        exit_code = wait_docker_container(
+            container, log_file_path=log_file_path, echo=echo
+        )
+
+        if self.is_remote:
+            # copy the outputs and checkpoints the job wrote back into the workspace
+            stager = self._get_stager(
+                str(DockerPath.USER_DATA.value), workspace, workspace.workspace_path
+            )
+            workspace_path = stager.custom_data_path
+            paths = [
+                get_output_path_on_host(workspace_path, load_script(file_path)),
+                run.checkpoints_path.absolute().resolve() if run is not None else None,
+            ]
+            with span("host.fetch", host=self.name):
+                for path in paths:
+                    if path is None:
+                        continue
+                    try:
+                        relative_path = path.relative_to(workspace_path)
+                    except ValueError:
+                        # outside of the workspace volume
+                        continue
+                    stager.fetch(str(relative_path), image)
+        return exit_code
+
+    def __str__(self):
+        return f"DockerHost({self.name}, {self.to_spec()})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class HostPool:
+    """
+    Docker hosts that jobs are sent to, each to the least loaded host with a free job slot.
+
+    Args:
+        hosts (List[DockerHost]): The hosts, in order of preference.
+    """
+
+    def __init__(self, hosts: List[DockerHost]):
+        self.hosts = hosts
+        self._running = {host.name: 0 for host in hosts}
+        # the containers running on each host when it was checked, to break ties
+        self._containers = {host.name: 0 for host in hosts}
+        self._condition = threading.Condition()
+
+    @staticmethod
+    def from_spec(hosts: Mapping[str, str]) -> Optional["HostPool"]:
+        # the pool of the hosts of a workspace spec, or None if it has none
+        if not hosts:
+            return None
+        return HostPool([DockerHost.from_spec(name, value) for name, value in hosts.items()])
+
+    def get_slots(self) -> int:
+        return sum(host.max_jobs for host in self.hosts)
+
+    def check(self) -> Dict[str, str]:
+        """
+        Check that every host is reachable, and drop the ones that are not.
+
+        Returns:
+            Dict[str, str]: The error of each dropped host.
+        """
+        errors = {}
+        for host in list(self.hosts):
+            try:
+                client = host.get_client()
+                client.ping()
+                self._containers[host.name] = len(client.containers.list())
+            except Exception as e:
+                logger.error(f"Host {host.name} ({host.address}) is not reachable: {e}")
+                errors[host.name] = str(e) or type(e).__name__
+                self.hosts.remove(host)
+        return errors
+
+    def get_containers(self, host: DockerHost) -> int:
+        # the containers running on the host when it was checked
+        return self._containers[host.name]
+
+    def get_load(self, host: DockerHost) -> float:
+        return self._running[host.name] / host.max_jobs
+
+    @contextmanager
+    def acquire(self) -> Iterator[DockerHost]:
+        # wait for a free job slot, and hold it on the least loaded host
+        with self._condition:
+            while True:
+                free = [
+                    host
+                    for host in self.hosts
+                    if self._running[host.name] < host.max_jobs
+                ]
+                if free:
+                    break
+                self._condition.wait()
+            host = min(
+                free, key=lambda host: (self.get_load(host), self.get_containers(host))
+            )
+            self._running[host.name] += 1
+        try:
+            yield host
+        finally:
+            with self._condition:
+                self._running[host.name] -= 1
+                self._condition.notify_all()
+
+    def __str__(self):
+        return f"HostPool({', '.join(host.name for host in self.hosts)})"
+
+    def __repr__(self):
+        return self.__str__()
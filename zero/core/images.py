@@ -0,0 +1,168 @@
+"""
+This module provides a persistent index of the locally installed Nyun Docker images.
+The index is stored in the workspace (".nyunservices/images.json"), is built from one bulk
+image listing and is invalidated from the Docker daemon's image events.
+"""
+
+import json
+import os
+import time
+import threading
+from logging import getLogger
+from pathlib import Path
+from typing import Dict, Optional
+
+from zero.core.constants import (
+    DockerRepository,
+    WorkspaceSpec,
+    IMAGE_INDEX_FRESH_SECONDS,
+    IMAGE_INDEX_TTL_SECONDS,
+    IMAGE_INDEX_INVALIDATING_EVENTS,
+)
+
+logger = getLogger(__name__)
+
+
+class ImageIndex:
+    """
+    Index of installed Nyun Docker images, keyed by "repository:tag".
+
+    Each entry records the image id, its repo digests and the time it was last verified
+    against the Docker daemon.
+
+    Args:
+        index_path (Path, optional): The file the index is persisted to. If None, the index is kept in memory only.
+    """
+
+    def __init__(self, index_path: Optional[Path] = None):
+        self.index_path = index_path
+        self.entries: Dict[str, Dict] = {}
+        self.built_at: Optional[float] = None
+        self.synced_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def for_workspace(workspace_path: Path) -> "ImageIndex":
+        return ImageIndex(WorkspaceSpec.get_image_index_path(workspace_path))
+
+    @staticmethod
+    def is_nyun_reference(reference: str) -> bool:
+        return reference.rsplit(":", 1)[0] in {repo.value for repo in DockerRepository}
+
+    def is_installed(self, image: "NyunDocker") -> bool:
+        return str(image) in self.entries
+
+    def get(self, image: "NyunDocker") -> Optional[Dict]:
+        return self.entries.get(str(image))
+
+    def load(self):
+        if self.index_path is None or not self.index_path.exists():
+            return
+        try:
+            with open(self.index_path, "r") as file:
+                data = json.load(file)
+            self.entries = data.get("images", {})
+            self.built_at = data.get("built_at")
+            self.synced_at = data.get("synced_at")
+        except Exception as e:
+            logger.error(f"Failed to read image index {self.index_path}: {e}")
+            self.entries, self.built_at, self.synced_at = {}, None, None
+
+    def save(self):
+        if self.index_path is None:
+            return
+        with self._lock:
+            data = {
+                "built_at": self.built_at,
+                "synced_at": self.synced_at,
+                "images": self.entries,
+            }
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_path.with_suffix(".tmp")
+            with open(tmp_path, "w") as file:
+                json.dump(data, file, indent=2)
+            os.replace(tmp_path, self.index_path)
+
+    def rebuild(self, client: "docker.DockerClient"):
+        """
+        Rebuild the index from a single bulk image listing.
+
+        Args:
+            client (docker.DockerClient): The Docker client.
+        """
+        now = time.time()
+        entries = {}
+        for image in client.images.list():
+            for reference in image.tags:
+                if self.is_nyun_reference(reference):
+                    entries[reference] = self._entry(image, now)
+        with self._lock:
+            self.entries = entries
+            self.built_at = now
+            self.synced_at = now
+        logger.info(f"Image index rebuilt with {len(entries)} image(s).")
+
+    def sync(self, client: "docker.DockerClient"):
+        """
+        Bring the index up to date with the Docker daemon.
+
+        A recently synced index is trusted as is. Otherwise the daemon's image events since
+        the last sync are read, and the index is rebuilt if any of them may have changed the
+        installed images (or if the index has expired).
+
+        Args:
+            client (docker.DockerClient): The Docker client.
+        """
+        now = time.time()
+        if self.synced_at and now - self.synced_at < IMAGE_INDEX_FRESH_SECONDS:
+            return
+
+        if not self.built_at or now - self.built_at >= IMAGE_INDEX_TTL_SECONDS:
+            self.rebuild(client)
+            return
+
+        try:
+            events = client.events(
+                since=int(self.synced_at),
+                until=int(now),
+                filters={"type": "image"},
+                decode=True,
+            )
+            stale = any(
+                event.get("Action") in IMAGE_INDEX_INVALIDATING_EVENTS
+                for event in events
+            )
+        except Exception as e:
+            logger.error(f"Failed to read Docker image events: {e}")
+            stale = True
+
+        if stale:
+            self.rebuild(client)
+        else:
+            with self._lock:
+                self.synced_at = now
+
+    def add(self, image: "NyunDocker", client: "docker.DockerClient"):
+        """
+        Record a freshly pulled image.
+
+        Args:
+            image (NyunDocker): The pulled image.
+            client (docker.DockerClient): The Docker client.
+        """
+        docker_image = client.images.get(str(image))
+        with self._lock:
+            self.entries[str(image)] = self._entry(docker_image, time.time())
+
+    def discard(self, image: "NyunDocker"):
+        with self._lock:
+            self.entries.pop(str(image), None)
+
+    @staticmethod
+    def _entry(docker_image, verified_at: float) -> Dict:
+        return {
+            "id": docker_image.id,
+            "digests": docker_image.attrs.get("RepoDigests", []),
+            "verified_at": verified_at,
+        }
@@ -1,8 +1,15 @@
 import logging
 from pathlib import Path
 
+_log_file_path = None
+
 
 def init_logger(log_file_path: Path):
+    # configure logging once per process; the workspace spec is loaded by several callers
+    global _log_file_path
+    if _log_file_path is not None:
+        return
+    _log_file_path = log_file_path
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -1,7 +1,12 @@
-from typing import Dict
+from typing import Dict, Optional
 from pathlib import Path
 from zero.core.constants import DockerRepository, DockerTag
-from zero.core.utils import pull_docker_image, run_docker_container, remove_docker_image
+from zero.core.utils import (
+    pull_docker_image,
+    run_docker_container,
+    execute_docker_container,
+    remove_docker_image,
+)
 
 
 class NyunDocker:
@@ -39,15 +44,45 @@ class NyunDocker:
             return (self.repository, self.tag) == (other.repository, other.tag)
         return False
 
-    def run(self, file_path: Path, workspace: "Workspace", metadata: "DockerMetadata"):
+    def run(
+        self,
+        file_path: Path,
+        workspace: "Workspace",
+        metadata: "DockerMetadata",
+        placement: Optional["Placement"] = None,
+        run: Optional["RunDirectory"] = None,
+    ):
         # TODO: validate the path (corresponding to container)
-        return run_docker_container(file_path, workspace, metadata, self)
+        return run_docker_container(
+            file_path, workspace, metadata, self, placement=placement, run=run
+        )
 
         # TODO: except if docker is unavailable due to some reason:
         # pull docker and run again.
         # self._intall()
         # self.run(file_path)
 
+    def execute(
+        self,
+        file_path: Path,
+        workspace: "Workspace",
+        metadata: "DockerMetadata",
+        log_file_path: Optional[Path] = None,
+        echo: bool = False,
+        placement: Optional["Placement"] = None,
+        run: Optional["RunDirectory"] = None,
+    ) -> int:
+        return execute_docker_container(
+            file_path,
+            workspace,
+            metadata,
+            self,
+            log_file_path=log_file_path,
+            echo=echo,
+            placement=placement,
+            run=run,
+        )
+
     def install(self):
         self._install()
 
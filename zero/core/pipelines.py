@@ -0,0 +1,320 @@
+"""
+This module provides pipelines of scripts: stages that hand off their outputs to later stages.
+A pipeline spec names its stages, the script each one runs, the workspace paths it reads and
+writes, and the stages it depends on. A stage depends on the stages it lists in DEPENDS_ON and
+on every stage writing one of its inputs, and runs once they all succeeded, so independent
+branches run concurrently. A stage is skipped when its script, the contents of its inputs and
+the runs of the stages in its DEPENDS_ON are unchanged since its last successful run, and its
+outputs exist. The state of each pipeline is kept in the workspace (".nyunservices/pipelines/").
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from zero.core.constants import DockerPath, PipelineKeys, WorkspaceSpec
+from zero.core.results import is_overlapping
+from zero.core.scripts import parse_script
+from zero.core.staging import get_file_hash
+
+logger = getLogger(__name__)
+
+
+class Stage:
+    # a stage of a pipeline: a script, and the paths on the host it reads and writes
+
+    def __init__(
+        self,
+        name: str,
+        script: Path,
+        inputs: List[Path],
+        outputs: List[Path],
+        depends_on: List[str],
+    ):
+        self.name = name
+        self.script = script
+        self.inputs = inputs
+        self.outputs = outputs
+        self.depends_on = depends_on
+
+    def __str__(self):
+        return f"Stage({self.name}, {self.script})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class Pipeline:
+    """
+    The stages of a pipeline spec, and the state of their last successful runs.
+
+    Args:
+        spec_path (Path): The pipeline spec. Scripts are relative to its directory.
+        spec (Dict[str, Any]): The parsed pipeline spec (see PipelineKeys).
+        workspace_path (Path): The workspace path. Inputs and outputs are relative to it, or
+            paths under the workspace mount in the container (DockerPath.USER_DATA).
+        force (bool): Run every stage, even if it is unchanged.
+
+    Raises:
+        ValueError: If the spec is invalid, or its dependencies form a cycle.
+    """
+
+    def __init__(
+        self,
+        spec_path: Path,
+        spec: Dict[str, Any],
+        workspace_path: Path,
+        force: bool = False,
+    ):
+        self.spec_path = spec_path.absolute()
+        self.workspace_path = workspace_path
+        self.force = force
+
+        stages = spec.get(PipelineKeys.STAGES)
+        if not isinstance(stages, dict) or not stages:
+            raise ValueError(f"'{PipelineKeys.STAGES}' must map stage names to stages.")
+        self.stages: Dict[str, Stage] = {}
+        for name, stage in stages.items():
+            if not isinstance(stage, dict) or not stage.get(PipelineKeys.SCRIPT):
+                raise ValueError(f"Stage '{name}' needs a '{PipelineKeys.SCRIPT}'.")
+            script = Path(stage[PipelineKeys.SCRIPT])
+            if not script.is_absolute():
+                script = self.spec_path.parent / script
+            self.stages[name] = Stage(
+                name=str(name),
+                script=script,
+                inputs=self._get_paths(name, stage, PipelineKeys.INPUTS),
+                outputs=self._get_paths(name, stage, PipelineKeys.OUTPUTS),
+                depends_on=[
+                    str(dependency)
+                    for dependency in self._get_list(name, stage, PipelineKeys.DEPENDS_ON)
+                ],
+            )
+
+        # the scheduler and the result cache know the stages by their scripts
+        self._stages_by_script: Dict[Path, Stage] = {}
+        for stage in self.stages.values():
+            other = self._stages_by_script.setdefault(stage.script, stage)
+            if other is not stage:
+                raise ValueError(
+                    f"Stages '{other.name}' and '{stage.name}' run the same script {stage.script}."
+                )
+        self.dependencies = self._get_dependencies()
+        self.order = self._get_order()
+
+        key = hashlib.sha256(str(self.spec_path).encode()).hexdigest()[:8]
+        self.state_path = (
+            WorkspaceSpec.get_pipelines_dir(workspace_path)
+            / f"{spec_path.stem}-{key}.json"
+        )
+        self._state = self._load_state()
+        # the digest of each stage when it was checked, recorded once it succeeded
+        self._digests: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_file(spec_path: Path, workspace_path: Path, force: bool = False) -> "Pipeline":
+        return Pipeline(
+            spec_path, parse_script(spec_path.read_bytes()), workspace_path, force=force
+        )
+
+    def _get_list(self, name: str, stage: Dict[str, Any], key: str) -> List[Any]:
+        values = stage.get(key) or []
+        if isinstance(values, str):
+            return [values]
+        if not isinstance(values, list):
+            raise ValueError(f"'{key}' of stage '{name}' must be a list.")
+        return values
+
+    def _get_paths(self, name: str, stage: Dict[str, Any], key: str) -> List[Path]:
+        paths = []
+        for value in self._get_list(name, stage, key):
+            path = Path(value)
+            if path.is_absolute():
+                try:
+                    path = path.relative_to(DockerPath.USER_DATA.value)
+                except ValueError:
+                    paths.append(path)
+                    continue
+            paths.append(self.workspace_path / path)
+        return paths
+
+    def _get_dependencies(self) -> Dict[str, List[str]]:
+        dependencies = {}
+        for stage in self.stages.values():
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(
+                        f"Stage '{stage.name}' depends on an unknown stage '{dependency}'."
+                    )
+            # a stage also depends on every other stage writing one of its inputs
+            writers = [
+                other.name
+                for other in self.stages.values()
+                if other is not stage
+                and any(
+                    is_overlapping(path, output)
+                    for path in stage.inputs
+                    for output in other.outputs
+                )
+            ]
+            dependencies[stage.name] = list(dict.fromkeys(stage.depends_on + writers))
+        return dependencies
+
+    def _get_order(self) -> List[str]:
+        # the stages in an order where every stage comes after its dependencies
+        order, done = [], set()
+        remaining = list(self.stages)
+        while remaining:
+            ready = [
+                name
+                for name in remaining
+                if all(dependency in done for dependency in self.dependencies[name])
+            ]
+            if not ready:
+                raise ValueError(
+                    f"The dependencies of stages {', '.join(remaining)} form a cycle."
+                )
+            order.extend(ready)
+            done.update(ready)
+            remaining = [name for name in remaining if name not in done]
+        return order
+
+    def get_scripts(self) -> List[Path]:
+        return [self.stages[name].script for name in self.order]
+
+    def get_script_dependencies(self) -> Dict[Path, List[Path]]:
+        return {
+            self.stages[name].script: [
+                self.stages[dependency].script for dependency in dependencies
+            ]
+            for name, dependencies in self.dependencies.items()
+        }
+
+    def get_stage(self, script: Path) -> Stage:
+        return self._stages_by_script[script]
+
+    def _load_state(self) -> Dict[str, Any]:
+        if not self.state_path.exists():
+            return {"stages": {}, "files": {}}
+        try:
+            with open(self.state_path, "r") as file:
+                return json.load(file)
+        except Exception as e:
+            logger.error(f"Failed to read pipeline state {self.state_path}: {e}")
+            return {"stages": {}, "files": {}}
+
+    def _save_state(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(self._state, file, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _get_file_hash(self, path: Path) -> str:
+        # content hashes are kept by size and mtime, so unchanged files are not read again
+        stat = path.stat()
+        files = self._state["files"]
+        entry = files.get(str(path))
+        if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return entry[2]
+        digest = get_file_hash(path)
+        files[str(path)] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def get_digest(self, stage: Stage) -> str:
+        """
+        Get the digest of a stage's script, the contents of its inputs, and the digests of the
+        last successful runs of the stages in its DEPENDS_ON.
+        """
+        digest = hashlib.sha256(stage.script.read_bytes())
+        with self._lock:
+            for path in sorted(stage.inputs):
+                digest.update(f"\0{path}\0".encode())
+                if path.is_file():
+                    digest.update(self._get_file_hash(path).encode())
+                elif path.is_dir():
+                    for root, directories, files in os.walk(path):
+                        directories.sort()
+                        for name in sorted(files):
+                            file_path = Path(root) / name
+                            digest.update(f"{file_path.relative_to(path)}\0".encode())
+                            digest.update(self._get_file_hash(file_path).encode())
+                else:
+                    digest.update(b"missing")
+            # the stages writing its inputs are covered by their contents
+            for dependency in stage.depends_on:
+                recorded = self._state["stages"].get(dependency, {})
+                digest.update(f"\0{dependency}\0{recorded.get('digest')}".encode())
+        return digest.hexdigest()
+
+    def is_up_to_date(self, script: Path) -> bool:
+        """
+        Check whether the stage of a script is unchanged since its last successful run, and its
+        outputs exist. Called when the stage is about to run, after its dependencies finished.
+        """
+        stage = self.get_stage(script)
+        digest = self.get_digest(stage)
+        with self._lock:
+            self._digests[stage.name] = digest
+            recorded = self._state["stages"].get(stage.name, {})
+        return (
+            not self.force
+            and recorded.get("digest") == digest
+            and all(path.exists() for path in stage.outputs)
+        )
+
+    def get_inputs_digest(self, script: Path) -> Optional[str]:
+        # the digest of the stage as last checked, which keys its results in the result cache
+        with self._lock:
+            return self._digests.get(self.get_stage(script).name)
+
+    def record(self, script: Path):
+        # record the successful run of a stage
+        stage = self.get_stage(script)
+        with self._lock:
+            self._state["stages"][stage.name] = {
+                "script": str(stage.script),
+                "digest": self._digests.get(stage.name),
+                "finished_at": time.time(),
+            }
+            self._save_state()
+
+    def get_plan(self) -> Dict[str, str]:
+        """
+        Get whether each stage would run, in dependency order.
+
+        Returns:
+            Dict[str, str]: The status of each stage: "up to date", "runs", or "runs if its
+                inputs change" when a stage writing its inputs runs.
+        """
+        plan = {}
+        for name in self.order:
+            stage = self.stages[name]
+            if not stage.script.exists():
+                plan[name] = "script not found"
+            elif any(plan[dependency] != "up to date" for dependency in stage.depends_on):
+                plan[name] = "runs"
+            elif self.is_up_to_date(stage.script):
+                plan[name] = (
+                    "runs if its inputs change"
+                    if any(
+                        plan[dependency] != "up to date"
+                        for dependency in self.dependencies[name]
+                    )
+                    else "up to date"
+                )
+            else:
+                plan[name] = "runs"
+        return plan
+
+    def __str__(self):
+        return f"Pipeline({self.spec_path}, stages={self.order})"
+
+    def __repr__(self):
+        return self.__str__()
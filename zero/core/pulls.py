@@ -0,0 +1,335 @@
+"""
+This module provides streaming image pulls.
+The per-layer progress messages of a pull are aggregated into downloaded and extracted byte
+counts of the image. A pull whose layers make no progress for a stall window is aborted and
+retried; layers that completed before the stall are kept by the Docker daemon.
+Pulls of several images are scheduled from their registry manifests so that each layer shared
+between the images is fetched once.
+"""
+
+import asyncio
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from zero.core.constants import PULL_STALL_SECONDS, PULL_MAX_RETRIES
+
+logger = getLogger(__name__)
+
+# layer statuses that are expected to move bytes
+ACTIVE_LAYER_STATUSES = {"Downloading", "Extracting", "Verifying Checksum"}
+DONE_LAYER_STATUSES = {"Pull complete", "Already exists"}
+
+
+class PullStalled(Exception):
+    pass
+
+
+def get_stall_timeout() -> float:
+    # the stall window, overridable with the NYUN_PULL_STALL_SECONDS environment variable
+    return float(os.getenv("NYUN_PULL_STALL_SECONDS", PULL_STALL_SECONDS))
+
+
+class PullProgress:
+    # the aggregated progress of one image pull
+
+    def __init__(self):
+        self.layers: Dict[str, Dict[str, Any]] = {}
+        self.status = "Waiting"
+        self.started_at = time.monotonic()
+        self.updated_at = self.started_at
+
+    def update(self, message: Dict[str, Any]):
+        now = time.monotonic()
+        self.updated_at = now
+        status = message.get("status", "")
+        layer_id = message.get("id")
+        detail = message.get("progressDetail") or {}
+        if not layer_id or status.startswith("Pulling from"):
+            self.status = status or self.status
+            return
+
+        layer = self.layers.setdefault(
+            layer_id,
+            {
+                "status": status,
+                "total": 0,
+                "downloaded": 0,
+                "extracted": 0,
+                "changed_at": now,
+            },
+        )
+        before = (layer["status"], layer["downloaded"], layer["extracted"])
+        if detail.get("total"):
+            layer["total"] = detail["total"]
+        if status == "Downloading":
+            layer["downloaded"] = detail.get("current", layer["downloaded"])
+        elif status in ("Download complete", "Verifying Checksum"):
+            layer["downloaded"] = layer["total"]
+        elif status == "Extracting":
+            layer["downloaded"] = layer["total"]
+            layer["extracted"] = detail.get("current", layer["extracted"])
+        elif status in DONE_LAYER_STATUSES:
+            layer["downloaded"] = layer["extracted"] = layer["total"]
+        layer["status"] = status
+        if (layer["status"], layer["downloaded"], layer["extracted"]) != before:
+            layer["changed_at"] = now
+        self.status = "Downloading"
+
+    @property
+    def total_bytes(self) -> int:
+        # only known once a layer starts downloading
+        return sum(layer["total"] for layer in self.layers.values())
+
+    @property
+    def downloaded_bytes(self) -> int:
+        return sum(layer["downloaded"] for layer in self.layers.values())
+
+    @property
+    def extracted_bytes(self) -> int:
+        return sum(layer["extracted"] for layer in self.layers.values())
+
+    @property
+    def completed_layers(self) -> int:
+        return sum(
+            layer["status"] in DONE_LAYER_STATUSES for layer in self.layers.values()
+        )
+
+    def is_stalled(self, window: float, now: Optional[float] = None) -> bool:
+        """
+        Whether the pull made no progress for the stall window: no message arrived at all, or
+        a downloading or extracting layer did not move.
+        """
+        now = now if now is not None else time.monotonic()
+        if now - self.updated_at >= window:
+            return True
+        return any(
+            layer["status"] in ACTIVE_LAYER_STATUSES
+            and now - layer["changed_at"] >= window
+            for layer in self.layers.values()
+        )
+
+    def describe(self) -> str:
+        if not self.layers:
+            return self.status
+        return f"{self.completed_layers}/{len(self.layers)} layers"
+
+
+def pull_image(
+    client: "docker.DockerClient",
+    repository: str,
+    tag: str,
+    on_progress: Optional[Callable[[PullProgress], None]] = None,
+    stall_timeout: Optional[float] = None,
+    retries: int = PULL_MAX_RETRIES,
+):
+    """
+    Pull an image with docker-py's streaming pull API, retrying it when it stalls.
+
+    A pull that goes completely silent is caught by the client's read timeout.
+
+    Args:
+        client (docker.DockerClient): The Docker client.
+        repository (str): The image repository.
+        tag (str): The image tag.
+        on_progress (Callable[[PullProgress], None], optional): Called after every progress message.
+        stall_timeout (float, optional): The stall window in seconds. Defaults to `get_stall_timeout()`.
+        retries (int): The number of times a stalled pull is retried.
+
+    Raises:
+        PullStalled: If the pull still stalls after the retries.
+    """
+    from requests.exceptions import RequestException
+
+    stall_timeout = stall_timeout if stall_timeout is not None else get_stall_timeout()
+    for attempt in range(retries + 1):
+        progress = PullProgress()
+        stream = client.api.pull(repository, tag, stream=True, decode=True)
+        try:
+            for message in stream:
+                if "error" in message:
+                    raise Exception(message["error"])
+                progress.update(message)
+                if on_progress is not None:
+                    on_progress(progress)
+                if progress.is_stalled(stall_timeout):
+                    raise PullStalled(f"{repository}:{tag} made no progress.")
+            return
+        except (PullStalled, RequestException) as e:
+            logger.error(
+                f"Pull of {repository}:{tag} stalled (attempt {attempt + 1}/{retries + 1}): {e}"
+            )
+        finally:
+            stream.close()
+    raise PullStalled(f"Pull of {repository}:{tag} stalled {retries + 1} times.")
+
+
+async def pull_image_async(
+    engine: "AsyncDockerEngine",
+    repository: str,
+    tag: str,
+    on_progress: Optional[Callable[[PullProgress], None]] = None,
+    stall_timeout: Optional[float] = None,
+    retries: int = PULL_MAX_RETRIES,
+):
+    """
+    Pull an image on the asyncio Docker engine, aborting and retrying it when it stalls.
+    Aborting closes the pull's connection, which cancels the pull in the Docker daemon.
+
+    Args:
+        engine (AsyncDockerEngine): The Docker engine.
+        repository (str): The image repository.
+        tag (str): The image tag.
+        on_progress (Callable[[PullProgress], None], optional): Called after every progress message.
+        stall_timeout (float, optional): The stall window in seconds. Defaults to `get_stall_timeout()`.
+        retries (int): The number of times a stalled pull is retried.
+
+    Raises:
+        PullStalled: If the pull still stalls after the retries.
+    """
+    stall_timeout = stall_timeout if stall_timeout is not None else get_stall_timeout()
+    for attempt in range(retries + 1):
+        progress = PullProgress()
+
+        def update(message: Dict[str, Any]):
+            progress.update(message)
+            if on_progress is not None:
+                on_progress(progress)
+
+        pull = asyncio.ensure_future(engine.pull(repository, tag, on_progress=update))
+        while not pull.done():
+            await asyncio.wait({pull}, timeout=min(stall_timeout, 5))
+            if not pull.done() and progress.is_stalled(stall_timeout):
+                pull.cancel()
+                try:
+                    await pull
+                except asyncio.CancelledError:
+                    pass
+                break
+        if not pull.cancelled():
+            pull.result()
+            return
+        logger.error(
+            f"Pull of {repository}:{tag} stalled (attempt {attempt + 1}/{retries + 1})."
+        )
+    raise PullStalled(f"Pull of {repository}:{tag} stalled {retries + 1} times.")
+
+
+class PullPlan:
+    """
+    Schedule the pulls of several images so that each layer they share is fetched once.
+
+    Pulls are started in order of the not yet fetched bytes they share with the other pending
+    images, so shared layers are fetched first. A pull is held back while a running pull is
+    fetching one of its layers; once that pull completes, the layer is present and the held
+    pull only fetches its own layers. Images whose layers are unknown are never held back.
+
+    Args:
+        layers (Dict[str, List[Tuple[str, int]]]): The digest and size of the layers of each image, keyed by image reference.
+    """
+
+    def __init__(self, layers: Dict[str, List[Tuple[str, int]]]):
+        self.layers = {image: dict(image_layers) for image, image_layers in layers.items()}
+        self.sizes = {
+            digest: size
+            for image_layers in self.layers.values()
+            for digest, size in image_layers.items()
+        }
+        self.fetched: Set[str] = set()
+        self.present: Set[str] = set()  # layers that existed before they were pulled
+        self.pulled: Set[str] = set()  # images pulled successfully
+        self.running: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def for_images(
+        images: List[Tuple[str, str]], registry: Optional["RegistryClient"] = None
+    ) -> "PullPlan":
+        """
+        Build a plan from the registry manifests of (repository, tag) images, read in parallel.
+        Images whose manifest can not be read are pulled without being scheduled.
+        """
+        from zero.core.registry import RegistryClient
+
+        registry = registry if registry is not None else RegistryClient()
+
+        def get_layers(image: Tuple[str, str]) -> List[Tuple[str, int]]:
+            try:
+                return registry.get_layers(*image)
+            except Exception as e:
+                logger.info(f"Failed to read the manifest of {image[0]}:{image[1]}: {e}")
+                return []
+
+        with ThreadPoolExecutor() as executor:
+            layers = list(executor.map(get_layers, images))
+        return PullPlan(
+            {
+                f"{repository}:{tag}": image_layers
+                for (repository, tag), image_layers in zip(images, layers)
+            }
+        )
+
+    def get_shared_bytes(self, image: str, pending: List[str]) -> int:
+        # the bytes of the image's unfetched layers that other pending images also need
+        users = Counter(
+            digest for other in pending for digest in self.layers.get(other, {})
+        )
+        return sum(
+            size
+            for digest, size in self.layers.get(image, {}).items()
+            if digest not in self.fetched and users[digest] > 1
+        )
+
+    def next(self, pending: List[str]) -> List[str]:
+        """
+        Choose the pending images to start pulling now, and mark them running.
+        """
+        started = []
+        claimed = set().union(*self.running.values())
+        for image in sorted(
+            pending, key=lambda image: -self.get_shared_bytes(image, pending)
+        ):
+            layers = set(self.layers.get(image, {})) - self.fetched
+            if layers & claimed:
+                continue
+            self.running[image] = layers
+            claimed |= layers
+            started.append(image)
+        return started
+
+    def complete(self, image: str, progress: Optional[PullProgress] = None):
+        layers = self.running.pop(image, set())
+        if progress is not None:
+            # progress messages identify layers by the first 12 hex digits of their digest
+            existing = {
+                layer_id
+                for layer_id, layer in progress.layers.items()
+                if layer["status"] == "Already exists"
+            }
+            self.present.update(
+                digest
+                for digest in layers
+                if digest.split(":")[-1][:12] in existing and digest not in self.fetched
+            )
+        self.fetched |= layers
+        self.pulled.add(image)
+
+    def fail(self, image: str):
+        self.running.pop(image, None)
+
+    def get_report(self) -> Dict[str, int]:
+        """
+        Get the bytes of the pulled images: requested by all images, transferred once each
+        layer, and saved by fetching shared layers once and reusing present layers.
+        """
+        requested = sum(
+            sum(self.layers[image].values()) for image in self.pulled if image in self.layers
+        )
+        transferred = sum(self.sizes[digest] for digest in self.fetched - self.present)
+        return {
+            "requested": requested,
+            "transferred": transferred,
+            "saved": requested - transferred,
+        }
@@ -0,0 +1,131 @@
+"""
+This module provides a minimal client of the Docker Registry HTTP API (v2).
+It reads image manifests to list the layers (digest and compressed size) of an image without
+pulling it, so that pulls of images sharing layers can be scheduled to fetch each layer once.
+"""
+
+import base64
+import json
+import os
+import platform
+import re
+import urllib.error
+import urllib.parse
+import urllib.request
+from logging import getLogger
+from typing import Dict, List, Optional, Tuple
+
+from zero.core.constants import DOCKER_HUB_REGISTRY, REGISTRY_TIMEOUT_SECONDS
+
+logger = getLogger(__name__)
+
+MANIFEST_MEDIA_TYPES = [
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.oci.image.index.v1+json",
+]
+ARCHITECTURES = {"x86_64": "amd64", "aarch64": "arm64", "arm64": "arm64"}
+
+
+def parse_repository(repository: str) -> Tuple[str, str]:
+    """
+    Split an image repository into its registry and its name on that registry.
+
+    Returns:
+        Tuple[str, str]: The registry base URL and the repository name, e.g.
+        ("https://registry-1.docker.io", "nyunadmin/nyun_kompress").
+    """
+    host, _, rest = repository.partition("/")
+    if rest and (host == "localhost" or "." in host or ":" in host):
+        insecure = host.split(":")[0] in ("localhost", "127.0.0.1")
+        return f"{'http' if insecure else 'https'}://{host}", rest
+    if "/" not in repository:
+        repository = f"library/{repository}"
+    return DOCKER_HUB_REGISTRY, repository
+
+
+class RegistryClient:
+    """
+    Read image manifests from container registries.
+
+    Bearer tokens are requested as the registry asks for them (e.g. from Docker Hub's auth
+    service), with the DOCKER_USERNAME and DOCKER_ACCESS_TOKEN credentials when they are set.
+
+    Args:
+        timeout (float): The timeout of each registry request in seconds.
+    """
+
+    def __init__(self, timeout: float = REGISTRY_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._tokens: Dict[str, str] = {}
+
+    def _credentials(self) -> Optional[str]:
+        username = os.getenv("DOCKER_USERNAME")
+        if not username:
+            return None
+        secret = f"{username}:{os.getenv('DOCKER_ACCESS_TOKEN', '')}"
+        return base64.b64encode(secret.encode()).decode()
+
+    def _get_token(self, challenge: str) -> Optional[str]:
+        # answer a `WWW-Authenticate: Bearer realm=...,service=...,scope=...` challenge
+        params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+        realm = params.pop("realm", None)
+        if realm is None:
+            return None
+        request = urllib.request.Request(f"{realm}?{urllib.parse.urlencode(params)}")
+        credentials = self._credentials()
+        if credentials:
+            request.add_header("Authorization", f"Basic {credentials}")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = json.load(response)
+        return data.get("token") or data.get("access_token")
+
+    def _get(self, url: str, scope: str) -> Dict:
+        headers = {"Accept": ", ".join(MANIFEST_MEDIA_TYPES)}
+        for attempt in range(2):
+            if scope in self._tokens:
+                headers["Authorization"] = f"Bearer {self._tokens[scope]}"
+            request = urllib.request.Request(url, headers=headers)
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    return json.load(response)
+            except urllib.error.HTTPError as e:
+                challenge = e.headers.get("WWW-Authenticate", "")
+                if e.code != 401 or attempt or not challenge.startswith("Bearer"):
+                    raise
+                self._tokens[scope] = self._get_token(challenge[len("Bearer ") :])
+        raise RuntimeError(f"Unauthorized to read {url}.")
+
+    def get_layers(self, repository: str, tag: str) -> List[Tuple[str, int]]:
+        """
+        Get the layers of an image for the host platform.
+
+        Args:
+            repository (str): The image repository.
+            tag (str): The image tag.
+
+        Returns:
+            List[Tuple[str, int]]: The digest and compressed size of each layer.
+        """
+        registry, name = parse_repository(repository)
+        url = f"{registry}/v2/{name}/manifests/{tag}"
+        manifest = self._get(url, name)
+
+        if "manifests" in manifest:
+            # a multi-platform index: pick the manifest of the host platform
+            architecture = ARCHITECTURES.get(platform.machine(), platform.machine())
+            candidates = [
+                entry
+                for entry in manifest["manifests"]
+                if entry.get("platform", {}).get("os", "linux") == "linux"
+                and entry.get("platform", {}).get("architecture", architecture)
+                == architecture
+            ]
+            if not candidates:
+                raise ValueError(f"No {architecture} manifest for {repository}:{tag}.")
+            manifest = self._get(
+                f"{registry}/v2/{name}/manifests/{candidates[0]['digest']}", name
+            )
+
+        return [(layer["digest"], layer.get("size", 0)) for layer in manifest["layers"]]
@@ -0,0 +1,326 @@
+"""
+This module provides per-job resource requests and a placement engine for concurrent jobs.
+A job may request CPUs, memory and GPUs (a count, a fraction of a GPU, or specific device ids),
+in its script under the "RESOURCES" key or on the command line. The placement engine bin-packs
+jobs onto the host's CPU cores, memory and GPU devices, and translates each placement into the
+container's device requests and CPU/memory limits.
+"""
+
+import math
+import os
+import re
+import shutil
+import subprocess
+import threading
+from contextlib import contextmanager
+from logging import getLogger
+from typing import Any, Dict, List, Optional
+
+from zero.core.constants import YamlKeys, ResourceKeys
+
+logger = getLogger(__name__)
+
+MEMORY_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+def parse_memory(memory: Any) -> Optional[int]:
+    """
+    Parse a memory size, e.g. 1073741824, "512m" or "16g", into bytes.
+    """
+    if memory is None:
+        return None
+    if isinstance(memory, (int, float)):
+        return int(memory)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([bkmgt]?)i?b?\s*", str(memory).lower())
+    if not match:
+        raise ValueError(f"Invalid memory size: {memory}")
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2)])
+
+
+class ResourceRequest:
+    # the resources a job asks for; None means "not requested"
+
+    def __init__(
+        self,
+        cpus: Optional[float] = None,
+        memory: Optional[int] = None,
+        gpus: Optional[float] = None,
+        gpu_ids: Optional[List[str]] = None,
+    ):
+        if gpu_ids is not None:
+            gpu_ids = [str(gpu_id) for gpu_id in gpu_ids]
+            gpus = len(gpu_ids)
+        if cpus is not None and cpus <= 0:
+            raise ValueError(f"cpus must be positive, got {cpus}")
+        if gpus is not None and (gpus < 0 or (gpus > 1 and gpus != int(gpus))):
+            raise ValueError(
+                f"gpus must be a fraction of one GPU or a whole number, got {gpus}"
+            )
+        self.cpus = cpus
+        self.memory = memory
+        self.gpus = gpus
+        self.gpu_ids = gpu_ids
+
+    @staticmethod
+    def from_script(data: Dict[str, Any]) -> "ResourceRequest":
+        resources = data.get(YamlKeys.RESOURCES) or {}
+        return ResourceRequest(
+            cpus=resources.get(ResourceKeys.CPUS),
+            memory=parse_memory(resources.get(ResourceKeys.MEMORY)),
+            gpus=resources.get(ResourceKeys.GPUS),
+            gpu_ids=resources.get(ResourceKeys.GPU_IDS),
+        )
+
+    def merge(self, other: "ResourceRequest") -> "ResourceRequest":
+        # values set on `other` take precedence
+        if other.gpus is not None:
+            gpus, gpu_ids = other.gpus, other.gpu_ids
+        else:
+            gpus, gpu_ids = self.gpus, self.gpu_ids
+        return ResourceRequest(
+            cpus=other.cpus if other.cpus is not None else self.cpus,
+            memory=other.memory if other.memory is not None else self.memory,
+            gpus=gpus,
+            gpu_ids=gpu_ids,
+        )
+
+    def is_empty(self) -> bool:
+        return self.cpus is None and self.memory is None and self.gpus is None
+
+    def __str__(self):
+        fields = {
+            "cpus": self.cpus,
+            "memory": self.memory,
+            "gpus": self.gpus if self.gpu_ids is None else ",".join(self.gpu_ids),
+        }
+        return ", ".join(
+            f"{key}={value}" for key, value in fields.items() if value is not None
+        )
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class Placement:
+    # the host resources assigned to a job
+
+    def __init__(
+        self,
+        request: ResourceRequest,
+        cpu_ids: List[int],
+        gpu_shares: Dict[str, float],
+    ):
+        self.request = request
+        self.cpu_ids = cpu_ids
+        self.gpu_shares = gpu_shares
+
+    @property
+    def gpu_ids(self) -> List[str]:
+        return list(self.gpu_shares)
+
+    def get_container_kwargs(self) -> Dict[str, Any]:
+        """
+        Get the `client.containers.run` keyword arguments that apply this placement.
+        """
+        from docker.types import DeviceRequest
+
+        kwargs = {}
+        if self.request.gpus is not None:
+            kwargs["device_requests"] = (
+                [DeviceRequest(device_ids=self.gpu_ids, capabilities=[["gpu"]])]
+                if self.gpu_ids
+                else []
+            )
+        if self.request.cpus is not None:
+            kwargs["nano_cpus"] = int(self.request.cpus * 1e9)
+            kwargs["cpuset_cpus"] = ",".join(str(cpu) for cpu in self.cpu_ids)
+        if self.request.memory is not None:
+            kwargs["mem_limit"] = self.request.memory
+        return kwargs
+
+    def key(self) -> str:
+        return f"cpus={self.cpu_ids};memory={self.request.memory};gpus={self.gpu_shares}"
+
+    def __str__(self):
+        return f"Placement(cpus={self.cpu_ids}, memory={self.request.memory}, gpus={self.gpu_shares})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def discover_gpu_ids() -> List[str]:
+    # the GPU device ids visible on the host, via nvidia-smi
+    if shutil.which("nvidia-smi") is None:
+        return []
+    try:
+        output = subprocess.run(
+            ["nvidia-smi", "--query-gpu=index", "--format=csv,noheader"],
+            capture_output=True,
+            text=True,
+            timeout=10,
+            check=True,
+        ).stdout
+    except Exception as e:
+        logger.error(f"Failed to list GPUs with nvidia-smi: {e}")
+        return []
+    return [line.strip() for line in output.splitlines() if line.strip()]
+
+
+def get_cpu_ids() -> List[int]:
+    # the cores available to this process; macOS has no CPU affinity, so all of them
+    if hasattr(os, "sched_getaffinity"):
+        return list(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def get_total_memory() -> int:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+class PlacementEngine:
+    """
+    Place jobs on the host's CPU cores, memory and GPU devices.
+
+    CPU cores and whole GPUs are assigned exclusively. Fractional GPU requests (e.g. 0.5) are
+    best-fit bin-packed onto partially used devices. A job that does not fit waits until
+    running jobs release enough resources.
+
+    Args:
+        cpu_ids (List[int], optional): The CPU cores to place jobs on. Defaults to the cores available to this process.
+        memory (int, optional): The memory in bytes to place jobs in. Defaults to the host's physical memory.
+        gpu_ids (List[str], optional): The GPU devices to place jobs on. Defaults to the devices listed by nvidia-smi.
+    """
+
+    def __init__(
+        self,
+        cpu_ids: Optional[List[int]] = None,
+        memory: Optional[int] = None,
+        gpu_ids: Optional[List[str]] = None,
+    ):
+        self.cpu_ids = sorted(
+            cpu_ids if cpu_ids is not None else get_cpu_ids()
+        )
+        self.memory = memory if memory is not None else get_total_memory()
+        self.gpu_ids = [
+            str(gpu_id)
+            for gpu_id in (gpu_ids if gpu_ids is not None else discover_gpu_ids())
+        ]
+
+        self._free_cpus = set(self.cpu_ids)
+        self._free_memory = self.memory
+        self._free_gpus: Dict[str, float] = {gpu_id: 1.0 for gpu_id in self.gpu_ids}
+        self._changed = threading.Condition()
+
+    def validate(self, request: ResourceRequest):
+        # raise if the request could never be placed, even on an idle host
+        if request.cpus is not None and math.ceil(request.cpus) > len(self.cpu_ids):
+            raise ValueError(
+                f"Requested {request.cpus} CPUs, only {len(self.cpu_ids)} available."
+            )
+        if request.memory is not None and request.memory > self.memory:
+            raise ValueError(
+                f"Requested {request.memory} bytes of memory, only {self.memory} available."
+            )
+        if request.gpu_ids is not None:
+            unknown = set(request.gpu_ids) - set(self.gpu_ids)
+            if unknown:
+                raise ValueError(f"Requested unknown GPU(s): {', '.join(sorted(unknown))}.")
+        elif request.gpus is not None and math.ceil(request.gpus) > len(self.gpu_ids):
+            raise ValueError(
+                f"Requested {request.gpus} GPUs, only {len(self.gpu_ids)} available."
+            )
+
+    def place(self, request: ResourceRequest) -> Optional[Placement]:
+        """
+        Try to place a job right away.
+
+        Returns:
+            Optional[Placement]: The placement, or None if the job does not fit now.
+        """
+        with self._changed:
+            return self._place(request)
+
+    def acquire(
+        self, request: ResourceRequest, timeout: Optional[float] = None
+    ) -> Placement:
+        """
+        Place a job, waiting until it fits.
+
+        Raises:
+            ValueError: If the request can never be placed.
+            TimeoutError: If the job does not fit within the timeout.
+        """
+        self.validate(request)
+        with self._changed:
+            placement = self._place(request)
+            while placement is None:
+                if not self._changed.wait(timeout):
+                    raise TimeoutError(f"Timed out waiting to place {request}.")
+                placement = self._place(request)
+            return placement
+
+    def release(self, placement: Placement):
+        with self._changed:
+            self._free_cpus.update(placement.cpu_ids)
+            if placement.request.memory is not None:
+                self._free_memory += placement.request.memory
+            for gpu_id, share in placement.gpu_shares.items():
+                self._free_gpus[gpu_id] = min(1.0, self._free_gpus[gpu_id] + share)
+            self._changed.notify_all()
+
+    @contextmanager
+    def allocate(self, request: ResourceRequest):
+        # place the job for the duration of the block; an empty request is not placed
+        if request.is_empty():
+            yield None
+            return
+        placement = self.acquire(request)
+        try:
+            yield placement
+        finally:
+            self.release(placement)
+
+    def _place(self, request: ResourceRequest) -> Optional[Placement]:
+        cpu_ids = []
+        if request.cpus is not None:
+            count = math.ceil(request.cpus)
+            if count > len(self._free_cpus):
+                return None
+            cpu_ids = sorted(self._free_cpus)[:count]
+
+        if request.memory is not None and request.memory > self._free_memory:
+            return None
+
+        gpu_shares = self._place_gpus(request)
+        if gpu_shares is None:
+            return None
+
+        self._free_cpus.difference_update(cpu_ids)
+        if request.memory is not None:
+            self._free_memory -= request.memory
+        for gpu_id, share in gpu_shares.items():
+            self._free_gpus[gpu_id] -= share
+        return Placement(request, cpu_ids, gpu_shares)
+
+    def _place_gpus(self, request: ResourceRequest) -> Optional[Dict[str, float]]:
+        if not request.gpus:
+            return {}
+        if request.gpu_ids is not None:
+            if all(self._free_gpus[gpu_id] >= 1.0 for gpu_id in request.gpu_ids):
+                return {gpu_id: 1.0 for gpu_id in request.gpu_ids}
+            return None
+        if request.gpus >= 1:
+            free = [gpu_id for gpu_id in self.gpu_ids if self._free_gpus[gpu_id] >= 1.0]
+            if len(free) < request.gpus:
+                return None
+            return {gpu_id: 1.0 for gpu_id in free[: int(request.gpus)]}
+        # best fit: the device with the least free capacity that still fits the share
+        candidates = [
+            gpu_id
+            for gpu_id in self.gpu_ids
+            if self._free_gpus[gpu_id] + 1e-9 >= request.gpus
+        ]
+        if not candidates:
+            return None
+        gpu_id = min(candidates, key=lambda gpu_id: self._free_gpus[gpu_id])
+        return {gpu_id: request.gpus}
@@ -0,0 +1,289 @@
+"""
+This module provides a content-addressed cache of job results.
+A job is fingerprinted from its script contents, the resolved image id, the environment keys
+passed to its container and a manifest of the custom data. The outputs of a successful job
+(files created or modified under the script's OUTPUT_PATH) are stored in the workspace under
+".nyunservices/results/<fingerprint>", hard-linked when possible, and restored on a cache hit
+instead of running the job again.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from zero.core.constants import (
+    DockerPath,
+    WorkspaceSpec,
+    YamlKeys,
+    RESULT_CACHE_MAX_BYTES,
+)
+from zero.core.utils import get_environment_keys_from_workspace
+
+logger = getLogger(__name__)
+
+
+def get_directory_manifest(directory: Path) -> List[Tuple[str, int, int]]:
+    """
+    Get a manifest of the files under a directory, without reading them.
+
+    Returns:
+        List[Tuple[str, int, int]]: The sorted (relative path, size, mtime_ns) of each file.
+    """
+    manifest = []
+    if not directory.exists():
+        return manifest
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = Path(root) / name
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            manifest.append(
+                (str(path.relative_to(directory)), stat.st_size, stat.st_mtime_ns)
+            )
+    return sorted(manifest)
+
+
+def is_overlapping(path: Path, other: Path) -> bool:
+    # whether one path is the other, or under it
+    for parent, child in ((path, other), (other, path)):
+        try:
+            child.relative_to(parent)
+            return True
+        except ValueError:
+            pass
+    return False
+
+
+def get_output_path_on_host(
+    workspace_path: Path, data: Dict[str, Any]
+) -> Optional[Path]:
+    # map the script's OUTPUT_PATH inside the container to the workspace on the host
+    output_path = data.get(YamlKeys.OUTPUT_PATH)
+    if not output_path:
+        return None
+    output_path = Path(output_path)
+    try:
+        return workspace_path / output_path.relative_to(DockerPath.USER_DATA.value)
+    except ValueError:
+        return None
+
+
+class ResultCache:
+    """
+    Cache of job outputs keyed by job fingerprint, evicted least recently used first.
+
+    Args:
+        cache_dir (Path): The directory the results are stored in.
+        max_bytes (int): The size limit of the stored results.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = cache_dir / "index.json"
+        self._lock = threading.Lock()
+        # the output directories of the running jobs, and whether another job wrote into them
+        self._windows: List[Dict[str, Any]] = []
+
+    @staticmethod
+    def for_workspace(workspace_path: Path) -> "ResultCache":
+        return ResultCache(WorkspaceSpec.get_results_dir(workspace_path))
+
+    def get_fingerprint(
+        self,
+        file_path: Path,
+        workspace: "Workspace",
+        metadata: "DockerMetadata",
+        inputs: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Get the fingerprint of a job, or None if its image is not in the image index.
+        `inputs` is a digest of other files the job reads, such as the inputs of a pipeline stage.
+        """
+        entry = workspace.image_index.get(metadata.docker_image)
+        if entry is None:
+            return None
+        env_file = workspace.get_workspace_env_file()
+        environment = get_environment_keys_from_workspace(env_file) if env_file else {}
+
+        fingerprint = hashlib.sha256()
+        fingerprint.update(file_path.read_bytes())
+        fingerprint.update(entry["id"].encode())
+        fingerprint.update(json.dumps(sorted(environment.items())).encode())
+        fingerprint.update(
+            json.dumps(get_directory_manifest(workspace.custom_data_path)).encode()
+        )
+        if inputs is not None:
+            fingerprint.update(inputs.encode())
+        return fingerprint.hexdigest()
+
+    def run(
+        self,
+        file_path: Path,
+        workspace: "Workspace",
+        metadata: "DockerMetadata",
+        data: Dict[str, Any],
+        job: Callable[[], int],
+        force: bool = False,
+        inputs: Optional[str] = None,
+    ) -> Tuple[int, bool]:
+        """
+        Restore the outputs of a job from the cache, or run it and store its outputs.
+
+        Args:
+            file_path (Path): The script path.
+            workspace (Workspace): The workspace object.
+            metadata (DockerMetadata): The resolved docker metadata of the script.
+            data (Dict[str, Any]): The parsed script.
+            job (Callable[[], int]): Runs the script and returns its exit code.
+            force (bool): Run the job even if its outputs are cached.
+            inputs (str, optional): A digest of other files the job reads.
+
+        Returns:
+            Tuple[int, bool]: The exit code, and whether the outputs were restored from the cache.
+        """
+        output_dir = get_output_path_on_host(workspace.workspace_path, data)
+        fingerprint = (
+            self.get_fingerprint(file_path, workspace, metadata, inputs=inputs)
+            if output_dir
+            else None
+        )
+        if fingerprint is None:
+            logger.info(f"Result caching disabled for {file_path}.")
+            return job(), False
+
+        if not force and self.restore(fingerprint, workspace.workspace_path):
+            logger.info(f"Restored results of {file_path} ({fingerprint}) from cache.")
+            with self._lock:
+                self._mark_overlapping(output_dir)
+            return 0, True
+
+        # the outputs are the files that changed in the output directory while the job ran, so
+        # they are not stored when another job wrote into the same directory meanwhile
+        window = {"output_dir": output_dir, "overlapped": False}
+        with self._lock:
+            window["overlapped"] = self._mark_overlapping(output_dir)
+            self._windows.append(window)
+        try:
+            before = {
+                path: (size, mtime)
+                for path, size, mtime in get_directory_manifest(output_dir)
+            }
+            exit_code = job()
+        finally:
+            with self._lock:
+                self._windows.remove(window)
+        if exit_code == 0:
+            if window["overlapped"]:
+                logger.warning(
+                    f"Not caching the results of {file_path}: another job wrote to {output_dir} while it ran."
+                )
+                return exit_code, False
+            outputs = [
+                output_dir / path
+                for path, size, mtime in get_directory_manifest(output_dir)
+                if before.get(path) != (size, mtime)
+            ]
+            self.store(fingerprint, workspace.workspace_path, outputs)
+        return exit_code, False
+
+    def _mark_overlapping(self, output_dir: Path) -> bool:
+        # mark the running jobs writing into an output directory as overlapped, under the lock
+        overlapped = False
+        for window in self._windows:
+            if is_overlapping(window["output_dir"], output_dir):
+                window["overlapped"] = True
+                overlapped = True
+        return overlapped
+
+    def restore(self, fingerprint: str, workspace_path: Path) -> bool:
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(fingerprint)
+            if entry is None:
+                return False
+            files_dir = self.cache_dir / fingerprint
+            # outputs are hard-linked, so a file modified in place since it was stored invalidates the entry
+            for relative_path, size, mtime_ns in entry["outputs"]:
+                path = files_dir / relative_path
+                if not path.exists() or (
+                    path.stat().st_size,
+                    path.stat().st_mtime_ns,
+                ) != (size, mtime_ns):
+                    logger.error(f"Cached result {fingerprint} changed, evicting it.")
+                    self._evict(index, fingerprint)
+                    self._save_index(index)
+                    return False
+            for relative_path, _, _ in entry["outputs"]:
+                _link_or_copy(files_dir / relative_path, workspace_path / relative_path)
+            entry["used_at"] = time.time()
+            self._save_index(index)
+            return True
+
+    def store(self, fingerprint: str, workspace_path: Path, outputs: List[Path]):
+        files_dir = self.cache_dir / fingerprint
+        stored, size = [], 0
+        for output in outputs:
+            relative_path = str(output.relative_to(workspace_path))
+            _link_or_copy(output, files_dir / relative_path)
+            stat = (files_dir / relative_path).stat()
+            stored.append([relative_path, stat.st_size, stat.st_mtime_ns])
+            size += stat.st_size
+
+        with self._lock:
+            index = self._load_index()
+            index[fingerprint] = {
+                "outputs": stored,
+                "size": size,
+                "used_at": time.time(),
+            }
+            # evict the least recently used results beyond the size limit
+            total = sum(entry["size"] for entry in index.values())
+            for key in sorted(index, key=lambda key: index[key]["used_at"]):
+                if total <= self.max_bytes:
+                    break
+                total -= index[key]["size"]
+                self._evict(index, key)
+            self._save_index(index)
+
+    def _evict(self, index: Dict[str, Dict], fingerprint: str):
+        index.pop(fingerprint, None)
+        shutil.rmtree(self.cache_dir / fingerprint, ignore_errors=True)
+
+    def _load_index(self) -> Dict[str, Dict]:
+        if not self.index_path.exists():
+            return {}
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except Exception as e:
+            logger.error(f"Failed to read result cache index {self.index_path}: {e}")
+            return {}
+
+    def _save_index(self, index: Dict[str, Dict]):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(index, file, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+
+def _link_or_copy(source: Path, destination: Path):
+    # hard link when source and destination are on the same filesystem, copy otherwise
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    if destination.exists():
+        if os.path.samefile(source, destination):
+            return
+        destination.unlink()
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
@@ -0,0 +1,215 @@
+"""
+This module provides the run directories of scripts, which make long jobs resumable.
+Every script gets a stable run directory in the workspace (".nyunservices/runs/<script>-<hash>/")
+holding a state record of its attempts ("state.json") and a "checkpoints" directory. The job is
+told where to write its checkpoints, and, when resuming, which checkpoint to continue from,
+through environment variables (see RunEnv). The run directory is under the workspace mount,
+so the checkpoints are visible in the container at the same path on every attempt.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from zero.core.constants import DockerPath, JobStatus, RunEnv, WorkspaceSpec, RUN_LABEL
+
+logger = getLogger(__name__)
+
+CHECKPOINTS = "checkpoints"
+PREVIOUS_CHECKPOINTS = "checkpoints.previous"
+RUN_STATE = "state.json"
+
+
+def get_checkpoint_step(path: Path) -> Optional[int]:
+    # the step of checkpoints named like "checkpoint-1200", "epoch_3.pt" or "step100.ckpt"
+    match = re.search(r"(\d+)(\.\w+)?$", path.name)
+    return int(match.group(1)) if match else None
+
+
+class RunDirectory:
+    """
+    The run directory of a script, with the state of its attempts and its checkpoints.
+
+    Args:
+        workspace_path (Path): The workspace path.
+        script (Path): The script path.
+    """
+
+    def __init__(self, workspace_path: Path, script: Path):
+        self.workspace_path = workspace_path
+        self.script = script.absolute().resolve()
+        key = hashlib.sha256(str(self.script).encode()).hexdigest()[:8]
+        self.path = WorkspaceSpec.get_runs_dir(workspace_path) / f"{script.stem}-{key}"
+        self.checkpoints_path = self.path / CHECKPOINTS
+        self.state_path = self.path / RUN_STATE
+        # the checkpoint the current attempt resumes from
+        self.resume_from: Optional[Path] = None
+        self._lock = threading.Lock()
+
+    def load_state(self) -> Dict[str, Any]:
+        if not self.state_path.exists():
+            return {"attempts": []}
+        try:
+            with open(self.state_path, "r") as file:
+                return json.load(file)
+        except Exception as e:
+            logger.error(f"Failed to read run state {self.state_path}: {e}")
+            return {"attempts": []}
+
+    def _save_state(self, state: Dict[str, Any]):
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(state, file, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def get_checkpoints(self) -> List[Path]:
+        if not self.checkpoints_path.exists():
+            return []
+        return [
+            path
+            for path in self.checkpoints_path.iterdir()
+            if not path.name.startswith(".")
+        ]
+
+    def get_last_checkpoint(self) -> Optional[Path]:
+        """
+        Find the last checkpoint the job wrote: the one with the highest step if the checkpoints
+        are numbered, and the most recently modified one otherwise.
+
+        Returns:
+            Optional[Path]: The checkpoint file or directory, or None if there is none.
+        """
+        checkpoints = self.get_checkpoints()
+        numbered = [path for path in checkpoints if get_checkpoint_step(path) is not None]
+        if numbered:
+            return max(
+                numbered, key=lambda path: (get_checkpoint_step(path), path.stat().st_mtime)
+            )
+        if checkpoints:
+            return max(checkpoints, key=lambda path: path.stat().st_mtime)
+        return None
+
+    def prepare(
+        self, resume: bool, client: Optional["docker.DockerClient"] = None
+    ) -> Optional[Path]:
+        """
+        Prepare the run directory for a new attempt.
+
+        Without `resume`, the checkpoints of earlier attempts are moved to "checkpoints.previous"
+        (replacing older ones), so the job starts from scratch without losing the last attempt.
+
+        Args:
+            resume (bool): Whether to resume from the last checkpoint.
+            client (docker.DockerClient, optional): The client of the Docker host the attempt
+                runs on, to check that no container of an earlier attempt is still running.
+
+        Returns:
+            Optional[Path]: The checkpoint the attempt resumes from, or None.
+
+        Raises:
+            RuntimeError: If resuming while a container of an earlier attempt is still running,
+                as it may still write to the checkpoints.
+        """
+        if resume:
+            from zero.core.utils import get_docker_containers
+
+            containers = get_docker_containers(self.get_labels(), client=client)
+            if containers:
+                raise RuntimeError(
+                    f"Container {containers[0].short_id} of an earlier run of {self.script} is "
+                    "still running; wait for it to exit or kill it before resuming."
+                )
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.resume_from = self.get_last_checkpoint() if resume else None
+        if not resume and self.get_checkpoints():
+            previous_path = self.path / PREVIOUS_CHECKPOINTS
+            shutil.rmtree(previous_path, ignore_errors=True)
+            os.replace(self.checkpoints_path, previous_path)
+        self.checkpoints_path.mkdir(parents=True, exist_ok=True)
+        return self.resume_from
+
+    def start(
+        self,
+        metadata: "DockerMetadata",
+        log_file_path: Optional[Path] = None,
+        host: Optional[str] = None,
+    ):
+        # record the start of an attempt, on this machine unless another docker host is given
+        with self._lock:
+            state = self.load_state()
+            state.update(
+                {
+                    "script": str(self.script),
+                    "script_sha256": hashlib.sha256(self.script.read_bytes()).hexdigest(),
+                    "image": str(metadata.docker_image),
+                    "algorithm": str(metadata.algorithm),
+                    "status": JobStatus.RUNNING,
+                }
+            )
+            state["attempts"].append(
+                {
+                    "started_at": time.time(),
+                    "host": host or socket.gethostname(),
+                    "pid": os.getpid(),
+                    "log": str(log_file_path) if log_file_path else None,
+                    "resumed_from": (
+                        str(self.resume_from.relative_to(self.path))
+                        if self.resume_from
+                        else None
+                    ),
+                }
+            )
+            self._save_state(state)
+
+    def finish(self, status: JobStatus, exit_code: Optional[int] = None):
+        # record the end of the current attempt
+        with self._lock:
+            state = self.load_state()
+            state["status"] = status
+            if state["attempts"]:
+                state["attempts"][-1].update(
+                    {
+                        "finished_at": time.time(),
+                        "exit_code": exit_code,
+                        "checkpoint": (
+                            str(self.get_last_checkpoint().relative_to(self.path))
+                            if self.get_checkpoints()
+                            else None
+                        ),
+                    }
+                )
+            self._save_state(state)
+
+    def get_path_in_docker(self, path: Path) -> Path:
+        # the run directory is under the workspace, which is mounted on DockerPath.USER_DATA
+        return DockerPath.USER_DATA.value / path.relative_to(self.workspace_path)
+
+    def get_environment(self) -> Dict[str, str]:
+        environment = {
+            str(RunEnv.CHECKPOINT_DIR): str(
+                self.get_path_in_docker(self.checkpoints_path)
+            )
+        }
+        if self.resume_from is not None:
+            environment[str(RunEnv.RESUME_FROM)] = str(
+                self.get_path_in_docker(self.resume_from)
+            )
+        return environment
+
+    def get_labels(self) -> Dict[str, str]:
+        # the labels of the script's containers, to find them while they run
+        return {RUN_LABEL: str(self.path.absolute())}
+
+    def __str__(self):
+        return f"RunDirectory({self.path})"
+
+    def __repr__(self):
+        return self.__str__()
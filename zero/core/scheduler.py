@@ -0,0 +1,200 @@
+"""
+This module provides a bounded job scheduler used to run multiple scripts concurrently.
+Each script is dispatched to a worker thread, at most `max_jobs` at a time, and its
+outcome is collected into a `JobResult`. Scripts may depend on other scripts, in which case
+they are dispatched once all of their dependencies succeeded, and skipped if one did not.
+Only the main thread is interrupted by Ctrl+C: the scheduler then drops the scripts that have not
+started and lets the caller stop the running ones, instead of waiting for them to finish.
+"""
+
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from zero.core.constants import JobStatus
+
+logger = getLogger(__name__)
+
+
+class JobResult:
+    # a class to store the outcome of a single scheduled script
+
+    def __init__(
+        self,
+        script: Path,
+        status: JobStatus,
+        exit_code: Optional[int] = None,
+        error: Optional[str] = None,
+        duration: float = 0.0,
+    ):
+        self.script = script
+        self.status = status
+        self.exit_code = exit_code
+        self.error = error
+        self.duration = duration
+
+    @property
+    def succeeded(self) -> bool:
+        return self.status == JobStatus.SUCCEEDED
+
+    def __str__(self):
+        return f"{self.script}: {self.status} (exit code: {self.exit_code})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class JobScheduler:
+    """
+    Run scripts with a bounded number of concurrent jobs.
+
+    Args:
+        max_jobs (int): The maximum number of jobs to run at once.
+        stop_on_failure (bool): Skip the jobs that have not started yet once a job fails.
+    """
+
+    def __init__(self, max_jobs: int = 1, stop_on_failure: bool = False):
+        if max_jobs < 1:
+            raise ValueError(f"max_jobs must be at least 1, got {max_jobs}")
+        self.max_jobs = max_jobs
+        self.stop_on_failure = stop_on_failure
+        self._failed = threading.Event()
+        self._interrupted = threading.Event()
+
+    def is_interrupted(self) -> bool:
+        # whether the last run was interrupted; its running jobs are being stopped
+        return self._interrupted.is_set()
+
+    def run(
+        self,
+        scripts: List[Path],
+        job: Callable[[Path], int],
+        on_start: Optional[Callable[[Path], None]] = None,
+        on_finish: Optional[Callable[[JobResult], None]] = None,
+        dependencies: Optional[Dict[Path, List[Path]]] = None,
+        on_interrupt: Optional[Callable[[List[Path]], None]] = None,
+    ) -> List[JobResult]:
+        """
+        Run `job` for each script and wait for all of them to finish.
+
+        Args:
+            scripts (List[Path]): The scripts to run, in submission order.
+            job (Callable[[Path], int]): Runs a script to completion and returns its exit code.
+            on_start (Callable[[Path], None], optional): Called when a script starts running.
+            on_finish (Callable[[JobResult], None], optional): Called when a script finishes or is skipped.
+            dependencies (Dict[Path, List[Path]], optional): The scripts each script waits for. They must not form a cycle.
+            on_interrupt (Callable[[List[Path]], None], optional): Called with the running scripts
+                when the run is interrupted, to stop them. The run does not wait for them.
+
+        Returns:
+            List[JobResult]: The results, in the same order as `scripts`.
+
+        Raises:
+            KeyboardInterrupt: If the run is interrupted.
+        """
+        self._failed.clear()
+        self._interrupted.clear()
+        dependencies = dependencies or {}
+
+        def wrap(script: Path) -> JobResult:
+            if self._interrupted.is_set():
+                result = JobResult(script, JobStatus.INTERRUPTED)
+            elif self.stop_on_failure and self._failed.is_set():
+                result = JobResult(script, JobStatus.SKIPPED)
+            else:
+                if on_start:
+                    on_start(script)
+                start = time.monotonic()
+                try:
+                    exit_code = job(script)
+                    if self._interrupted.is_set():
+                        status = JobStatus.INTERRUPTED
+                    elif exit_code == 0:
+                        status = JobStatus.SUCCEEDED
+                    else:
+                        status = JobStatus.FAILED
+                    result = JobResult(
+                        script,
+                        status,
+                        exit_code=exit_code,
+                        duration=time.monotonic() - start,
+                    )
+                except Exception as e:
+                    interrupted = self._interrupted.is_set()
+                    if not interrupted:
+                        logger.exception(f"Job {script} failed: {e}")
+                    result = JobResult(
+                        script,
+                        JobStatus.INTERRUPTED if interrupted else JobStatus.FAILED,
+                        error=str(e) or type(e).__name__,
+                        duration=time.monotonic() - start,
+                    )
+                if not result.succeeded:
+                    self._failed.set()
+            if on_finish:
+                on_finish(result)
+            return result
+
+        results: Dict[Path, JobResult] = {}
+        pending = list(scripts)
+        running: Dict[Future, Path] = {}
+        # the executor is not used as a context manager: its exit waits for the running jobs
+        executor = ThreadPoolExecutor(max_workers=self.max_jobs)
+        try:
+            while pending or running:
+                # dispatch the scripts whose dependencies succeeded, and skip the ones whose
+                # dependencies did not; skipping a script may in turn skip its dependents
+                dispatched = True
+                while dispatched:
+                    dispatched = False
+                    for script in list(pending):
+                        waiting_for = dependencies.get(script, [])
+                        failed = [
+                            dependency
+                            for dependency in waiting_for
+                            if dependency in results
+                            and not results[dependency].succeeded
+                        ]
+                        if failed:
+                            result = JobResult(
+                                script,
+                                JobStatus.SKIPPED,
+                                error=f"Dependency {failed[0]} did not succeed.",
+                            )
+                            results[script] = result
+                            if on_finish:
+                                on_finish(result)
+                        elif all(dependency in results for dependency in waiting_for):
+                            running[executor.submit(wrap, script)] = script
+                        else:
+                            continue
+                        pending.remove(script)
+                        dispatched = True
+                if not running:
+                    # only scripts waiting for scripts that are not scheduled are left
+                    for script in pending:
+                        results[script] = JobResult(
+                            script,
+                            JobStatus.SKIPPED,
+                            error="Dependencies are not scheduled.",
+                        )
+                        if on_finish:
+                            on_finish(results[script])
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        except KeyboardInterrupt:
+            # drop the jobs that have not started (`cancel_futures` needs Python 3.9), and
+            # stop the running ones; the workers never see the interrupt themselves
+            self._interrupted.set()
+            started = [script for future, script in running.items() if not future.cancel()]
+            if on_interrupt:
+                on_interrupt(started)
+            executor.shutdown(wait=False)
+            raise
+        executor.shutdown()
+        return [results[script] for script in scripts]
@@ -0,0 +1,210 @@
+"""
+This module provides utilities for loading script configs (YAML or JSON).
+Scripts are parsed with the C-accelerated YAML loader when it is available, and parsed
+configs are cached in the workspace keyed by path, mtime and content hash.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from zero.core.constants import (
+    Algorithm,
+    Platform,
+    YamlKeys,
+    WorkspaceSpec,
+    SCRIPT_CACHE_MAX_ENTRIES,
+)
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+logger = getLogger(__name__)
+
+
+def parse_script(content: bytes) -> Dict[str, Any]:
+    data = yaml.load(content, Loader=SafeLoader)
+    if not isinstance(data, dict):
+        raise ValueError("Script must be a mapping of keys to values.")
+    return data
+
+
+def get_algorithm_and_platform(
+    data: Dict[str, Any]
+) -> Tuple[Algorithm, Optional[Platform]]:
+    """
+    Get the algorithm (or adapt task) and the platform of a parsed script.
+
+    Args:
+        data (Dict[str, Any]): The parsed script.
+
+    Returns:
+        Tuple[Algorithm, Optional[Platform]]: The algorithm and the platform, if any.
+
+    Raises:
+        KeyError: If the script has neither an 'ALGORITHM' nor a 'TASK' key.
+        ValueError: If the algorithm or the platform is not supported.
+    """
+    if not data.get(YamlKeys.ALGORITHM, data.get(YamlKeys.TASK, False)):
+        raise KeyError("Atleast one of 'ALGORITHM' or 'TASK' key is required.")
+
+    algorithm = Algorithm(data.get(YamlKeys.ALGORITHM) or data.get(YamlKeys.TASK))
+    platform = (
+        Platform(data.get(YamlKeys.PLATFORM)) if data.get(YamlKeys.PLATFORM) else None
+    )
+    return algorithm, platform
+
+
+def is_json_data(data: Any) -> bool:
+    # whether data reads back the same from JSON
+    try:
+        return json.loads(json.dumps(data)) == data
+    except (TypeError, ValueError):
+        return False
+
+
+class ScriptCache:
+    """
+    Cache of parsed scripts, keyed by the resolved script path.
+
+    An entry is reused as is while the file's mtime and size are unchanged, and after a
+    re-read when only its mtime changed but its content hash did not. Callers get a copy of
+    the cached script. The cache is persisted as JSON; scripts with values JSON cannot hold
+    (e.g. dates, or keys that are not strings) are only cached in memory.
+
+    Args:
+        cache_path (Path, optional): The file the cache is persisted to. If None, the cache is kept in memory only.
+    """
+
+    def __init__(self, cache_path: Optional[Path] = None):
+        self.cache_path = cache_path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def for_workspace(workspace_path: Path) -> "ScriptCache":
+        return ScriptCache(WorkspaceSpec.get_script_cache_path(workspace_path))
+
+    def load(self):
+        if self.cache_path is None or not self.cache_path.exists():
+            return
+        try:
+            with open(self.cache_path, "r") as file:
+                entries = json.load(file)
+            if not isinstance(entries, dict):
+                raise ValueError("not a mapping of scripts")
+            self.entries = entries
+        except Exception as e:
+            logger.error(f"Failed to read script cache {self.cache_path}: {e}")
+            self.entries = {}
+
+    def save(self):
+        if self.cache_path is None or not self._dirty:
+            return
+        with self._lock:
+            # keep the most recently used entries
+            entries = dict(
+                sorted(
+                    (
+                        (key, entry)
+                        for key, entry in self.entries.items()
+                        if is_json_data(entry["data"])
+                    ),
+                    key=lambda item: item[1]["used_at"],
+                    reverse=True,
+                )[:SCRIPT_CACHE_MAX_ENTRIES]
+            )
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_suffix(".tmp")
+            with open(tmp_path, "w") as file:
+                json.dump(entries, file)
+            os.replace(tmp_path, self.cache_path)
+            self._dirty = False
+
+    def get(self, file_path: Path) -> Dict[str, Any]:
+        """
+        Get the parsed script, parsing it only if it changed since it was cached.
+
+        Args:
+            file_path (Path): The script path.
+
+        Returns:
+            Dict[str, Any]: The parsed script.
+        """
+        key = str(file_path.absolute().resolve())
+        stat = file_path.stat()
+        entry = self.entries.get(key)
+
+        if entry and (entry["mtime_ns"], entry["size"]) == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            self._touch(key, entry, stat)
+            return copy.deepcopy(entry["data"])
+
+        content = file_path.read_bytes()
+        digest = hashlib.sha256(content).hexdigest()
+        if entry and entry["sha256"] == digest:
+            self._touch(key, entry, stat)
+            return copy.deepcopy(entry["data"])
+
+        data = parse_script(content)
+        self._touch(key, {"sha256": digest, "data": data}, stat)
+        return copy.deepcopy(data)
+
+    def _touch(self, key: str, entry: Dict[str, Any], stat: os.stat_result):
+        with self._lock:
+            entry.update(
+                mtime_ns=stat.st_mtime_ns, size=stat.st_size, used_at=time.time_ns()
+            )
+            self.entries[key] = entry
+            self._dirty = True
+
+
+def load_script(file_path: Path, cache: Optional[ScriptCache] = None) -> Dict[str, Any]:
+    if cache is not None:
+        return cache.get(file_path)
+    return parse_script(file_path.read_bytes())
+
+
+def load_scripts(
+    file_paths: List[Path], cache: Optional[ScriptCache] = None
+) -> Tuple[Dict[Path, Dict[str, Any]], Dict[Path, Exception]]:
+    """
+    Load scripts in parallel.
+
+    Args:
+        file_paths (List[Path]): The script paths.
+        cache (ScriptCache, optional): The cache of parsed scripts to use and update.
+
+    Returns:
+        Tuple[Dict[Path, Dict[str, Any]], Dict[Path, Exception]]: The parsed scripts, and the
+        errors of the scripts that failed to load.
+    """
+    scripts, errors = {}, {}
+    with ThreadPoolExecutor() as executor:
+        futures = {
+            file_path: executor.submit(load_script, file_path, cache)
+            for file_path in file_paths
+        }
+        for file_path, future in futures.items():
+            try:
+                scripts[file_path] = future.result()
+            except Exception as e:
+                errors[file_path] = e
+    if cache is not None:
+        cache.save()
+    return scripts, errors
@@ -0,0 +1,420 @@
+"""
+This module provides staging of the custom data directory for containers.
+By default the custom data directory is bind mounted into every container. When it sits on a
+slow or network filesystem, it can instead be staged into a local cache directory or a named
+docker volume, which is then mounted read-only by every job. Staging is incremental: only files
+whose size and mtime changed, and whose content hash differs, are copied, and deleted files are
+removed. The state of each staged copy is kept in the workspace (".nyunservices/staging/").
+Directories are staged the same way into volumes on other docker hosts (see zero.core.hosts),
+with the files sent as archives over the Docker API, and files written there can be copied back.
+"""
+
+import fcntl
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from logging import getLogger
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from zero.core.constants import (
+    DataStaging,
+    WorkspaceSpec,
+    DATA_CACHE_DIR,
+    DATA_VOLUME_PREFIX,
+    DATA_STAGING_JOBS,
+    DATA_ARCHIVE_SPOOL_BYTES,
+)
+from zero.core.results import get_directory_manifest
+
+logger = getLogger(__name__)
+
+SYNC_SCRIPT = (
+    "cd /src && if [ -s /plan/copy ]; then xargs -0 cp -a --parents -t /dst < /plan/copy; fi"
+    " && cd /dst && if [ -s /plan/delete ]; then xargs -0 rm -f < /plan/delete; fi"
+)
+# the copied files are extracted into the volume before the container starts
+DELETE_SCRIPT = "cd /dst && if [ -s /plan/delete ]; then xargs -0 rm -f < /plan/delete; fi"
+
+
+def get_file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def copy_file(source: Path, destination: Path) -> str:
+    # copy a file atomically, keeping its mtime, and return its content hash
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=destination.parent, prefix=".nyun-")
+    try:
+        with open(source, "rb") as src, os.fdopen(fd, "wb") as dst:
+            for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+        shutil.copystat(source, tmp_path)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    return digest.hexdigest()
+
+
+def extract_files(tar: tarfile.TarFile, members: List[tarfile.TarInfo], destination: Path):
+    # extract regular files from an archive with the "data" extraction filter, or with the same
+    # checks on Python versions without it: no paths outside the destination, no special modes
+    if hasattr(tarfile, "data_filter"):
+        tar.extractall(destination, members=members, filter="data")
+        return
+    root = os.path.realpath(destination)
+    for member in members:
+        path = os.path.realpath(os.path.join(destination, member.name))
+        if os.path.commonpath([root, path]) != root:
+            raise tarfile.TarError(f"{member.name} is outside of {destination}.")
+        member.mode &= 0o755
+    tar.extractall(destination, members=members)
+
+
+class StagedData:
+    # where the custom data of a run is mounted from
+
+    def __init__(self, mode: DataStaging, source: str):
+        self.mode = mode
+        self.source = source
+
+    def get_mount(self, target: str, read_only: bool = True) -> "Mount":
+        from docker.types import Mount
+
+        return Mount(
+            source=self.source,
+            target=target,
+            type="volume" if self.mode == DataStaging.VOLUME else "bind",
+            read_only=read_only,
+        )
+
+    def __str__(self):
+        return f"StagedData({self.mode}, {self.source})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class DataStager:
+    """
+    Stage a custom data directory into a local cache directory or a named docker volume.
+
+    Args:
+        workspace_path (Path): The workspace path; the staging state is kept in it.
+        custom_data_path (Path): The custom data directory to stage.
+        mode (DataStaging): Where to stage the data.
+        cache_dir (Path): The directory cache copies are kept under.
+        host (DockerHost, optional): Stage into a volume on this docker host instead of the local daemon.
+        exclude (Iterable[str]): Paths relative to the directory that are not staged.
+    """
+
+    def __init__(
+        self,
+        workspace_path: Path,
+        custom_data_path: Path,
+        mode: DataStaging,
+        cache_dir: Path = DATA_CACHE_DIR,
+        host: Optional["DockerHost"] = None,
+        exclude: Iterable[str] = (),
+    ):
+        self.workspace_path = workspace_path
+        self.custom_data_path = custom_data_path.absolute().resolve()
+        self.mode = DataStaging(mode)
+        self.host = host
+        self.exclude = tuple(exclude)
+        if host is not None and self.mode != DataStaging.VOLUME:
+            raise ValueError("Data can only be staged into a volume on another docker host.")
+        key = hashlib.sha256(str(self.custom_data_path).encode()).hexdigest()[:16]
+        self.name = f"{DATA_VOLUME_PREFIX}{key}"
+        self.cache_path = cache_dir.absolute() / key
+        state_name = f"{self.mode}-{key}" if host is None else f"{self.mode}-{key}-{host.name}"
+        self.state_path = WorkspaceSpec.get_staging_dir(workspace_path) / f"{state_name}.json"
+
+    def stage(self, image: Optional["NyunDocker"] = None) -> StagedData:
+        """
+        Bring the staged copy up to date with the custom data directory.
+
+        Args:
+            image (NyunDocker, optional): A local image to run the volume sync container on. Required for volume staging.
+
+        Returns:
+            StagedData: The mount source of the staged data.
+        """
+        if self.mode == DataStaging.BIND:
+            return StagedData(DataStaging.BIND, str(self.custom_data_path))
+
+        with self._lock():
+            state = self._load_state()
+            if self.mode == DataStaging.VOLUME and not self._volume_exists():
+                state = {}
+            copy, delete, unchanged = self.plan(state)
+            logger.info(
+                f"Staging {self.custom_data_path} into {self}: {len(copy)} file(s) to copy, "
+                f"{len(delete)} to delete, {len(unchanged)} unchanged."
+            )
+            if self.mode == DataStaging.CACHE:
+                hashes = self._sync_cache(copy, delete)
+            else:
+                hashes = self._sync_volume(copy, delete, image)
+            files = {path: state[path] for path in unchanged}
+            for path, digest in hashes.items():
+                stat = (self.custom_data_path / path).stat()
+                files[path] = [stat.st_size, stat.st_mtime_ns, digest]
+            self._save_state(files)
+
+        source = self.name if self.mode == DataStaging.VOLUME else str(self.cache_path)
+        return StagedData(self.mode, source)
+
+    def plan(
+        self, state: Dict[str, List]
+    ) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Compare the custom data directory with the staged copy.
+
+        Returns:
+            Tuple[List[str], List[str], List[str]]: The relative paths of the files to copy, to delete, and unchanged.
+        """
+        copy, unchanged = [], []
+        manifest = [
+            entry
+            for entry in get_directory_manifest(self.custom_data_path)
+            if not self._is_excluded(entry[0])
+        ]
+        for path, size, mtime_ns in manifest:
+            previous = state.get(path)
+            if previous is None or previous[0] != size:
+                copy.append(path)
+            elif previous[1] == mtime_ns and self._is_staged(path):
+                unchanged.append(path)
+            elif previous[2] == get_file_hash(self.custom_data_path / path) and (
+                self._is_staged(path)
+            ):
+                # touched but not modified: keep the staged file, remember the new mtime
+                state[path] = [size, mtime_ns, previous[2]]
+                unchanged.append(path)
+            else:
+                copy.append(path)
+        sources = {path for path, _, _ in manifest}
+        delete = [path for path in state if path not in sources]
+        return copy, delete, unchanged
+
+    def _is_excluded(self, path: str) -> bool:
+        return any(
+            path == excluded or path.startswith(f"{excluded}/") for excluded in self.exclude
+        )
+
+    def _is_staged(self, path: str) -> bool:
+        # files in a cache directory can be deleted behind our back; a volume is checked as a whole
+        if self.mode == DataStaging.CACHE:
+            return (self.cache_path / path).exists()
+        return True
+
+    def _sync_cache(self, copy: List[str], delete: List[str]) -> Dict[str, str]:
+        with ThreadPoolExecutor(DATA_STAGING_JOBS) as executor:
+            hashes = dict(
+                zip(
+                    copy,
+                    executor.map(
+                        lambda path: copy_file(
+                            self.custom_data_path / path, self.cache_path / path
+                        ),
+                        copy,
+                    ),
+                )
+            )
+        for path in delete:
+            (self.cache_path / path).unlink(missing_ok=True)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        return hashes
+
+    def _sync_volume(
+        self, copy: List[str], delete: List[str], image: Optional["NyunDocker"]
+    ) -> Dict[str, str]:
+        from docker.types import Mount
+
+        client = self._get_client()
+        if not self._volume_exists():
+            client.volumes.create(name=self.name, labels={"ai.nyun.custom-data": str(self.custom_data_path)})
+        if (copy or delete) and image is None:
+            raise ValueError("An image is required to sync a custom data volume.")
+        if (copy or delete) and self.host is not None:
+            self._upload(copy, delete, image)
+        elif copy or delete:
+            with tempfile.TemporaryDirectory(prefix="nyun-staging-") as plan_dir:
+                Path(plan_dir, "copy").write_bytes(b"".join(f"./{path}\0".encode() for path in copy))
+                Path(plan_dir, "delete").write_bytes(
+                    b"".join(f"./{path}\0".encode() for path in delete)
+                )
+                client.containers.run(
+                    image=str(image),
+                    entrypoint="sh",
+                    command=["-c", SYNC_SCRIPT],
+                    mounts=[
+                        Mount(source=str(self.custom_data_path), target="/src", type="bind", read_only=True),
+                        Mount(source=self.name, target="/dst", type="volume"),
+                        Mount(source=plan_dir, target="/plan", type="bind", read_only=True),
+                    ],
+                    remove=True,
+                )
+        with ThreadPoolExecutor(DATA_STAGING_JOBS) as executor:
+            return dict(
+                zip(
+                    copy,
+                    executor.map(
+                        lambda path: get_file_hash(self.custom_data_path / path), copy
+                    ),
+                )
+            )
+
+    def _upload(self, copy: List[str], delete: List[str], image: "NyunDocker"):
+        # the files can't be bind mounted from another host, so they are sent as an archive
+        from docker.types import Mount
+
+        client = self._get_client()
+        with tempfile.SpooledTemporaryFile(max_size=DATA_ARCHIVE_SPOOL_BYTES) as archive:
+            with tarfile.open(fileobj=archive, mode="w") as tar:
+                for path in copy:
+                    tar.add(self.custom_data_path / path, arcname=f"dst/{path}", recursive=False)
+                plan = b"".join(f"./{path}\0".encode() for path in delete)
+                info = tarfile.TarInfo("plan/delete")
+                info.size = len(plan)
+                tar.addfile(info, io.BytesIO(plan))
+            archive.seek(0)
+            container = client.containers.create(
+                image=str(image),
+                entrypoint="sh",
+                command=["-c", DELETE_SCRIPT],
+                mounts=[Mount(source=self.name, target="/dst", type="volume")],
+            )
+            try:
+                container.put_archive("/", archive)
+                container.start()
+                exit_code = container.wait().get("StatusCode", -1)
+                if exit_code != 0:
+                    raise RuntimeError(f"Syncing {self} exited with code {exit_code}.")
+            finally:
+                container.remove(force=True)
+
+    def fetch(self, path: str, image: "NyunDocker") -> List[str]:
+        """
+        Copy a file or directory written into the volume on another docker host back into the
+        staged directory. The copied files are recorded as staged, so they are not sent again.
+
+        Args:
+            path (str): The path relative to the staged directory.
+            image (NyunDocker): An image on the host to read the volume with.
+
+        Returns:
+            List[str]: The relative paths of the copied files.
+        """
+        from docker.errors import NotFound
+        from docker.types import Mount
+
+        client = self._get_client()
+        parent = Path(path).parent
+        destination = self.custom_data_path / parent
+        copied = []
+        with self._lock():
+            container = client.containers.create(
+                image=str(image),
+                entrypoint="true",
+                mounts=[
+                    Mount(source=self.name, target="/dst", type="volume", read_only=True)
+                ],
+            )
+            try:
+                try:
+                    chunks, _ = container.get_archive(f"/dst/{path}")
+                except NotFound:
+                    return copied
+                with tempfile.SpooledTemporaryFile(
+                    max_size=DATA_ARCHIVE_SPOOL_BYTES
+                ) as archive:
+                    for chunk in chunks:
+                        archive.write(chunk)
+                    archive.seek(0)
+                    with tarfile.open(fileobj=archive, mode="r") as tar:
+                        members = [member for member in tar.getmembers() if member.isfile()]
+                        for member in members:
+                            # replace files rather than writing into them: they may be
+                            # hard-linked into the result cache
+                            (destination / member.name).unlink(missing_ok=True)
+                        extract_files(tar, members, destination)
+                        copied = [
+                            os.path.normpath(parent / member.name) for member in members
+                        ]
+            finally:
+                container.remove(force=True)
+
+            state = self._load_state()
+            for relative_path in copied:
+                local_path = self.custom_data_path / relative_path
+                stat = local_path.stat()
+                state[relative_path] = [
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    get_file_hash(local_path),
+                ]
+            self._save_state(state)
+        return copied
+
+    def _get_client(self) -> "docker.DockerClient":
+        from zero.core.utils import get_docker_client
+
+        return self.host.get_client() if self.host is not None else get_docker_client()
+
+    def _volume_exists(self) -> bool:
+        from docker.errors import NotFound
+
+        try:
+            self._get_client().volumes.get(self.name)
+            return True
+        except NotFound:
+            return False
+
+    @contextmanager
+    def _lock(self):
+        # concurrent runs sharing the staged copy sync it one at a time
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.state_path.with_suffix(".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_state(self) -> Dict[str, List]:
+        if not self.state_path.exists():
+            return {}
+        try:
+            with open(self.state_path, "r") as file:
+                return json.load(file)["files"]
+        except Exception as e:
+            logger.error(f"Failed to read staging state {self.state_path}: {e}")
+            return {}
+
+    def _save_state(self, files: Dict[str, List]):
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump({"source": str(self.custom_data_path), "files": files}, file)
+        os.replace(tmp_path, self.state_path)
+
+    def __str__(self):
+        if self.mode == DataStaging.VOLUME and self.host is not None:
+            return f"volume {self.name} on {self.host.name}"
+        if self.mode == DataStaging.VOLUME:
+            return f"volume {self.name}"
+        return str(self.cache_path)
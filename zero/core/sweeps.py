@@ -0,0 +1,275 @@
+"""
+This module provides parameter sweeps over a base script.
+A sweep spec lists script keys and the values to try, either as a grid (every combination) or
+as a random search (a number of random draws). Each variant is written as a script of its own
+under ".nyunservices/sweeps/<base>-<hash>/", with its OUTPUT_PATH moved into a subdirectory per
+variant. The same base script and spec always produce the same variant scripts, so re-running a
+sweep reuses the results cache and run directories of the variants. After the variants ran, the
+metrics they wrote as JSON files under their OUTPUT_PATH are gathered into one table.
+"""
+
+import copy
+import csv
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from zero.core.constants import (
+    SweepKeys,
+    SweepMode,
+    WorkspaceSpec,
+    YamlKeys,
+    SWEEP_METRICS_MAX_BYTES,
+)
+from zero.core.scripts import parse_script
+
+logger = getLogger(__name__)
+
+
+def set_value(data: Dict[str, Any], key: str, value: Any):
+    # set a dotted key ("llm.group_size") of a parsed script, creating the missing mappings
+    *parents, name = key.split(".")
+    for parent in parents:
+        child = data.get(parent)
+        if not isinstance(child, dict):
+            child = data[parent] = {}
+        data = child
+    data[name] = value
+
+
+def flatten(data: Any, prefix: str = "") -> Dict[str, Any]:
+    # flatten nested mappings into dotted keys, keeping the scalar values
+    if isinstance(data, dict):
+        values = {}
+        for key, value in data.items():
+            values.update(flatten(value, f"{prefix}{key}."))
+        return values
+    if isinstance(data, (int, float, str, bool)) or data is None:
+        return {prefix[:-1]: data}
+    return {}
+
+
+def get_number(value: Any) -> Optional[float]:
+    # YAML 1.1 reads exponents without a dot ("1e-5") as strings
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Sweep:
+    """
+    Variants of a base script over a grid or random search of its parameters.
+
+    Args:
+        base_path (Path): The base script (YAML or JSON).
+        spec (Dict[str, Any]): The parsed sweep spec (see SweepKeys).
+
+    Raises:
+        ValueError: If the spec is invalid.
+    """
+
+    def __init__(self, base_path: Path, spec: Dict[str, Any]):
+        self.base_path = base_path
+        self.spec = spec
+        self.mode = SweepMode(spec.get(SweepKeys.MODE, SweepMode.GRID))
+        self.samples = int(spec.get(SweepKeys.SAMPLES, 10))
+        self.seed = spec.get(SweepKeys.SEED, 0)
+        self.parameters: Dict[str, Any] = spec.get(SweepKeys.PARAMETERS) or {}
+        self.metrics: Optional[List[str]] = spec.get(SweepKeys.METRICS)
+
+        if not isinstance(self.parameters, dict) or not self.parameters:
+            raise ValueError(f"'{SweepKeys.PARAMETERS}' must map script keys to values.")
+        if self.samples < 1:
+            raise ValueError(f"'{SweepKeys.SAMPLES}' must be at least 1.")
+        for key, values in self.parameters.items():
+            if isinstance(values, list) and values:
+                continue
+            if self.mode == SweepMode.RANDOM and isinstance(values, dict):
+                if "min" not in values or "max" not in values:
+                    raise ValueError(f"The range of '{key}' needs a 'min' and a 'max'.")
+                values["min"], values["max"] = get_number(values["min"]), get_number(values["max"])
+                if values["min"] is None or values["max"] is None:
+                    raise ValueError(f"The range of '{key}' must have numeric bounds.")
+                if values["min"] > values["max"]:
+                    raise ValueError(f"The range of '{key}' has 'min' above 'max'.")
+                if values.get("log") and values["min"] <= 0:
+                    raise ValueError(f"The log range of '{key}' must be positive.")
+                continue
+            raise ValueError(
+                f"'{key}' must be a non-empty list of values"
+                + (" or a {min, max} range." if self.mode == SweepMode.RANDOM else ".")
+            )
+
+    @staticmethod
+    def from_files(base_path: Path, spec_path: Path) -> "Sweep":
+        return Sweep(base_path, parse_script(spec_path.read_bytes()))
+
+    def get_key(self) -> str:
+        # identifies the sweep by its base script and spec
+        digest = hashlib.sha256(self.base_path.read_bytes())
+        digest.update(json.dumps(self.spec, sort_keys=True, default=str).encode())
+        return digest.hexdigest()[:8]
+
+    def get_dir(self, workspace_path: Path) -> Path:
+        return (
+            WorkspaceSpec.get_sweeps_dir(workspace_path)
+            / f"{self.base_path.stem}-{self.get_key()}"
+        )
+
+    def _draw(self, rng: random.Random, values: Any) -> Any:
+        if isinstance(values, list):
+            return rng.choice(values)
+        low, high = values["min"], values["max"]
+        if values.get("log"):
+            return round(math.exp(rng.uniform(math.log(low), math.log(high))), 6)
+        if isinstance(low, int) and isinstance(high, int):
+            return rng.randint(low, high)
+        return round(rng.uniform(low, high), 6)
+
+    def generate(self) -> List[Dict[str, Any]]:
+        """
+        Generate the parameters of each variant.
+
+        Returns:
+            List[Dict[str, Any]]: The parameter values of each variant, without duplicates.
+        """
+        keys = list(self.parameters)
+        if self.mode == SweepMode.GRID:
+            return [
+                dict(zip(keys, values))
+                for values in itertools.product(*self.parameters.values())
+            ]
+
+        rng = random.Random(self.seed)
+        variants, seen = [], set()
+        # discrete parameters may have fewer distinct combinations than samples
+        for _ in range(self.samples * 10):
+            variant = {key: self._draw(rng, self.parameters[key]) for key in keys}
+            signature = json.dumps(variant, sort_keys=True, default=str)
+            if signature not in seen:
+                seen.add(signature)
+                variants.append(variant)
+            if len(variants) == self.samples:
+                break
+        return variants
+
+    def write_variants(self, workspace_path: Path) -> List[Tuple[Path, Dict[str, Any]]]:
+        """
+        Write the script of each variant into the sweep directory.
+        Unchanged variant scripts are not rewritten, so their parsed scripts stay cached.
+
+        Returns:
+            List[Tuple[Path, Dict[str, Any]]]: The script and the parameter values of each variant.
+        """
+        sweep_dir = self.get_dir(workspace_path)
+        sweep_dir.mkdir(parents=True, exist_ok=True)
+        base = parse_script(self.base_path.read_bytes())
+        variants = []
+        for number, parameters in enumerate(self.generate()):
+            name = f"{self.base_path.stem}-{number:03d}"
+            data = copy.deepcopy(base)
+            for key, value in parameters.items():
+                set_value(data, key, value)
+            if data.get(YamlKeys.OUTPUT_PATH):
+                # each variant writes its outputs into its own directory
+                data[YamlKeys.OUTPUT_PATH] = (
+                    f"{str(data[YamlKeys.OUTPUT_PATH]).rstrip('/')}/{name}"
+                )
+
+            script = sweep_dir / f"{name}{self.base_path.suffix}"
+            if self.base_path.suffix == ".json":
+                content = json.dumps(data, indent=2)
+            else:
+                content = yaml.safe_dump(data, sort_keys=False)
+            if not script.exists() or script.read_text() != content:
+                script.write_text(content)
+            variants.append((script, parameters))
+
+        with open(sweep_dir / "sweep.json", "w") as file:
+            json.dump(
+                {
+                    "base": str(self.base_path.absolute()),
+                    "spec": self.spec,
+                    "variants": [
+                        {"script": str(script), "parameters": parameters}
+                        for script, parameters in variants
+                    ],
+                },
+                file,
+                indent=2,
+                default=str,
+            )
+        return variants
+
+    def collect_metrics(self, output_path: Optional[Path]) -> Dict[str, Any]:
+        """
+        Gather the metrics a variant wrote as JSON files under its output path.
+
+        Nested values are flattened into dotted keys. If the spec lists METRICS, the values of
+        those keys (matched by their full key or their last part) are collected; otherwise every
+        numeric value is.
+
+        Args:
+            output_path (Path, optional): The variant's output path on the host.
+
+        Returns:
+            Dict[str, Any]: The metrics by name.
+        """
+        values: Dict[str, Any] = {}
+        if output_path is None or not output_path.exists():
+            return values
+        for path in sorted(output_path.rglob("*.json")):
+            if path.stat().st_size > SWEEP_METRICS_MAX_BYTES:
+                continue
+            try:
+                with open(path, "r") as file:
+                    values.update(flatten(json.load(file)))
+            except (OSError, ValueError) as e:
+                logger.info(f"Skipping {path}, not a JSON file: {e}")
+
+        if self.metrics is None:
+            return {
+                key: value
+                for key, value in values.items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+            }
+        metrics = {}
+        for metric in self.metrics:
+            for key, value in values.items():
+                if key == metric or key.endswith(f".{metric}"):
+                    metrics[metric] = value
+        return metrics
+
+
+def write_report(rows: List[Dict[str, Any]], path: Path):
+    """
+    Write the rows of a sweep report to a JSON file, or to a CSV file for any other suffix.
+
+    Args:
+        rows (List[Dict[str, Any]]): One row per variant.
+        path (Path): The report file.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w", newline="") as file:
+        if path.suffix == ".json":
+            json.dump(rows, file, indent=2, default=str)
+        else:
+            columns = list(dict.fromkeys(column for row in rows for column in row))
+            writer = csv.DictWriter(file, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    os.replace(tmp_path, path)
@@ -0,0 +1,144 @@
+"""
+This module provides lightweight timing spans for the phases of a run (workspace load, image
+checks and pulls, script parsing, container create/start/run/remove, ...).
+A command starts a `Timings` recorder with `start_timings`; the instrumented code then records
+spans with `span` and `record`, which do nothing when no recorder is started. The spans of a run
+are appended to ".nyunservices/timings.jsonl" in the workspace.
+"""
+
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = getLogger(__name__)
+
+# the innermost span of the current thread or asyncio task, recorded as the parent of new spans
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "nyun_current_span", default=None
+)
+
+
+class Timings:
+    """
+    Record the duration of named phases, from any thread.
+
+    Each span is recorded with its start offset from the creation of the recorder, its
+    duration, the span it is nested in and any extra attributes (e.g. the script or image).
+    """
+
+    def __init__(self):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        start = time.perf_counter()
+        token = _current_span.set(name)
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _current_span.reset(token)
+            if failed:
+                attrs["failed"] = True
+            self._add(name, start, time.perf_counter() - start, attrs)
+
+    def record(self, name: str, duration: float, **attrs):
+        # record a phase measured by the caller, ending now
+        self._add(name, time.perf_counter() - duration, duration, attrs)
+
+    def _add(self, name: str, start: float, duration: float, attrs: Dict[str, Any]):
+        entry = {
+            "name": name,
+            "parent": _current_span.get(),
+            "start": round(start - self._origin, 6),
+            "duration": round(duration, 6),
+            "thread": threading.current_thread().name,
+            **{key: str(value) for key, value in attrs.items()},
+        }
+        with self._lock:
+            self.spans.append(entry)
+
+    def get_elapsed(self) -> float:
+        return time.perf_counter() - self._origin
+
+    def get_breakdown(self) -> List[Tuple[str, int, float, float]]:
+        """
+        Aggregate the spans by phase, in the order each phase first started.
+
+        Returns:
+            List[Tuple[str, int, float, float]]: The name, count, total and maximum duration of each phase.
+        """
+        phases: Dict[str, List] = {}
+        with self._lock:
+            spans = sorted(self.spans, key=lambda entry: entry["start"])
+        for entry in spans:
+            phase = phases.setdefault(entry["name"], [0, 0.0, 0.0])
+            phase[0] += 1
+            phase[1] += entry["duration"]
+            phase[2] = max(phase[2], entry["duration"])
+        return [(name, *phase) for name, phase in phases.items()]
+
+    def write(self, path: Path, **context):
+        """
+        Append the spans to a JSONL file, one line per span, tagged with the run id.
+
+        Args:
+            path (Path): The JSONL file.
+            **context: Extra fields written on every line (e.g. the command).
+        """
+        with self._lock:
+            spans = list(self.spans)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a") as file:
+                for entry in spans:
+                    line = {"run": self.run_id, "time": self.started_at, **context, **entry}
+                    file.write(json.dumps(line) + "\n")
+        except OSError as e:
+            logger.error(f"Failed to write timings to {path}: {e}")
+
+
+_timings: Optional[Timings] = None
+
+
+def start_timings() -> Timings:
+    # start recording spans for the rest of the process (one command)
+    global _timings
+    _timings = Timings()
+    return _timings
+
+
+def get_timings() -> Optional[Timings]:
+    return _timings
+
+
+def span(name: str, **attrs):
+    """
+    Time the enclosed block as the phase `name`, if a recorder is started.
+
+    Args:
+        name (str): The phase name, e.g. "container.create".
+        **attrs: Extra attributes recorded with the span.
+    """
+    if _timings is None:
+        return nullcontext()
+    return _timings.span(name, **attrs)
+
+
+def record(name: str, duration: float, **attrs):
+    # record a phase measured by the caller (e.g. across callbacks), if a recorder is started
+    if _timings is not None:
+        _timings.record(name, duration, **attrs)
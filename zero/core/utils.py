@@ -4,20 +4,36 @@ It includes functions for pulling Docker images, starting containers, running co
 and removing containers.
 """
 
-from typing import Union, Dict
+from typing import Any, Callable, Union, Dict, Iterable, List, Optional
 from logging import getLogger
+import codecs
 import os
+import sys
+import time
+import threading
 import docker
 from dotenv import load_dotenv, dotenv_values
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from rich.progress import Progress, SpinnerColumn, TextColumn
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from rich.progress import (
+    Progress,
+    SpinnerColumn,
+    TextColumn,
+    BarColumn,
+    DownloadColumn,
+    TransferSpeedColumn,
+    TimeRemainingColumn,
+)
+from rich import filesize
 from docker.models.containers import Container, ExecResult
+from zero.core.timings import record, span
 from zero.core.constants import (
     DockerPath,
     DockerCommand,
     WorkspaceExtension,
     NYUN_ENV_KEY_PREFIX,
     EMPTY_STRING,
+    DOCKER_LOGIN_TTL_SECONDS,
+    DOCKER_MAX_POOL_SIZE,
 )
 from zero import (
     NYUNTAM as NyunService,
@@ -35,65 +51,125 @@ logger = getLogger(__name__)
 # ========================================
 
 
+_docker_client: Optional[docker.DockerClient] = None
+_docker_client_lock = threading.Lock()
+_docker_login_expires_at = 0.0
+_docker_engine: Optional["DockerEngine"] = None
+_docker_engine_checked = False
+
+
 def get_docker_client() -> docker.DockerClient:
     """
-    Get a Docker client instance authenticated with the provided credentials.
+    Get the process-wide Docker client instance authenticated with the provided credentials.
+
+    The client (and its connection pool) is created once per process and shared across
+    operations and worker threads. The login result is cached for DOCKER_LOGIN_TTL_SECONDS.
 
     Returns:
         docker.DockerClient: A Docker client instance.
     """
-    load_dotenv()
+    global _docker_client, _docker_login_expires_at
 
-    client = docker.from_env()
-    try:
-        client.login(
-            username=os.getenv("DOCKER_USERNAME"),
-            password=os.getenv("DOCKER_ACCESS_TOKEN"),
-        )
-    except Exception as e:
-        logger.error(
-            "Failed to authenticate with Docker credentials. Only public images can be pulled."
-        )
-    return client
+    with _docker_client_lock:
+        if _docker_client is None:
+            load_dotenv()
+            _docker_client = docker.from_env(max_pool_size=DOCKER_MAX_POOL_SIZE)
+            _docker_login_expires_at = 0.0
+
+        if time.monotonic() >= _docker_login_expires_at:
+            try:
+                _docker_client.login(
+                    username=os.getenv("DOCKER_USERNAME"),
+                    password=os.getenv("DOCKER_ACCESS_TOKEN"),
+                )
+            except Exception as e:
+                logger.error(
+                    "Failed to authenticate with Docker credentials. Only public images can be pulled."
+                )
+            # failed logins are cached as well, so that every operation does not retry them
+            _docker_login_expires_at = time.monotonic() + DOCKER_LOGIN_TTL_SECONDS
+
+        return _docker_client
+
+
+def get_docker_engine() -> Optional["DockerEngine"]:
+    """
+    Get the process-wide asyncio Docker engine, if the Docker daemon is reachable over a local Unix socket.
+
+    Pulls and container runs of all jobs share the engine's event loop. When the daemon is
+    only reachable otherwise (e.g. over TCP), None is returned and docker-py is used instead.
+
+    Returns:
+        Optional[DockerEngine]: The Docker engine, or None.
+    """
+    global _docker_engine, _docker_engine_checked
+    from zero.core.engine import AsyncDockerEngine, DockerEngine, get_docker_socket_path
+
+    with _docker_client_lock:
+        if not _docker_engine_checked:
+            load_dotenv()
+            socket_path = get_docker_socket_path()
+            if socket_path is not None:
+                _docker_engine = DockerEngine(AsyncDockerEngine(socket_path))
+            _docker_engine_checked = True
+        return _docker_engine
+
+
+def reset_docker_client():
+    """
+    Close the process-wide Docker client and engine so that the next `get_docker_client` and
+    `get_docker_engine` calls create new ones.
+    """
+    global _docker_client, _docker_login_expires_at, _docker_engine, _docker_engine_checked
+
+    with _docker_client_lock:
+        if _docker_client is not None:
+            try:
+                _docker_client.close()
+            except Exception as e:
+                logger.error(f"Failed to close Docker client: {e}")
+        if _docker_engine is not None:
+            _docker_engine.close()
+        _docker_client = None
+        _docker_login_expires_at = 0.0
+        _docker_engine = None
+        _docker_engine_checked = False
 
 
 # TODO: add argument silent: bool = False to suppress loading outputs for run commands.
-def pull_docker_image(*image: "NyunDocker"):
+def pull_docker_image(*image: "NyunDocker", index: Optional["ImageIndex"] = None):
     """
-    Pull Docker images in parallel using ThreadPoolExecutor.
+    Pull Docker images in parallel, on the asyncio Docker engine when available and with a
+    ThreadPoolExecutor otherwise.
+    Images already recorded in the image index are not pulled again. The progress of each pull
+    is shown as the downloaded bytes of its layers, with the throughput and ETA, and pulls
+    that stall are retried (see `zero.core.pulls`).
 
     Args:
         *image (NyunDocker): One or more NyunDocker instances representing the Docker images to pull.
+        index (ImageIndex, optional): The image index to check and update. If None, an in-memory index is built.
 
     Raises:
         Exception: If any of the images fail to pull.
     """
+    from zero.core.images import ImageIndex
+    from zero.core.engine import DockerEngineError
+    from zero.core.pulls import PullPlan, PullProgress, pull_image, pull_image_async
+
     client = get_docker_client()
+    engine = get_docker_engine()
+    index = index if index is not None else ImageIndex()
+    with span("images.check", images=len(image)):
+        index.sync(client)
 
     total = len(image)
-    count = 0
-    img_map = {}
-
-    def counter(img):
-        nonlocal img_map
-        nonlocal count
-
-        # return from memoized
-        if img_map.get(str(img), False):
-            return img_map.get(str(img))
 
-        if count == total:
-            count = 0
-        count += 1
-        img_map[str(img)] = count  # memoize
-        return count
+    def label(number: int, img: "NyunDocker", state: str) -> str:
+        return f"Component [{number}/{total}] {state} ({img.repository}:{img.tag})"
 
-    def wrap(repo, tag, task):
+    def wrap(repo, tag, on_progress):
         try:
-            # check if image already exists (exclude dangling images)
-            if client.images.list(repo, tag, filters={"dangling": True}):
-                return
-            client.images.pull(repo, tag)
+            pull_image(client, repo, tag, on_progress=on_progress)
         except ImageNotFound as e:
             raise ImageNotFound(
                 f'Access denied. Reach out to us at "contact@nyunai.com" for access'
@@ -104,48 +180,135 @@ def pull_docker_image(*image: "NyunDocker"):
     progress = Progress(
         SpinnerColumn(),
         TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        DownloadColumn(),
+        TransferSpeedColumn(),
+        TimeRemainingColumn(),
         transient=False,
     )
     with progress:
         tasks = {
             progress.add_task(
-                f"[white]Component [{counter(img)}/{total}] loading ({img.repository}:{img.tag}).",
-                total=total,
+                f"[white]{label(number, img, 'loading')}.",
+                total=None,
                 start=False,
-            ): img
-            for img in image
+            ): (number, img)
+            for number, img in enumerate(image, start=1)
         }
 
+        for task, (number, img) in list(tasks.items()):
+            if index.is_installed(img):
+                tasks.pop(task)
+                progress.update(
+                    task,
+                    total=1,
+                    completed=1,
+                    description=f"[green]{label(number, img, 'loaded')}.",
+                    refresh=True,
+                )
+
+        pull_progress: Dict[int, PullProgress] = {}
+
+        def on_progress(task) -> Callable[[PullProgress], None]:
+            number, img = tasks[task]
+
+            def update(image_progress: PullProgress):
+                pull_progress[task] = image_progress
+                progress.start_task(task)
+                progress.update(
+                    task,
+                    total=image_progress.total_bytes or None,
+                    completed=image_progress.downloaded_bytes,
+                    description=f"[white]{label(number, img, 'loading')}, {image_progress.describe()}.",
+                )
+
+            return update
+
+        # pull images that share layers one after another, and the rest concurrently
+        with span("images.plan", images=len(tasks)):
+            plan = PullPlan.for_images(
+                [(img.repository, img.tag) for _, img in tasks.values()]
+            )
+        tasks_by_image = {str(img): task for task, (_, img) in tasks.items()}
+        pending = list(tasks_by_image)
+
         with ThreadPoolExecutor() as executor:
-            futures = {
-                executor.submit(wrap, img.repository, img.tag, tasks[task]): task
-                for task, img in tasks.items()
-            }
-
-            for future in as_completed(futures):
-                task = futures[future]
-                img = tasks[task]
-
-                try:
-                    future.result()
-                    progress.update(
-                        task,
-                        advance=1,
-                        description=f"[green]Component [{counter(img)}/{total}] loaded ({img.repository}:{img.tag}).",
-                        completed=True,
-                        refresh=True,
-                    )
-                except Exception as e:
-                    progress.update(
-                        task,
-                        advance=1,
-                        description=f"[red]Component [{counter(img)}/{total}] failed to load ({img.repository}:{img.tag}). {e}.",
-                        completed=True,
-                        refresh=True,
-                    )
-                    logger.exception(
-                        f"Failed to pull ({img.repository}:{img.tag}). {e}."
+
+            submitted_at = {}
+
+            def submit(task) -> Future:
+                _, img = tasks[task]
+                submitted_at[task] = time.perf_counter()
+                if engine is not None:
+                    return engine.submit(
+                        pull_image_async(
+                            engine.engine,
+                            img.repository,
+                            img.tag,
+                            on_progress=on_progress(task),
+                        )
                     )
+                return executor.submit(wrap, img.repository, img.tag, on_progress(task))
+
+            futures = {}
+            while pending or futures:
+                for next_image in plan.next(pending):
+                    pending.remove(next_image)
+                    futures[submit(tasks_by_image[next_image])] = tasks_by_image[
+                        next_image
+                    ]
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    task = futures.pop(future)
+                    number, img = tasks[task]
+
+                    try:
+                        try:
+                            future.result()
+                        except DockerEngineError as e:
+                            if e.status == 404 or "denied" in e.message:
+                                raise ImageNotFound(
+                                    f'Access denied. Reach out to us at "contact@nyunai.com" for access'
+                                )
+                            raise Exception(f"Failed to pull") from e
+                        record(
+                            "image.pull",
+                            time.perf_counter() - submitted_at[task],
+                            image=img,
+                        )
+                        plan.complete(str(img), pull_progress.get(task))
+                        index.add(img, client)
+                        task_total = (
+                            pull_progress[task].total_bytes if task in pull_progress else 0
+                        ) or 1
+                        progress.update(
+                            task,
+                            total=task_total,
+                            completed=task_total,
+                            description=f"[green]{label(number, img, 'loaded')}.",
+                            refresh=True,
+                        )
+                    except Exception as e:
+                        plan.fail(str(img))
+                        progress.update(
+                            task,
+                            description=f"[red]{label(number, img, 'failed to load')}. {e}.",
+                            refresh=True,
+                        )
+                        progress.stop_task(task)
+                        logger.exception(
+                            f"Failed to pull ({img.repository}:{img.tag}). {e}."
+                        )
+
+        report = plan.get_report()
+        if report["requested"]:
+            progress.console.print(
+                f"Pulled {filesize.decimal(report['transferred'])} of {filesize.decimal(report['requested'])} "
+                f"in image layers, {filesize.decimal(report['saved'])} saved by shared and existing layers."
+            )
+
+    index.save()
 
 
 def remove_docker_image(*image: "NyunDocker"):
@@ -196,20 +359,109 @@ def start_docker_container(*image: "NyunDocker"):
                 raise Exception from e
 
 
+def get_container_config(
+    script: Path,
+    workspace: "Workspace",
+    metadata: "DockerMetadata",
+    image: "NyunDocker",
+    mount_script: bool = True,
+    placement: Optional["Placement"] = None,
+    run: Optional["RunDirectory"] = None,
+) -> Dict[str, Any]:
+    """
+    Get the arguments to run a script in a Docker container.
+
+    Args:
+        script (Path): The script path to run in the Docker container. (It will be mounted on the docker inside "/scripts").
+        workspace (Workspace): The workspace object.
+        metadata (DockerMetadata): The docker metadata object.
+        image (NyunDocker): The Docker image to run.
+        mount_script (bool): Whether to bind mount the script into the container.
+        placement (Placement, optional): The resources assigned to the job. If None, the container gets all GPUs and no CPU or memory limits.
+        run (RunDirectory, optional): The run directory of the script, whose checkpoint paths are passed to the job.
+
+    Returns:
+        Dict[str, Any]: The keyword arguments for `client.containers.run`.
+    """
+    script_path = DockerPath.get_script_path_in_docker(script_path=script)
+    command = DockerCommand.get_run_command(script_path=script_path)
+    service = get_service_from_metadata_extension_type(
+        extension_type=metadata.extension_type
+    )
+    mounts = [
+        # Mount workspace dir
+        Mount(
+            source=str(workspace.workspace_path),
+            target=str(DockerPath.USER_DATA.value),
+            type="bind",
+            read_only=False,
+        ),
+        # Mount custom data dir
+        workspace.get_custom_data_mount(str(DockerPath.CUSTOM_DATA.value)),
+        # Mount service
+        Mount(
+            source=str(NyunServices),
+            target=str(DockerPath.NYUN_SERVICES.value),
+            type="bind",
+            read_only=True,
+        ),
+    ]
+    if mount_script:
+        # Mount script
+        mounts.append(
+            Mount(
+                source=str(script.absolute().resolve()),
+                target=str(script_path),
+                type="bind",
+                read_only=True,
+            )
+        )
+
+    environment = (
+        get_environment_keys_from_workspace(workspace.get_workspace_env_file())
+        if workspace.get_workspace_env_file()
+        else None
+    )
+    if run is not None:
+        environment = {**(environment or {}), **run.get_environment()}
+
+    device_requests = [DeviceRequest(device_ids=["all"], capabilities=[["gpu"]])]
+
+    working_dir = DockerPath.get_service_path_in_docker(service_name=service)
+    config = {
+        "command": command,
+        "image": str(image),
+        "device_requests": device_requests,
+        "mounts": mounts,
+        "working_dir": str(working_dir),
+        "environment": environment,
+    }
+    if run is not None:
+        config["labels"] = run.get_labels()
+    if placement is not None:
+        config.update(placement.get_container_kwargs())
+    return config
+
+
 def run_docker_container(
     script: Path,
     workspace: "Workspace",
     metadata: "DockerMetadata",
     *image: "NyunDocker",
+    placement: Optional["Placement"] = None,
+    run: Optional["RunDirectory"] = None,
 ) -> Container:
     """
-    Run a Docker container with a specified command in detached mode with auto-removal.
+    Run a Docker container with a specified command in detached mode.
+    Use `wait_docker_container` to wait for it to exit and remove it.
 
     Args:
         script (Path): The script path to run in the Docker container. (It will be mounted on the docker inside "/scripts").
         workspace (Workspace): The workspace object.
         metadata (DockerMetadata): The docker metadata object.
         *image (NyunDocker): A NyunDocker instance representing the Docker image to run.
+        placement (Placement, optional): The resources assigned to the job.
+        run (RunDirectory, optional): The run directory of the script.
 
     Returns:
         Container: The running Docker container.
@@ -218,68 +470,19 @@ def run_docker_container(
         Exception: If the container fails to run.
     """
 
-    # TODO: Update to handle running multiple containers
-
+    command = None
     try:
         client = get_docker_client()
-        script_path = DockerPath.get_script_path_in_docker(script_path=script)
-        command = DockerCommand.get_run_command(script_path=script_path)
-        service = get_service_from_metadata_extension_type(
-            extension_type=metadata.extension_type
+        config = get_container_config(
+            script, workspace, metadata, image[0], placement=placement, run=run
         )
-        mounts = [
-            # Mount workspace dir
-            Mount(
-                source=str(workspace.workspace_path),
-                target=str(DockerPath.USER_DATA.value),
-                type="bind",
-                read_only=False,
-            ),
-            # Mount custom data dir
-            Mount(
-                source=str(workspace.custom_data_path),
-                target=str(DockerPath.CUSTOM_DATA.value),
-                type="bind",
-                read_only=True,
-            ),
-            # Mount script
-            Mount(
-                source=str(script.absolute().resolve()),
-                target=str(script_path),
-                type="bind",
-                read_only=True,
-            ),
-            # Mount service
-            Mount(
-                source=str(NyunServices),
-                target=str(DockerPath.NYUN_SERVICES.value),
-                type="bind",
-                read_only=True,
-            ),
-        ]
-
-        environment = (
-            get_environment_keys_from_workspace(workspace.get_workspace_env_file())
-            if workspace.get_workspace_env_file()
-            else None
-        )
-
-        device_requests = [DeviceRequest(device_ids=["all"], capabilities=[["gpu"]])]
-
-        working_dir = DockerPath.get_service_path_in_docker(service_name=service)
+        command = config["command"]
         logger.info(
-            f"Running {image[0]} with command: {command}\nMounts: {mounts}\nEnvironment: {environment}\nDevice Requests: {device_requests}\nWorking Dir: {working_dir}"
-        )
-        running_container: Container = client.containers.run(
-            command=command,
-            image=str(image[0]),
-            device_requests=device_requests,
-            detach=False,
-            mounts=mounts,
-            remove=True,
-            working_dir=str(working_dir),
-            environment=environment,
+            f"Running {image[0]} with command: {command}\nMounts: {config['mounts']}\nEnvironment: {config['environment']}\nDevice Requests: {config['device_requests']}\nPlacement: {placement}\nWorking Dir: {config['working_dir']}"
         )
+        # docker-py creates and starts the container (attaching its GPUs) in one call
+        with span("container.create", image=image[0]):
+            running_container: Container = client.containers.run(detach=True, **config)
         return running_container
 
     except ContainerError as e:
@@ -289,6 +492,157 @@ def run_docker_container(
         raise Exception from e
 
 
+class OutputWriter:
+    # writes output chunks to a log file and/or the terminal as they arrive
+
+    def __init__(self, log_file_path: Optional[Path] = None, echo: bool = False):
+        self.echo = echo
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._log_file = None
+        if log_file_path is not None:
+            log_file_path.parent.mkdir(parents=True, exist_ok=True)
+            self._log_file = open(log_file_path, "ab")
+
+    def write(self, chunk: bytes):
+        if self._log_file is not None:
+            self._log_file.write(chunk)
+        if self.echo:
+            sys.stdout.write(self._decoder.decode(chunk))
+
+    def close(self):
+        if self.echo:
+            sys.stdout.write(self._decoder.decode(b"", final=True))
+            sys.stdout.flush()
+        if self._log_file is not None:
+            self._log_file.close()
+
+    def __enter__(self) -> "OutputWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stream_output(
+    chunks: Iterable[bytes],
+    log_file_path: Optional[Path] = None,
+    echo: bool = False,
+):
+    """
+    Write a stream of output chunks incrementally, so memory use does not grow with its volume.
+
+    Args:
+        chunks (Iterable[bytes]): The output chunks.
+        log_file_path (Path, optional): The file to append the output to.
+        echo (bool): Whether to also write the output to the terminal.
+    """
+    with OutputWriter(log_file_path=log_file_path, echo=echo) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+
+def stream_docker_container_logs(
+    container: Container,
+    log_file_path: Optional[Path] = None,
+    echo: bool = False,
+):
+    """
+    Stream the output of a Docker container until it exits.
+
+    Args:
+        container (Container): The running Docker container.
+        log_file_path (Path, optional): The file to append the output to.
+        echo (bool): Whether to also write the output to the terminal.
+    """
+    stream_output(
+        container.logs(stream=True, follow=True),
+        log_file_path=log_file_path,
+        echo=echo,
+    )
+
+
+def wait_docker_container(
+    container: Container,
+    log_file_path: Optional[Path] = None,
+    echo: bool = False,
+) -> int:
+    """
+    Stream the output of a Docker container, wait for it to exit and remove it.
+
+    Args:
+        container (Container): The running Docker container.
+        log_file_path (Path, optional): The file to append the container output to.
+        echo (bool): Whether to also write the container output to the terminal.
+
+    Returns:
+        int: The exit code of the container, read from the wait result.
+    """
+    try:
+        with span("container.run"):
+            stream_docker_container_logs(
+                container, log_file_path=log_file_path, echo=echo
+            )
+            result = container.wait()
+        exit_code = result.get("StatusCode", -1)
+        if exit_code != 0:
+            logger.error(
+                f"Container {container.short_id} exited with code {exit_code}."
+                + (f" Logs: {log_file_path}" if log_file_path else "")
+            )
+        return exit_code
+    finally:
+        try:
+            with span("container.remove"):
+                container.remove(force=True)
+        except NotFound:
+            pass
+        except Exception as e:
+            logger.error(f"Container {container.short_id} failed to remove: {e}")
+
+
+def execute_docker_container(
+    script: Path,
+    workspace: "Workspace",
+    metadata: "DockerMetadata",
+    *image: "NyunDocker",
+    log_file_path: Optional[Path] = None,
+    echo: bool = False,
+    placement: Optional["Placement"] = None,
+    run: Optional["RunDirectory"] = None,
+) -> int:
+    """
+    Run a script in a Docker container to completion, streaming its output, and remove the container.
+    The container is supervised on the asyncio Docker engine when available, and with docker-py otherwise.
+
+    Args:
+        script (Path): The script path to run in the Docker container. (It will be mounted on the docker inside "/scripts").
+        workspace (Workspace): The workspace object.
+        metadata (DockerMetadata): The docker metadata object.
+        *image (NyunDocker): A NyunDocker instance representing the Docker image to run.
+        log_file_path (Path, optional): The file to append the container output to.
+        echo (bool): Whether to also write the container output to the terminal.
+        placement (Placement, optional): The resources assigned to the job.
+        run (RunDirectory, optional): The run directory of the script.
+
+    Returns:
+        int: The exit code of the container.
+    """
+    engine = get_docker_engine()
+    if engine is None:
+        container = run_docker_container(
+            script, workspace, metadata, *image, placement=placement, run=run
+        )
+        return wait_docker_container(container, log_file_path=log_file_path, echo=echo)
+
+    config = get_container_config(
+        script, workspace, metadata, image[0], placement=placement, run=run
+    )
+    logger.info(
+        f"Running {image[0]} with command: {config['command']}\nMounts: {config['mounts']}\nEnvironment: {config['environment']}\nDevice Requests: {config['device_requests']}\nPlacement: {placement}\nWorking Dir: {config['working_dir']}"
+    )
+    return engine.run_container(config, log_file_path=log_file_path, echo=echo)
+
+
 def remove_container(*image: "NyunDocker"):
     """
     Remove a Docker container.
@@ -311,6 +665,52 @@ def remove_container(*image: "NyunDocker"):
         raise Exception from e
 
 
+def get_docker_containers(
+    labels: Dict[str, str], client: Optional[docker.DockerClient] = None
+) -> List[Container]:
+    """
+    Get the running Docker containers with the given labels.
+
+    Args:
+        labels (Dict[str, str]): The labels the containers must have.
+        client (docker.DockerClient, optional): The client of the Docker host the containers
+            run on. Defaults to the process-wide client.
+
+    Returns:
+        List[Container]: The running containers.
+    """
+    client = client or get_docker_client()
+    return client.containers.list(
+        filters={"label": [f"{key}={value}" for key, value in labels.items()]}
+    )
+
+
+def kill_docker_containers(
+    labels: Dict[str, str], client: Optional[docker.DockerClient] = None
+) -> int:
+    """
+    Kill the running Docker containers with the given labels. Whoever waits for them sees them
+    exit and removes them.
+
+    Args:
+        labels (Dict[str, str]): The labels the containers must have.
+        client (docker.DockerClient, optional): The client of the Docker host the containers
+            run on. Defaults to the process-wide client.
+
+    Returns:
+        int: The number of containers killed.
+    """
+    killed = 0
+    for container in get_docker_containers(labels, client=client):
+        try:
+            container.kill()
+            killed += 1
+        except docker.errors.APIError as e:
+            # the container exited in the meantime
+            logger.debug(f"Container {container.short_id} failed to kill: {e}")
+    return killed
+
+
 def get_environment_keys_from_workspace(env_file_path: Path) -> Dict[str, str]:
     """
     Get the environment keys from the workspace.
@@ -0,0 +1,279 @@
+"""
+This module provides a pool of warm worker containers.
+A worker is a long-lived container of a Nyun Docker image, with the workspace mounts and
+GPU devices already attached; scripts are copied into it and run with `docker exec`.
+Idle workers are stopped after a timeout, and workers are recycled after a number of jobs.
+"""
+
+import io
+import tarfile
+import threading
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from zero.core.constants import (
+    DockerCommand,
+    DockerPath,
+    WARM_POOL_IDLE_TIMEOUT_SECONDS,
+    WARM_POOL_MAX_JOBS_PER_WORKER,
+    WARM_POOL_LABEL,
+)
+from zero.core.timings import span
+from zero.core.utils import get_docker_client, get_container_config, stream_output
+
+logger = getLogger(__name__)
+
+
+class WarmWorker:
+    # a long-lived container that runs scripts of one image with `docker exec`
+
+    def __init__(self, key: Tuple[str, str, str, str], container: "Container"):
+        self.key = key
+        self.container = container
+        self.jobs = 0
+        self.last_used = time.monotonic()
+        # the script the worker is running
+        self.script: Optional[Path] = None
+
+    def is_alive(self) -> bool:
+        try:
+            self.container.reload()
+            return self.container.status == "running"
+        except Exception:
+            return False
+
+    def copy_script(self, script: Path):
+        # copy the script into the worker, at the same path it would be mounted on
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            tar.add(str(script.absolute().resolve()), arcname=script.name)
+        self.container.put_archive(str(DockerPath.SCRIPT.value), archive.getvalue())
+
+    def exec(
+        self,
+        script: Path,
+        config: Dict,
+        log_file_path: Optional[Path] = None,
+        echo: bool = False,
+    ) -> int:
+        client = get_docker_client()
+        self.copy_script(script)
+        exec_id = client.api.exec_create(
+            self.container.id,
+            config["command"],
+            workdir=config["working_dir"],
+            environment=config["environment"],
+        )["Id"]
+        self.script = script
+        try:
+            stream_output(
+                client.api.exec_start(exec_id, stream=True),
+                log_file_path=log_file_path,
+                echo=echo,
+            )
+            return client.api.exec_inspect(exec_id)["ExitCode"]
+        finally:
+            self.script = None
+
+    def cancel(self):
+        # stop the script running in the worker and keep the worker, or stop the worker if the
+        # image has no pkill
+        script = self.script
+        if script is None:
+            return
+        client = get_docker_client()
+        script_path = DockerPath.get_script_path_in_docker(script_path=script)
+        try:
+            exec_id = client.api.exec_create(
+                self.container.id, ["pkill", "-f", f"yaml_path {script_path}"]
+            )["Id"]
+            client.api.exec_start(exec_id)
+            exit_code = client.api.exec_inspect(exec_id)["ExitCode"]
+        except Exception as e:
+            logger.error(f"Failed to stop {script} on {self}: {e}")
+            exit_code = None
+        # pkill exits with 1 when nothing matched, e.g. before the script started
+        if exit_code not in (0, 1):
+            self.stop()
+
+    def stop(self):
+        try:
+            self.container.remove(force=True)
+        except Exception as e:
+            logger.error(f"Warm worker {self.container.short_id} failed to stop: {e}")
+
+    def __str__(self):
+        return f"WarmWorker({self.container.short_id}, {self.key[0]}, jobs={self.jobs})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class WarmPool:
+    """
+    A pool of warm worker containers, keyed by image, workspace and extension.
+
+    A job takes an idle worker for its key, or starts a new one, so concurrent jobs on the
+    same image each get their own worker.
+
+    Args:
+        idle_timeout (float): Seconds after which an idle worker is stopped.
+        max_jobs_per_worker (int): Number of jobs after which a worker is recycled.
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = WARM_POOL_IDLE_TIMEOUT_SECONDS,
+        max_jobs_per_worker: int = WARM_POOL_MAX_JOBS_PER_WORKER,
+    ):
+        self.idle_timeout = idle_timeout
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._idle: Dict[Tuple[str, str, str, str], List[WarmWorker]] = {}
+        self._busy: List[WarmWorker] = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._reaper = threading.Thread(target=self._reap, daemon=True)
+        self._reaper.start()
+
+    @staticmethod
+    def get_key(
+        workspace: "Workspace",
+        metadata: "DockerMetadata",
+        placement: Optional["Placement"] = None,
+    ) -> Tuple[str, str, str, str]:
+        # workers are only shared between jobs placed on the same resources
+        return (
+            str(metadata.docker_image),
+            str(workspace.workspace_path),
+            str(metadata.extension_type),
+            placement.key() if placement is not None else "",
+        )
+
+    def acquire(
+        self,
+        script: Path,
+        workspace: "Workspace",
+        metadata: "DockerMetadata",
+        placement: Optional["Placement"] = None,
+    ) -> WarmWorker:
+        key = self.get_key(workspace, metadata, placement)
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                worker = idle.pop()
+                if worker.is_alive():
+                    self._busy.append(worker)
+                    return worker
+                worker.stop()
+
+        worker = self._start_worker(key, script, workspace, metadata, placement)
+        with self._lock:
+            self._busy.append(worker)
+        return worker
+
+    def release(self, worker: WarmWorker, healthy: bool = True):
+        worker.jobs += 1
+        worker.last_used = time.monotonic()
+        with self._lock:
+            if worker in self._busy:
+                self._busy.remove(worker)
+            if (
+                healthy
+                and not self._closed.is_set()
+                and worker.jobs < self.max_jobs_per_worker
+            ):
+                self._idle.setdefault(worker.key, []).append(worker)
+                return
+        logger.info(f"Recycling {worker}.")
+        worker.stop()
+
+    def execute(
+        self,
+        file_path: Path,
+        workspace: "Workspace",
+        metadata: "DockerMetadata",
+        log_file_path: Optional[Path] = None,
+        echo: bool = False,
+        placement: Optional["Placement"] = None,
+        run: Optional["RunDirectory"] = None,
+    ) -> int:
+        """
+        Run a script to completion on a warm worker.
+
+        Returns:
+            int: The exit code of the script.
+        """
+        with span("worker.acquire", image=metadata.docker_image):
+            worker = self.acquire(file_path, workspace, metadata, placement)
+        healthy = False
+        try:
+            config = get_container_config(
+                file_path, workspace, metadata, metadata.docker_image, run=run
+            )
+            with span("container.exec"):
+                exit_code = worker.exec(
+                    file_path, config, log_file_path=log_file_path, echo=echo
+                )
+            healthy = True
+            return exit_code
+        finally:
+            self.release(worker, healthy=healthy)
+
+    def cancel(self, script: Path):
+        # stop a script on the workers running it
+        with self._lock:
+            workers = [worker for worker in self._busy if worker.script == script]
+        for worker in workers:
+            worker.cancel()
+
+    def shutdown(self):
+        self._closed.set()
+        with self._lock:
+            workers = [worker for idle in self._idle.values() for worker in idle]
+            workers.extend(self._busy)
+            self._idle.clear()
+            self._busy.clear()
+        for worker in workers:
+            worker.stop()
+
+    def _start_worker(
+        self,
+        key: Tuple[str, str, str, str],
+        script: Path,
+        workspace: "Workspace",
+        metadata: "DockerMetadata",
+        placement: Optional["Placement"] = None,
+    ) -> WarmWorker:
+        client = get_docker_client()
+        config = get_container_config(
+            script,
+            workspace,
+            metadata,
+            metadata.docker_image,
+            mount_script=False,
+            placement=placement,
+        )
+        config["command"] = DockerCommand.get_idle_command(DockerPath.SCRIPT.value)
+        container = client.containers.run(
+            detach=True, labels={WARM_POOL_LABEL: "true"}, **config
+        )
+        worker = WarmWorker(key, container)
+        logger.info(f"Started {worker}.")
+        return worker
+
+    def _reap(self):
+        # stop the workers that have been idle for longer than the timeout
+        while not self._closed.wait(min(self.idle_timeout, 30)):
+            now = time.monotonic()
+            expired = []
+            with self._lock:
+                for key, idle in self._idle.items():
+                    for worker in list(idle):
+                        if now - worker.last_used >= self.idle_timeout:
+                            idle.remove(worker)
+                            expired.append(worker)
+            for worker in expired:
+                logger.info(f"Stopping idle {worker}.")
+                worker.stop()
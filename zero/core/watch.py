@@ -0,0 +1,203 @@
+"""
+This module provides the watch mode of `nyun run`: scripts run again as soon as they are edited.
+Files are polled for changes, and a change is acted on once the file was not written for a short
+while, so an editor saving in several writes triggers one run. The run in flight of an edited
+script is cancelled before the script is launched again.
+"""
+
+import threading
+import time
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from zero.core.constants import (
+    WATCH_CANCEL_POLL_SECONDS,
+    WATCH_DEBOUNCE_SECONDS,
+    WATCH_POLL_SECONDS,
+)
+
+logger = getLogger(__name__)
+
+
+class FileWatcher:
+    """
+    Poll files for changes of their size and modification time.
+
+    Args:
+        paths (List[Path]): The files to watch.
+        interval (float): Seconds between polls.
+        debounce (float): Seconds a changed file must stay unchanged before it is reported.
+    """
+
+    def __init__(
+        self,
+        paths: List[Path],
+        interval: float = WATCH_POLL_SECONDS,
+        debounce: float = WATCH_DEBOUNCE_SECONDS,
+    ):
+        self.paths = paths
+        self.interval = interval
+        self.debounce = debounce
+        self._stats = {path: self._stat(path) for path in paths}
+
+    @staticmethod
+    def _stat(path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            # editors may replace a file by renaming a new one over it
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def poll(self) -> Set[Path]:
+        # the files that changed since the last poll
+        changed = set()
+        for path in self.paths:
+            stat = self._stat(path)
+            if stat != self._stats[path]:
+                self._stats[path] = stat
+                changed.add(path)
+        return changed
+
+    def wait(self, stop: threading.Event) -> Set[Path]:
+        """
+        Wait until files changed, and none changed for the debounce time since.
+
+        Args:
+            stop (threading.Event): Stops waiting when set.
+
+        Returns:
+            Set[Path]: The changed files, empty if stopped first.
+        """
+        changed, last_change = set(), 0.0
+        while not stop.wait(self.interval):
+            new_changes = self.poll()
+            if new_changes:
+                changed |= new_changes
+                last_change = time.monotonic()
+            elif changed and time.monotonic() - last_change >= self.debounce:
+                return changed
+        return set()
+
+
+class WatchedRun:
+    # a run of a watched script in its own thread, which can be cancelled
+
+    def __init__(self, script: Path):
+        self.script = script
+        self.cancelled = threading.Event()
+        self.started_at = time.monotonic()
+        self.thread: Optional[threading.Thread] = None
+
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def __str__(self):
+        return f"WatchedRun({self.script}, cancelled={self.cancelled.is_set()})"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ScriptWatch:
+    """
+    Run scripts, and run each of them again whenever it changes.
+
+    Every script runs in its own thread, so an edited script is relaunched while the others
+    keep running. Before a script is relaunched, its run in flight is cancelled: `cancel` is
+    called until the run returns, so a container started meanwhile is stopped as well.
+
+    Args:
+        scripts (List[Path]): The scripts to run and watch.
+        job (Callable[[Path, threading.Event], int]): Runs a script to completion and returns its
+            exit code. The event is set when the run is cancelled.
+        cancel (Callable[[Path], None]): Stops the containers running a script.
+        on_finish (Callable[[WatchedRun, Optional[int], Optional[Exception]], None]): Called when a
+            run returns, with its exit code, or the error it raised.
+        watcher (FileWatcher, optional): The watcher of the scripts.
+    """
+
+    def __init__(
+        self,
+        scripts: List[Path],
+        job: Callable[[Path, threading.Event], int],
+        cancel: Callable[[Path], None],
+        on_finish: Callable[[WatchedRun, Optional[int], Optional[Exception]], None],
+        watcher: Optional[FileWatcher] = None,
+    ):
+        self.scripts = scripts
+        self.job = job
+        self.cancel = cancel
+        self.on_finish = on_finish
+        self.watcher = watcher or FileWatcher(scripts)
+        self._runs: Dict[Path, WatchedRun] = {}
+
+    def launch(self, script: Path) -> WatchedRun:
+        run = WatchedRun(script)
+
+        def target():
+            exit_code, error = None, None
+            try:
+                exit_code = self.job(script, run.cancelled)
+            except Exception as e:
+                logger.error(f"Run of {script} failed: {e}")
+                error = e
+            self.on_finish(run, exit_code, error)
+
+        run.thread = threading.Thread(target=target, daemon=True)
+        self._runs[script] = run
+        run.thread.start()
+        return run
+
+    def stop_run(self, script: Path):
+        # cancel the run in flight of a script, and wait for it to return
+        run = self._runs.get(script)
+        if run is None or not run.is_running():
+            return
+        run.cancelled.set()
+        while run.is_running():
+            try:
+                self.cancel(script)
+            except Exception as e:
+                logger.error(f"Failed to cancel {script}: {e}")
+            run.thread.join(WATCH_CANCEL_POLL_SECONDS)
+
+    def run(
+        self,
+        stop: threading.Event,
+        on_change: Optional[Callable[[Set[Path]], None]] = None,
+    ):
+        """
+        Run every script, then relaunch the scripts that change until `stop` is set. The runs in
+        flight are cancelled when it returns.
+
+        Args:
+            stop (threading.Event): Stops watching when set.
+            on_change (Callable[[Set[Path]], None], optional): Called with the changed scripts
+                before they are relaunched.
+        """
+        try:
+            for script in self.scripts:
+                self.launch(script)
+            while not stop.is_set():
+                changed = self.watcher.wait(stop)
+                if not changed:
+                    continue
+                if on_change is not None:
+                    on_change(changed)
+                for script in self.scripts:
+                    if script in changed:
+                        self.stop_run(script)
+                        # a removed script is launched again once it is back
+                        if script.exists():
+                            self.launch(script)
+        finally:
+            for script in self.scripts:
+                self.stop_run(script)
+
+    def __str__(self):
+        return f"ScriptWatch({', '.join(str(script) for script in self.scripts)})"
+
+    def __repr__(self):
+        return self.__str__()
@@ -1,7 +1,10 @@
 import configparser
+import os
+import threading
 
 from pathlib import Path
-from typing import Dict, AnyStr, Union, Tuple, Optional
+from types import MappingProxyType
+from typing import Dict, AnyStr, Mapping, NamedTuple, Union, Tuple, Optional
 
 from zero.core.constants import WorkspaceExtension, WorkspaceMessage, WorkspaceSpec
 from zero.core.extension import (
@@ -10,13 +13,65 @@ from zero.core.extension import (
     KompressTextGenerationExtension,
     AdaptExtension,
 )
+from zero.core.images import ImageIndex
 from zero.core.logger import init_logger
+from zero.core.timings import span
 
 from logging import getLogger
 
 logger = getLogger(__name__)
 
 
+class WorkspaceConfig(NamedTuple):
+    # the parsed workspace spec; immutable, so one instance is shared by every reader
+    workspace_path: Path
+    custom_data_path: Path
+    log_file_path: Path
+    extensions: Mapping[str, str]
+    # the docker hosts jobs are distributed across, by name (see zero.core.hosts)
+    hosts: Mapping[str, str] = MappingProxyType({})
+
+    @staticmethod
+    def from_config(config: configparser.ConfigParser) -> "WorkspaceConfig":
+        return WorkspaceConfig(
+            workspace_path=Path(config.get(WorkspaceSpec.WORKSPACE, WorkspaceSpec.PATH)),
+            custom_data_path=Path(
+                config.get(WorkspaceSpec.CUSTOM_DATA, WorkspaceSpec.PATH)
+            ),
+            log_file_path=Path(config.get(WorkspaceSpec.LOGS, WorkspaceSpec.PATH)),
+            extensions=MappingProxyType(dict(config[WorkspaceSpec.EXTENSIONS])),
+            hosts=MappingProxyType(
+                dict(config[WorkspaceSpec.HOSTS])
+                if config.has_section(WorkspaceSpec.HOSTS)
+                else {}
+            ),
+        )
+
+    def to_config(self) -> configparser.ConfigParser:
+        config = configparser.ConfigParser()
+        config.update(
+            {
+                WorkspaceSpec.WORKSPACE: {WorkspaceSpec.PATH: str(self.workspace_path)},
+                WorkspaceSpec.CUSTOM_DATA: {
+                    WorkspaceSpec.PATH: str(self.custom_data_path)
+                },
+                WorkspaceSpec.LOGS: {WorkspaceSpec.PATH: str(self.log_file_path)},
+                WorkspaceSpec.EXTENSIONS: dict(self.extensions),
+            }
+        )
+        if self.hosts:
+            config[WorkspaceSpec.HOSTS] = dict(self.hosts)
+        return config
+
+    def get_extensions_list(self):
+        return WorkspaceExtension.get_extensions_list(dict(self.extensions))
+
+
+# parsed workspace specs by spec path, validated against the file's (inode, mtime, size)
+_workspace_specs: Dict[Path, Tuple[Tuple[int, int, int], WorkspaceConfig]] = {}
+_workspace_specs_lock = threading.Lock()
+
+
 class Workspace:
     def __init__(
         self,
@@ -29,6 +84,9 @@ class Workspace:
         self.workspace_path = workspace_path
         self.custom_data_path = custom_data_path
         self.extensions = extensions
+        self._image_index = None
+        # where the custom data is mounted from, when staged (see zero.core.staging)
+        self.staged_data = None
 
         if not self.workspace_path.exists():
             logger.error(
@@ -43,116 +101,72 @@ class Workspace:
             )
 
         if not WorkspaceSpec.get_workspace_spec_path(self.workspace_path).exists():
-            Workspace.create_workspace_spec(
-                self.workspace_path,
-                self.custom_data_path,
-                WorkspaceExtension.get_extensions_dict(self.extensions),
-            )
-            self.workspace_spec = Workspace.load_workspace_spec(self.workspace_path)
+            self.workspace_spec = self.update_workspace_spec()
             logger.info(WorkspaceMessage.WORKSPACE_INITIALIZED)
-        else:
-            try:
-                self.workspace_spec = Workspace.load_workspace_spec(self.workspace_path)
+            return
 
-                if (
-                    # check if the custom data path is different
-                    self.workspace_spec.get(
-                        WorkspaceSpec.CUSTOM_DATA, WorkspaceSpec.PATH
-                    )
-                    != str(self.custom_data_path.absolute().resolve())
-                ):
-                    if overwrite:
-                        self.update_workspace_spec()
-                        logger.info(
-                            WorkspaceMessage.CUSTOM_DATA_PATH_UPDATED.format(
-                                from_path=self.workspace_spec.get(
-                                    WorkspaceSpec.CUSTOM_DATA, WorkspaceSpec.PATH
-                                ),
-                                to_path=self.custom_data_path.absolute().resolve(),
-                            )
-                        )
-                        self.workspace_spec = Workspace.load_workspace_spec(
-                            self.workspace_path
-                        )
-                    else:
-                        raise ValueError(
-                            WorkspaceMessage.CUSTOM_DATA_PATH_ALREADY_EXISTS.format(
-                                current_path=self.workspace_spec.get(
-                                    WorkspaceSpec.CUSTOM_DATA, WorkspaceSpec.PATH
-                                ),
-                                given_path=self.custom_data_path.absolute().resolve(),
-                            )
-                            + " Set overwrite=True to update the workspace spec.",
-                        )
-
-                if (
-                    # check if the extensions are different
-                    WorkspaceExtension.is_extension_different(
-                        dict(self.workspace_spec[WorkspaceSpec.EXTENSIONS]),
-                        WorkspaceExtension.get_extensions_dict(self.extensions),
-                    )
-                ):
-                    if overwrite:
-                        self.update_workspace_spec()
-                        logger.info(
-                            WorkspaceMessage.EXTENSION_UPDATED.format(
-                                from_extensions=", ".join(
-                                    WorkspaceExtension.get_extensions_list(
-                                        dict(
-                                            self.workspace_spec[
-                                                WorkspaceSpec.EXTENSIONS
-                                            ]
-                                        )
-                                    )
-                                ),
-                                to_extensions=", ".join(
-                                    WorkspaceExtension.get_extensions_list(
-                                        self.extensions
-                                    )
-                                ),
-                            )
-                        )
-                        self.workspace_spec = Workspace.load_workspace_spec(
-                            self.workspace_path
-                        )
-                    else:
-                        raise ValueError(
-                            WorkspaceMessage.EXTENSION_ALREADY_EXISTS.format(
-                                current_extensions=", ".join(
-                                    WorkspaceExtension.get_extensions_list(
-                                        dict(
-                                            self.workspace_spec[
-                                                WorkspaceSpec.EXTENSIONS
-                                            ]
-                                        )
-                                    )
-                                ),
-                                given_extensions=", ".join(
-                                    WorkspaceExtension.get_extensions_list(
-                                        self.extensions
-                                    )
-                                ),
-                            )
-                            + " Set overwrite=True to update the workspace spec."
-                        )
-                self.workspace_spec = Workspace.load_workspace_spec(self.workspace_path)
-                logger.info(WorkspaceMessage.WORKSPACE_INITIALIZED)
-
-            except FileNotFoundError:
-                logger.info(
-                    f"{WorkspaceMessage.WORKSPACE_SPEC_FOUND}"
-                    " Creating a new workspace spec."
+        try:
+            self.workspace_spec = Workspace.load_workspace_spec(self.workspace_path)
+        except FileNotFoundError:
+            logger.info(
+                f"{WorkspaceMessage.WORKSPACE_SPEC_FOUND}"
+                " Creating a new workspace spec."
+            )
+            self.workspace_spec = self.update_workspace_spec()
+            return
+
+        custom_data_path = self.custom_data_path.absolute().resolve()
+        current_extensions = ", ".join(self.workspace_spec.get_extensions_list())
+        given_extensions = ", ".join(
+            WorkspaceExtension.get_extensions_list(self.extensions)
+        )
+        # check if the custom data path is different
+        custom_data_changed = self.workspace_spec.custom_data_path != custom_data_path
+        # check if the extensions are different
+        extensions_changed = WorkspaceExtension.is_extension_different(
+            dict(self.workspace_spec.extensions),
+            WorkspaceExtension.get_extensions_dict(self.extensions),
+        )
+
+        if custom_data_changed and not overwrite:
+            error = ValueError(
+                WorkspaceMessage.CUSTOM_DATA_PATH_ALREADY_EXISTS.format(
+                    current_path=self.workspace_spec.custom_data_path,
+                    given_path=custom_data_path,
                 )
-                Workspace.create_workspace_spec(
-                    self.workspace_path,
-                    self.custom_data_path,
-                    WorkspaceExtension.get_extensions_dict(self.extensions),
+                + " Set overwrite=True to update the workspace spec.",
+            )
+            logger.error(error)
+            raise error
+        if extensions_changed and not overwrite:
+            error = ValueError(
+                WorkspaceMessage.EXTENSION_ALREADY_EXISTS.format(
+                    current_extensions=current_extensions,
+                    given_extensions=given_extensions,
                 )
-                self.workspace_spec = Workspace.load_workspace_spec(self.workspace_path)
+                + " Set overwrite=True to update the workspace spec."
+            )
+            logger.error(error)
+            raise error
 
-            except Exception as e:
-                logger.error(e)
-                raise e
+        if custom_data_changed or extensions_changed:
+            previous_spec = self.workspace_spec
+            self.workspace_spec = self.update_workspace_spec()
+            if custom_data_changed:
+                logger.info(
+                    WorkspaceMessage.CUSTOM_DATA_PATH_UPDATED.format(
+                        from_path=previous_spec.custom_data_path,
+                        to_path=custom_data_path,
+                    )
+                )
+            if extensions_changed:
+                logger.info(
+                    WorkspaceMessage.EXTENSION_UPDATED.format(
+                        from_extensions=current_extensions,
+                        to_extensions=given_extensions,
+                    )
+                )
+        logger.info(WorkspaceMessage.WORKSPACE_INITIALIZED)
 
     @staticmethod
     def init_logger(workspace_path: Path):
@@ -163,83 +177,151 @@ class Workspace:
         workspace_path: Path,
         custom_data_path: Path,
         extensions: Dict[WorkspaceExtension, bool],
-    ):
-        config = configparser.ConfigParser()
-        config.update(
-            {
-                WorkspaceSpec.WORKSPACE: {
-                    WorkspaceSpec.PATH: str(workspace_path.absolute().resolve())
-                },
-                WorkspaceSpec.CUSTOM_DATA: {
-                    WorkspaceSpec.PATH: str(custom_data_path.absolute().resolve())
-                },
-                WorkspaceSpec.LOGS: {
-                    WorkspaceSpec.PATH: str(
-                        WorkspaceSpec.get_log_file_path(workspace_path)
-                    )
-                },
-                WorkspaceSpec.EXTENSIONS: extensions,
-            }
+        hosts: Optional[Mapping[str, str]] = None,
+    ) -> WorkspaceConfig:
+        # the hosts of an existing spec are kept, unless new ones are given
+        if hosts is None:
+            try:
+                hosts = Workspace.load_workspace_spec(workspace_path).hosts
+            except (FileNotFoundError, configparser.Error):
+                hosts = {}
+        workspace_spec = WorkspaceConfig(
+            workspace_path=workspace_path.absolute().resolve(),
+            custom_data_path=custom_data_path.absolute().resolve(),
+            log_file_path=WorkspaceSpec.get_log_file_path(workspace_path),
+            extensions=MappingProxyType(
+                {str(key): str(value) for key, value in extensions.items()}
+            ),
+            hosts=MappingProxyType(dict(hosts)),
         )
 
         workspace_spec_dir = WorkspaceSpec.get_workspace_spec_dir(workspace_path)
         workspace_spec_dir.mkdir(parents=True, exist_ok=True)
 
+        # write a read-only copy and rename it over the spec, so readers never see a partial spec
         workspace_spec_path = WorkspaceSpec.get_workspace_spec_path(workspace_path)
-        with open(workspace_spec_path, "w") as configfile:
-            config.write(configfile)
-        workspace_spec_path.chmod(0o444)
-
-    def update_workspace_spec(self):
-        # unlock the workspace spec file and update it
-        workspace_spec_path = WorkspaceSpec.get_workspace_spec_path(self.workspace_path)
-        workspace_spec_path.chmod(0o644)
-        Workspace.create_workspace_spec(
+        tmp_path = workspace_spec_path.with_name(
+            f".{workspace_spec_path.name}.{os.getpid()}.tmp"
+        )
+        try:
+            with open(tmp_path, "w") as configfile:
+                workspace_spec.to_config().write(configfile)
+            tmp_path.chmod(0o444)
+            os.replace(tmp_path, workspace_spec_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        with _workspace_specs_lock:
+            _workspace_specs[workspace_spec_path.absolute()] = (
+                Workspace._get_spec_version(workspace_spec_path),
+                workspace_spec,
+            )
+        Workspace.init_logger(workspace_spec.log_file_path)
+        return workspace_spec
+
+    def update_workspace_spec(self) -> WorkspaceConfig:
+        return Workspace.create_workspace_spec(
             self.workspace_path,
             self.custom_data_path,
             WorkspaceExtension.get_extensions_dict(self.extensions),
         )
 
     @staticmethod
-    def load_workspace_spec(workspace_path: Path):
+    def _get_spec_version(workspace_spec_path: Path) -> Tuple[int, int, int]:
+        # the spec is only ever replaced by a rename, which changes the inode
+        stat = workspace_spec_path.stat()
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def load_workspace_spec(workspace_path: Path) -> WorkspaceConfig:
+        """
+        Load the workspace spec, parsing the file only if it changed since it was last loaded.
+
+        Raises:
+            FileNotFoundError: If the workspace has no spec.
+        """
         workspace_spec_path = WorkspaceSpec.get_workspace_spec_path(workspace_path)
-        config = configparser.ConfigParser()
-        config.read(workspace_spec_path)
+        version = Workspace._get_spec_version(workspace_spec_path)
+        with _workspace_specs_lock:
+            cached = _workspace_specs.get(workspace_spec_path.absolute())
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        with span("workspace.spec.load"):
+            config = configparser.ConfigParser()
+            with open(workspace_spec_path, "r") as configfile:
+                config.read_file(configfile)
+            workspace_spec = WorkspaceConfig.from_config(config)
+        with _workspace_specs_lock:
+            _workspace_specs[workspace_spec_path.absolute()] = (version, workspace_spec)
 
-        workspace_log_file_path = Path(
-            config.get(WorkspaceSpec.LOGS, WorkspaceSpec.PATH)
-        )
         # initialize the logger
-        Workspace.init_logger(workspace_log_file_path)
-        return config
+        Workspace.init_logger(workspace_spec.log_file_path)
+        return workspace_spec
 
     def __str__(self):
         return (
             f"Workspace: {self.workspace_path}\n"
             f"Custom Data: {self.custom_data_path}\n"
-            f"Extension: {dict(self.workspace_spec[WorkspaceSpec.EXTENSIONS])}"
+            f"Extension: {dict(self.workspace_spec.extensions)}"
         )
 
     def __repr__(self):
         return self.__str__()
 
-    def init_extension(self) -> BaseExtension:
-        extensions = dict(self.workspace_spec[WorkspaceSpec.EXTENSIONS])
-        ext_obj = BaseExtension()
-        for key, value in extensions.items():
-            if value == "True":
-                if WorkspaceExtension(key) == WorkspaceExtension.VISION:
-                    KompressVisionExtension()
-                elif WorkspaceExtension(key) == WorkspaceExtension.TEXT_GENERATION:
-                    KompressTextGenerationExtension()
-                elif WorkspaceExtension(key) == WorkspaceExtension.ADAPT:
-                    AdaptExtension()
-        ext_obj.install()
+    def init_extension(self, install: bool = True) -> BaseExtension:
+        ext_obj = get_extension(dict(self.workspace_spec.extensions))
+        if install:
+            ext_obj.install(index=self.image_index)
         return ext_obj
 
+    @property
+    def image_index(self) -> ImageIndex:
+        if self._image_index is None:
+            self._image_index = ImageIndex.for_workspace(self.workspace_path)
+        return self._image_index
+
     def get_workspace_env_file(self) -> Optional[Path]:
         return WorkspaceSpec.get_env_file_path(self.workspace_path)
 
+    def get_custom_data_mount(self, target: str) -> "Mount":
+        # bind mount the custom data directory, unless it was staged elsewhere
+        if self.staged_data is not None:
+            return self.staged_data.get_mount(target)
+        from docker.types import Mount
+
+        return Mount(
+            source=str(self.custom_data_path),
+            target=target,
+            type="bind",
+            read_only=True,
+        )
+
+
+def get_extension(extensions: Dict[str, str]) -> BaseExtension:
+    """
+    Get the extension with the registry and docker images of the enabled extensions.
+
+    Args:
+        extensions (Dict[str, str]): The extensions section of a workspace spec, mapping each extension to "True" or "False".
+
+    Returns:
+        BaseExtension: The combined extension.
+    """
+    extension_types = {
+        WorkspaceExtension.VISION: KompressVisionExtension,
+        WorkspaceExtension.TEXT_GENERATION: KompressTextGenerationExtension,
+        WorkspaceExtension.ADAPT: AdaptExtension,
+    }
+    return BaseExtension(
+        *[
+            extension_types[WorkspaceExtension(key)]()
+            for key, value in extensions.items()
+            if value == "True"
+        ]
+    )
+
 
 def get_workspace_and_custom_data_paths(
     workspace: Union[Path, AnyStr, None], custom_data: Union[Path, AnyStr, None]
@@ -263,7 +345,7 @@ def get_workspace_and_custom_data_paths(
     if custom_data is None:
         if WorkspaceSpec.get_workspace_spec_path(workspace).exists():
             config = Workspace.load_workspace_spec(workspace)
-            custom_data = config.get(WorkspaceSpec.CUSTOM_DATA, WorkspaceSpec.PATH)
+            custom_data = config.custom_data_path
         else:
             custom_data = workspace / "custom_data"
 
@@ -272,8 +354,6 @@ def get_workspace_and_custom_data_paths(
     custom_data_path.mkdir(parents=True, exist_ok=True)
 
     if config:
-        extensions = WorkspaceExtension.get_extensions_list(
-            dict(config[WorkspaceSpec.EXTENSIONS])
-        )
+        extensions = config.get_extensions_list()
 
     return (workspace_path, custom_data_path, extensions)